@@ -0,0 +1,161 @@
+# Finds the maximum sustained request rate of the map API.
+#
+# Concurrency is raised step by step; a step is "sustained" while the error
+# rate stays under --max-error-rate and p99 latency under --max-p99-ms. The
+# best sustained step is reported as the API's max RPS.
+#
+# Typical before/after comparison (provider latency simulated by the stub):
+#
+#   python benchmarks/provider_stub.py --latency-ms 80 &
+#   NOMINATIM_URL=http://127.0.0.1:9100/search AZURE_MAPS_URL=http://127.0.0.1:9100 \
+#   OPENWEATHER_URL=http://127.0.0.1:9100 AZURE_MAPS_KEY=stub OPENWEATHER_API_KEY=stub \
+#       uvicorn app:app --app-dir client/src/components/map --port 8000 &
+#   python benchmarks/async_rps.py --label async --output benchmarks/results/async.json
+#   (repeat on the previous commit with --label sync)
+#   python benchmarks/async_rps.py --compare benchmarks/results/sync.json benchmarks/results/async.json
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import subprocess
+import time
+
+import httpx
+
+SCENARIOS = {
+    # Unique location names so every request misses the provider caches
+    "weather": lambda n: ("GET", "/weather", {"params": {"location": f"bench-town-{n}"}}),
+    "all-data": lambda n: ("GET", "/all-data", {"params": {"location": f"bench-town-{n}"}}),
+    "route": lambda n: ("GET", "/route/optimized", {"params": {"start": f"bench-a-{n}", "end": f"bench-b-{n}"}}),
+    "dynamic-route": lambda n: ("POST", "/route/optimized", {"json": {
+        "origin": f"bench-a-{n}", "destination": f"bench-b-{n}",
+        "intermediate_post_offices": [f"bench-c-{n}"]
+    }}),
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_step(client, scenario, concurrency, duration, counter):
+    """Keeps `concurrency` requests in flight for `duration` seconds."""
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            method, path, kwargs = SCENARIOS[scenario](next(counter))
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                failed = response.status_code >= 400 or "error" in response.json()
+            except Exception:
+                failed = True
+            latencies.append((time.perf_counter() - started) * 1000)
+            if failed:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    total = len(latencies)
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 1.0,
+        "rps": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99), 1) if latencies else None,
+    }
+
+
+async def find_max_rps(base_url, scenario, steps, duration, max_error_rate, max_p99_ms):
+    counter = itertools.count(int(time.time()))
+    limits = httpx.Limits(max_connections=max(steps), max_keepalive_connections=max(steps))
+    results = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=60.0, limits=limits) as client:
+        for concurrency in steps:
+            step = await run_step(client, scenario, concurrency, duration, counter)
+            step["sustained"] = step["error_rate"] <= max_error_rate and (step["p99_ms"] or 0) <= max_p99_ms
+            results.append(step)
+            print(f"  c={concurrency:<4} rps={step['rps']:<8} p50={step['p50_ms']} ms "
+                  f"p99={step['p99_ms']} ms errors={step['error_rate']:.2%}"
+                  f"{'' if step['sustained'] else '  (not sustained)'}")
+            if not step["sustained"]:
+                break
+    sustained = [s for s in results if s["sustained"]]
+    return results, max((s["rps"] for s in sustained), default=0.0)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print(f"{'scenario':<15}{before['label']:>14}{after['label']:>14}{'change':>10}")
+    for scenario, result in after["scenarios"].items():
+        old = before["scenarios"].get(scenario)
+        if old is None:
+            continue
+        old_rps, new_rps = old["max_sustained_rps"], result["max_sustained_rps"]
+        change = f"{new_rps / old_rps:.2f}x" if old_rps else "n/a"
+        print(f"{scenario:<15}{old_rps:>14}{new_rps:>14}{change:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Max sustained RPS benchmark for the map API")
+    parser.add_argument("--base-url", default=os.getenv("MAP_API_URL", "http://127.0.0.1:8000"))
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run (repeatable, default: weather and route)")
+    parser.add_argument("--steps", default="1,2,4,8,16,32,64,128,256",
+                        help="Comma separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency step")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--max-p99-ms", type=float, default=2000.0)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="Compare two result files instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    steps = [int(s) for s in args.steps.split(",") if s.strip()]
+    report = {"label": args.label, "commit": git_commit(), "base_url": args.base_url,
+              "duration_per_step": args.duration, "scenarios": {}}
+    for scenario in args.scenario or ["weather", "route"]:
+        print(f"Scenario {scenario}:")
+        results, max_rps = asyncio.run(find_max_rps(args.base_url, scenario, steps, args.duration,
+                                                    args.max_error_rate, args.max_p99_ms))
+        report["scenarios"][scenario] = {"max_sustained_rps": max_rps, "steps": results}
+        print(f"  max sustained rps: {max_rps}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+# Compares the schema-based binary event encoding (event_codec) with JSON
+# for the traffic flow, weather and incident events published to Kafka:
+# encoded size, and encode/decode throughput.
+#
+#   python benchmarks/event_codec_bench.py --events 50000
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "client", "src", "components", "map"))
+
+from event_codec import decode_event, encode_event  # noqa: E402
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def traffic_flow_event(rng):
+    free_flow = rng.choice([40, 60, 80, 100])
+    current = round(free_flow * rng.uniform(0.2, 1.0), 1)
+    ratio = current / free_flow
+    return {
+        "location": {"lat": round(rng.uniform(8, 35), 6), "lon": round(rng.uniform(68, 97), 6)},
+        "current_speed_kmh": current,
+        "free_flow_speed_kmh": free_flow,
+        "congestion_level": "low" if ratio >= 0.9 else "moderate" if ratio >= 0.6 else "high",
+        "confidence": round(rng.uniform(0.5, 1.0), 2),
+        "road_closure": rng.random() < 0.02
+    }
+
+
+def weather_event(rng):
+    weather = rng.choice(["Clear", "Clouds", "Rain", "Haze", "Thunderstorm"])
+    return {
+        "lat": round(rng.uniform(8, 35), 4), "lon": round(rng.uniform(68, 97), 4),
+        "weather": weather,
+        "temperature": round(rng.uniform(10, 42), 2),
+        "windSpeed": round(rng.uniform(0, 40), 1),
+        "windDirection": rng.choice(["N", "NE", "E", "SE", "S", "SW", "W", "NW"]),
+        "risk": "high" if weather in ("Rain", "Thunderstorm") else "low"
+    }
+
+
+def incident_event(rng):
+    lat, lon = rng.uniform(8, 35), rng.uniform(68, 97)
+    line = [[round(lon + i * 0.002, 6), round(lat + i * 0.001, 6)] for i in range(rng.randint(2, 12))]
+    kind = rng.choice(["Accident", "Construction", "Congestion"])
+    return {
+        "action": "upsert",
+        "incident": {
+            "id": f"inc-{rng.randrange(10 ** 9)}",
+            "location": line,
+            "type": kind,
+            "title": f"{kind} on NH{rng.randint(1, 99)}",
+            "description": f"{kind} reported near km {rng.randint(1, 500)}; expect delays",
+            "start_time": "2025-05-01T08:30:00Z",
+            "end_time": None,
+            "severity": rng.choice(["Minor", "Moderate", "Major"]),
+            "isRoadClosed": rng.random() < 0.1,
+            "isTrafficJam": rng.random() < 0.5,
+            "delay": rng.randint(0, 1800),
+            "end_point": line[-1]
+        }
+    }
+
+
+GENERATORS = {"traffic_flow": traffic_flow_event, "weather": weather_event, "traffic_incidents": incident_event}
+
+
+def timed(fn, items):
+    started = time.perf_counter()
+    for item in items:
+        fn(item)
+    return time.perf_counter() - started
+
+
+def run(name, events):
+    codecs = {"json": (lambda e: json.dumps(e).encode("utf-8"), json.loads)}
+    if orjson is not None:
+        codecs["orjson"] = (orjson.dumps, orjson.loads)
+    codecs["binary"] = (lambda e: encode_event(name, e), decode_event)
+
+    results = {}
+    for codec, (encode, decode) in codecs.items():
+        payloads = [encode(e) for e in events]
+        encode_seconds = timed(encode, events)
+        decode_seconds = timed(decode, payloads)
+        results[codec] = {
+            "avg_bytes": sum(len(p) for p in payloads) / len(payloads),
+            "encode_per_second": len(events) / encode_seconds,
+            "decode_per_second": len(events) / decode_seconds,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Binary event encoding vs JSON")
+    parser.add_argument("--events", type=int, default=20000, help="Events per type")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'event':<18}{'codec':<8}{'avg bytes':>10}{'size vs json':>14}{'encode/s':>12}{'decode/s':>12}")
+    for name, generate in GENERATORS.items():
+        events = [generate(rng) for _ in range(args.events)]
+        # Round trip check before timing anything
+        for event in events[:100]:
+            decoded = decode_event(encode_event(name, event))
+            assert decoded.keys() == event.keys(), (decoded, event)
+        results = run(name, events)
+        baseline = results["json"]["avg_bytes"]
+        for codec, r in results.items():
+            print(f"{name:<18}{codec:<8}{r['avg_bytes']:>10.1f}{r['avg_bytes'] / baseline:>13.0%} "
+                  f"{r['encode_per_second']:>12,.0f}{r['decode_per_second']:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()
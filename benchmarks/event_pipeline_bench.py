@@ -0,0 +1,109 @@
+# Throughput of the event pipeline without a broker: producer.publish_event
+# -> in-memory partitioned log (EVENT_TRANSPORT=memory) -> consumer thread
+# -> live_updates.apply_event into the routing caches. The producer and
+# consumer modules run unchanged; only the transport is swapped. JSON and
+# binary encoding are measured in separate processes over the same events.
+#
+#   python benchmarks/event_pipeline_bench.py --events 50000 --routes 500
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "client", "src", "components", "map"))
+
+
+def create_routes_db(path, routes, rng):
+    """Active routes between random points in India, so events mark some of them dirty."""
+    connection = sqlite3.connect(path)
+    connection.execute("CREATE TABLE routes (id INTEGER PRIMARY KEY, parcel_id INTEGER, route_path TEXT, "
+                       "transport_mode TEXT, duration TEXT, distance TEXT, active BOOLEAN)")
+    for i in range(routes):
+        lat, lon = rng.uniform(8, 35), rng.uniform(68, 97)
+        path_points = [[lat + step * 0.05, lon + step * 0.05] for step in range(20)]
+        connection.execute("INSERT INTO routes VALUES (?, ?, ?, 'road', '2h', '100km', 1)",
+                           (i + 1, i + 1, json.dumps(path_points)))
+    connection.commit()
+    connection.close()
+
+
+def run_pass(args):
+    """Publishes the events with one encoding and waits until the consumer has applied them all."""
+    workdir = tempfile.mkdtemp(prefix="event-bench-")
+    rng = random.Random(args.seed)
+    create_routes_db(os.path.join(workdir, "routes.db"), args.routes, rng)
+    os.environ.update({
+        "EVENT_TRANSPORT": "memory",
+        "EVENT_MEMORY_PARTITIONS": str(args.partitions),
+        "KAFKA_CONSUMER_ENABLED": "true",
+        "ROUTES_DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'routes.db')}",
+    })
+
+    import consumer
+    import producer
+    from event_codec import encode_event
+    from event_transport import get_broker
+    from event_codec_bench import GENERATORS
+    from live_updates import dirty_routes
+
+    kinds = list(GENERATORS)
+    events = [(kind, GENERATORS[kind](rng)) for kind in (rng.choice(kinds) for _ in range(args.events))]
+    binary = args.encoding == "binary"
+    log_bytes = sum(len(encode_event(kind, event) if binary else json.dumps(event).encode("utf-8"))
+                    for kind, event in events)
+
+    consumer.start_event_consumer()
+    broker = get_broker()
+    while not broker.group_size(consumer.KAFKA_CONSUMER_GROUP):
+        time.sleep(0.01)
+
+    started = time.perf_counter()
+    for n, (kind, event) in enumerate(events):
+        producer.publish_event(consumer.KAFKA_TOPICS[kind], str(n), event, schema=kind if binary else None)
+    published = time.perf_counter() - started
+    while consumer.get_consumer_status()["events"] < len(events):
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - started
+
+    consumer.stop_event_consumer()
+    producer.close_producer()
+    shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps({"publish_rate": len(events) / published, "end_to_end_rate": len(events) / elapsed,
+                      "log_mb": log_bytes / 1e6, "dirty_routes": len(dirty_routes)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-memory event pipeline throughput")
+    parser.add_argument("--events", type=int, default=30000, help="Events per encoding")
+    parser.add_argument("--routes", type=int, default=200, help="Active routes checked for dirty marking")
+    parser.add_argument("--partitions", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--encoding", choices=("json", "binary"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.encoding:
+        run_pass(args)
+        return
+
+    # Each encoding runs in a fresh process, so neither pass starts with caches,
+    # incident index or dirty routes warmed up by the other
+    print(f"{'encoding':<10}{'publish/s':>12}{'end-to-end/s':>14}{'log MB':>10}{'dirty routes':>14}")
+    for encoding in ("json", "binary"):
+        output = subprocess.run([sys.executable, __file__, "--encoding", encoding, "--events", str(args.events),
+                                 "--routes", str(args.routes), "--partitions", str(args.partitions),
+                                 "--seed", str(args.seed)], check=True, capture_output=True, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{encoding:<10}{result['publish_rate']:>12,.0f}{result['end_to_end_rate']:>14,.0f}"
+              f"{result['log_mb']:>10.2f}{result['dirty_routes']:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+# Load test for the map API and the mail routing API with a realistic
+# request mix.
+#
+# Each mix is a weighted set of endpoints. Workers draw requests from the
+# mix and either run flat out (--concurrency) or follow a fixed arrival rate
+# (--rate); with a fixed rate, latency is measured from each request's
+# scheduled start, so a stalled server is not hidden by workers waiting on it.
+# Throughput, p50/p95/p99 and error rates are reported per endpoint and for
+# the whole run, and the results are stored per commit under
+# benchmarks/results/ so runs can be compared across commits.
+#
+# Start everything locally (provider stub, map API, mail routing API on a
+# throwaway SQLite database) and run the full mix:
+#
+#   python benchmarks/load_test.py --start --mix mixed --duration 60 --stub-latency-ms 80
+#
+# Against apps that are already running:
+#
+#   python benchmarks/load_test.py --map-url http://127.0.0.1:8000 --backend-url http://127.0.0.1:5000
+#
+# Fail (exit code 1) when p99 or throughput regress by more than 10%:
+#
+#   python benchmarks/load_test.py --start --baseline benchmarks/results/<commit>-mixed.json
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from async_rps import git_commit, percentile
+import provider_stub
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAP_APP_DIR = os.path.join(REPO_ROOT, "client", "src", "components", "map")
+BACKEND_APP_DIR = os.path.join(REPO_ROOT, "python_backend")
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+# Endpoint -> weight. Weights follow the expected production traffic: parcel
+# tracking is the public hot path, route planning the expensive one.
+MIXES = {
+    "map": {"route": 3, "all-data": 7},
+    "backend": {"parcels": 3, "track": 5, "unread": 2},
+    "mixed": {"route": 2, "all-data": 3, "parcels": 1, "track": 3, "unread": 1},
+}
+BACKEND_ENDPOINTS = ("parcels", "track", "unread")
+
+
+class Fixtures:
+    """Data the requests draw from: place names, tracking numbers and a sender's token."""
+
+    def __init__(self, locations):
+        self.locations = [f"load-town-{i}" for i in range(locations)]
+        self.tracking_numbers = []
+        self.token = None
+
+    def location(self):
+        # Skewed towards a few popular places, like real traffic
+        return self.locations[min(int(random.expovariate(8 / len(self.locations))), len(self.locations) - 1)]
+
+
+def build_request(endpoint, fixtures):
+    """Returns (app, method, path, request kwargs) for one request to `endpoint`."""
+    auth = {"Authorization": f"Bearer {fixtures.token}"}
+    if endpoint == "route":
+        return "map", "GET", "/route/optimized", {"params": {"start": fixtures.location(),
+                                                             "end": fixtures.location()}}
+    if endpoint == "all-data":
+        return "map", "GET", "/all-data", {"params": {"location": fixtures.location()}}
+    if endpoint == "parcels":
+        return "backend", "GET", "/api/parcels", {"headers": auth}
+    if endpoint == "track":
+        return "backend", "GET", f"/api/parcels/track/{random.choice(fixtures.tracking_numbers)}", {}
+    if endpoint == "unread":
+        return "backend", "GET", "/api/notifications/unread", {"headers": auth}
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+async def seed_backend(client, fixtures, parcels, notifications):
+    """Registers a sender and a staff user, then creates parcels and unread notifications."""
+    suffix = f"{int(time.time())}{random.randint(0, 9999)}"
+    tokens = {}
+    users = {}
+    for role in ("sender", "staff"):
+        username = f"load-{role}-{suffix}"
+        response = await client.post("/api/register", json={
+            "username": username, "email": f"{username}@example.com", "role": role,
+            "full_name": f"Load Test {role.title()}", "password": "load-test-password"
+        })
+        response.raise_for_status()
+        users[role] = response.json()["id"]
+        response = await client.post("/token", data={"username": username, "password": "load-test-password"})
+        response.raise_for_status()
+        tokens[role] = response.json()["access_token"]
+    fixtures.token = tokens["sender"]
+
+    sender = {"Authorization": f"Bearer {tokens['sender']}"}
+    staff = {"Authorization": f"Bearer {tokens['staff']}"}
+    parcel_ids = []
+    for i in range(parcels):
+        response = await client.post("/api/parcels", headers=sender, json={
+            "tracking_number": "auto", "origin": fixtures.locations[i % len(fixtures.locations)],
+            "destination": fixtures.locations[-1 - i % len(fixtures.locations)],
+            "transport_mode": random.choice(["road", "rail", "air"]), "weight": "1.2kg",
+            "user_id": users["sender"]
+        })
+        response.raise_for_status()
+        parcel = response.json()
+        parcel_ids.append(parcel["id"])
+        fixtures.tracking_numbers.append(parcel["tracking_number"])
+    for i in range(notifications):
+        response = await client.post("/api/notifications", headers=staff, json={
+            "user_id": users["sender"], "parcel_id": parcel_ids[i % len(parcel_ids)],
+            "type": "status_change", "message": f"Load test notification {i}", "channel": "push"
+        })
+        response.raise_for_status()
+
+
+async def run_load(clients, fixtures, mix, duration, concurrency, rate, warmup):
+    """Drives the mix for `duration` seconds; returns {endpoint: [(latency_ms, failed), ...]}."""
+    endpoints = list(mix)
+    weights = [mix[e] for e in endpoints]
+    samples = {endpoint: [] for endpoint in endpoints}
+    sequence = itertools.count()
+    started = time.perf_counter()
+    measure_from = started + warmup
+    deadline = measure_from + duration
+
+    async def worker():
+        while True:
+            n = next(sequence)
+            scheduled = started + n / rate if rate else time.perf_counter()
+            if scheduled >= deadline:
+                return
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            endpoint = random.choices(endpoints, weights)[0]
+            app, method, path, kwargs = build_request(endpoint, fixtures)
+            try:
+                response = await clients[app].request(method, path, **kwargs)
+                failed = response.status_code >= 400
+                if not failed and app == "map":
+                    body = response.json()
+                    failed = isinstance(body, dict) and "error" in body
+            except Exception:
+                failed = True
+            if scheduled >= measure_from:
+                samples[endpoint].append(((time.perf_counter() - scheduled) * 1000, failed))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples
+
+
+def summarize(samples, duration):
+    latencies = [latency for latency, _ in samples]
+    errors = sum(1 for _, failed in samples if failed)
+    total = len(samples)
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else None,
+        "rps": round(total / duration, 1),
+        "p50_ms": round(percentile(latencies, 50), 1) if latencies else None,
+        "p95_ms": round(percentile(latencies, 95), 1) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99), 1) if latencies else None,
+    }
+
+
+def print_summary(report):
+    print(f"{'endpoint':<12}{'requests':>10}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>10}")
+    rows = list(report["endpoints"].items()) + [("total", report["total"])]
+    for name, s in rows:
+        error_rate = f"{s['error_rate']:.2%}" if s["error_rate"] is not None else "-"
+        print(f"{name:<12}{s['requests']:>10}{s['rps']:>10}{str(s['p50_ms']):>10}"
+              f"{str(s['p95_ms']):>10}{str(s['p99_ms']):>10}{error_rate:>10}")
+
+
+def compare(baseline_path, report, tolerance):
+    """Prints per-endpoint changes against a baseline; returns the regressions."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline.get('commit')} ({baseline.get('label')}):")
+    changed = [key for key, value in report["config"].items() if baseline.get("config", {}).get(key) != value]
+    if changed:
+        print(f"Warning: runs differ in {', '.join(changed)}; the comparison may not be meaningful")
+    # With a fixed arrival rate, throughput is set by --rate rather than by the server
+    check_rps = not report["config"]["rate"] and not baseline.get("config", {}).get("rate")
+    print(f"{'endpoint':<12}{'rps':>18}{'p99 ms':>20}{'error rate':>22}")
+    regressions = []
+    rows = list(report["endpoints"].items()) + [("total", report["total"])]
+    for name, new in rows:
+        old = baseline["endpoints"].get(name) if name != "total" else baseline.get("total")
+        if not old or not old["requests"] or not new["requests"]:
+            continue
+        flags = []
+        if check_rps and old["rps"] and new["rps"] < old["rps"] * (1 - tolerance):
+            flags.append("rps")
+        if old["p99_ms"] and new["p99_ms"] > old["p99_ms"] * (1 + tolerance):
+            flags.append("p99")
+        if new["error_rate"] > old["error_rate"] + 0.01:
+            flags.append("errors")
+        if flags:
+            regressions.append((name, flags))
+        print(f"{name:<12}{old['rps']:>8} -> {new['rps']:<8}{old['p99_ms']:>9} -> {new['p99_ms']:<9}"
+              f"{old['error_rate']:>10.2%} -> {new['error_rate']:<8.2%}{'  REGRESSED: ' + ', '.join(flags) if flags else ''}")
+    return regressions
+
+
+def wait_until_ready(url, process, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process serving {url} exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{url}/metrics", timeout=2.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} did not become ready within {timeout:.0f}s")
+
+
+def start_apps(args, workdir):
+    """Starts the provider stub, the map API and the mail routing API; returns the app processes."""
+    provider_stub.serve(port=args.stub_port, latency_ms=args.stub_latency_ms,
+                        jitter_ms=args.stub_jitter_ms, error_rate=args.stub_error_rate)
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    print(f"Provider stub on {stub_url} ({args.stub_latency_ms}±{args.stub_jitter_ms} ms)")
+
+    env = dict(os.environ, NOMINATIM_URL=f"{stub_url}/search", AZURE_MAPS_URL=stub_url, OPENWEATHER_URL=stub_url,
+               AZURE_MAPS_KEY="stub", OPENWEATHER_API_KEY="stub", CACHE_WARMER_ENABLED="false",
+               RATE_LIMIT_ENABLED="false",  # all load comes from one client
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'mail_routing.db')}")
+    # The mail routing API serves the frontend from ../client/dist relative to its working directory
+    os.makedirs(os.path.join(workdir, "client", "dist", "assets"), exist_ok=True)
+    os.makedirs(os.path.join(workdir, "run"), exist_ok=True)
+
+    logs = open(os.path.join(workdir, "apps.log"), "w")
+    processes = []
+    for app_dir, app, url, cwd in ((MAP_APP_DIR, "app:app", args.map_url, MAP_APP_DIR),
+                                   (BACKEND_APP_DIR, "main:app", args.backend_url, os.path.join(workdir, "run"))):
+        port = url.rsplit(":", 1)[1].rstrip("/")
+        command = [sys.executable, "-m", "uvicorn", app, "--app-dir", app_dir, "--port", port,
+                   "--log-level", "warning", "--workers", str(args.workers)]
+        processes.append(subprocess.Popen(command, cwd=cwd, env=env, stdout=logs, stderr=subprocess.STDOUT))
+    for process, url in zip(processes, (args.map_url, args.backend_url)):
+        wait_until_ready(url, process)
+        print(f"Started {url}")
+    return processes
+
+
+async def run(args, mix):
+    fixtures = Fixtures(args.locations)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.map_url, timeout=60.0, limits=limits) as map_client, \
+            httpx.AsyncClient(base_url=args.backend_url, timeout=60.0, limits=limits) as backend_client:
+        clients = {"map": map_client, "backend": backend_client}
+        if any(endpoint in BACKEND_ENDPOINTS for endpoint in mix):
+            print(f"Seeding {args.parcels} parcels and {args.notifications} notifications")
+            await seed_backend(backend_client, fixtures, args.parcels, args.notifications)
+        return await run_load(clients, fixtures, mix, args.duration, args.concurrency, args.rate, args.warmup)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the map and mail routing APIs")
+    parser.add_argument("--mix", default="mixed", choices=sorted(MIXES))
+    parser.add_argument("--map-url", default=os.getenv("MAP_API_URL", "http://127.0.0.1:8000"))
+    parser.add_argument("--backend-url", default=os.getenv("MAIL_ROUTING_API_URL", "http://127.0.0.1:5000"))
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds of load before measuring")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent workers")
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="Target requests per second (default: as fast as the workers allow)")
+    parser.add_argument("--locations", type=int, default=200, help="Distinct place names in map requests")
+    parser.add_argument("--parcels", type=int, default=200, help="Parcels created before the run")
+    parser.add_argument("--notifications", type=int, default=50, help="Unread notifications created before the run")
+    parser.add_argument("--start", action="store_true",
+                        help="Start the provider stub and both apps locally for the run")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers per app with --start")
+    parser.add_argument("--stub-port", type=int, default=9100)
+    parser.add_argument("--stub-latency-ms", type=float, default=50.0)
+    parser.add_argument("--stub-jitter-ms", type=float, default=10.0)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--label", help="Result label (default: the mix name)")
+    parser.add_argument("--output", help="Result file (default: benchmarks/results/<commit>-<label>.json)")
+    parser.add_argument("--baseline", help="Result file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    mix = MIXES[args.mix]
+    label = args.label or args.mix
+    workdir = tempfile.mkdtemp(prefix="load-test-") if args.start else None
+    processes = start_apps(args, workdir) if args.start else []
+    try:
+        print(f"Running mix '{args.mix}' for {args.duration:.0f}s (+{args.warmup:.0f}s warm-up), "
+              f"concurrency {args.concurrency}" + (f", {args.rate:.0f} req/s" if args.rate else ""))
+        samples = asyncio.run(run(args, mix))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=30)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    commit = git_commit()
+    report = {
+        "label": label, "commit": commit, "mix": mix, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {key: getattr(args, key) for key in ("duration", "warmup", "concurrency", "rate", "locations",
+                                                       "parcels", "notifications", "start", "workers",
+                                                       "stub_latency_ms", "stub_jitter_ms", "stub_error_rate")},
+        "endpoints": {endpoint: summarize(s, args.duration) for endpoint, s in samples.items()},
+        "total": summarize([x for s in samples.values() for x in s], args.duration),
+    }
+    print_summary(report)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{commit or 'unknown'}-{label}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        regressions = compare(args.baseline, report, args.tolerance)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
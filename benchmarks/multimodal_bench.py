@@ -0,0 +1,157 @@
+# Query latency of the multimodal connection-scan router on a national-scale
+# mail timetable.
+#
+# The timetable is synthetic but sized like the Indian network: thousands of
+# stations, long-distance trains calling at many of them, and domestic
+# flights between the main airports. Random earliest-arrival queries between
+# points in India are timed (geocoding excluded) and p50/p95/p99 reported,
+# together with a query over the sample timetable shipped in
+# client/src/components/map/timetable/. Queries leaving before 06:00 are
+# timed separately: they also scan the previous day's trains still running
+# after midnight, and the sample's Bhopal -> Nagpur run at 04:00 on a Tuesday
+# must board the 12622 that left New Delhi the evening before.
+#
+#   python benchmarks/multimodal_bench.py
+#   python benchmarks/multimodal_bench.py --stations 8000 --trains 6000 --flights 3000 --queries 500
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                "client", "src", "components", "map"))
+
+from data_ingestion import IST  # noqa: E402
+from multimodal_routing import ConnectionScanRouter, haversine_km  # noqa: E402
+from timetable import Timetable, load_timetable  # noqa: E402
+
+from async_rps import percentile  # noqa: E402
+
+# Rough bounding box of mainland India
+LAT_RANGE = (8.5, 32.0)
+LON_RANGE = (69.5, 91.5)
+TRAIN_SPEED_KMH = 55
+FLIGHT_SPEED_KMH = 650
+
+
+def random_point(rng):
+    return rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)
+
+
+def synthetic_timetable(stations, trains, flights, rng):
+    """Stops and connections of a random national rail and air network."""
+    stops = []
+    grid = {}
+    for i in range(stations):
+        lat, lon = random_point(rng)
+        stops.append({"stop_id": f"S{i}", "name": f"Station {i}", "mode": "rail", "lat": lat, "lon": lon,
+                      "min_transfer_minutes": 30})
+        grid.setdefault((int(lat), int(lon)), []).append(i)
+    airports = []
+    for i in range(max(2, flights // 25)):
+        lat, lon = random_point(rng)
+        airports.append(len(stops))
+        stops.append({"stop_id": f"A{i}", "name": f"Airport {i}", "mode": "air", "lat": lat, "lon": lon,
+                      "min_transfer_minutes": 90})
+
+    def nearest_station(lat, lon):
+        cell = grid.get((int(lat), int(lon)))
+        if not cell:
+            return None
+        return min(cell, key=lambda s: haversine_km(lat, lon, stops[s]["lat"], stops[s]["lon"]))
+
+    connections = []
+    for n in range(trains):
+        # A long-distance train calling at stations along a line between two far apart ones
+        start, end = rng.sample(range(stations), 2)
+        a, b = stops[start], stops[end]
+        calls = [start]
+        hops = rng.randint(8, 30)
+        for k in range(1, hops):
+            f = k / hops
+            s = nearest_station(a["lat"] + (b["lat"] - a["lat"]) * f, a["lon"] + (b["lon"] - a["lon"]) * f)
+            if s is not None and s != calls[-1] and s != end:
+                calls.append(s)
+        calls.append(end)
+        days = "1234567" if rng.random() < 0.7 else "".join(sorted(rng.sample("1234567", rng.randint(1, 6))))
+        t = rng.randrange(0, 86400, 300)
+        for frm, to in zip(calls, calls[1:]):
+            km = haversine_km(stops[frm]["lat"], stops[frm]["lon"], stops[to]["lat"], stops[to]["lon"]) * 1.2
+            arrival = t + max(600, int(km / TRAIN_SPEED_KMH * 3600))
+            connections.append({"mode": "rail", "service_id": f"T{n}", "from_stop": f"S{frm}",
+                                "to_stop": f"S{to}", "departure": t, "arrival": arrival,
+                                "days": [int(d) - 1 for d in days]})
+            t = arrival + 300  # dwell for mail loading
+    for n in range(flights):
+        frm, to = rng.sample(airports, 2)
+        km = haversine_km(stops[frm]["lat"], stops[frm]["lon"], stops[to]["lat"], stops[to]["lon"])
+        departure = rng.randrange(0, 86400, 300)
+        connections.append({"mode": "air", "service_id": f"F{n}", "from_stop": stops[frm]["stop_id"],
+                            "to_stop": stops[to]["stop_id"], "departure": departure,
+                            "arrival": departure + 1800 + int(km / FLIGHT_SPEED_KMH * 3600),
+                            "days": list(range(7))})
+    return Timetable(stops, connections)
+
+
+def time_queries(router, queries, rng, latest=86400):
+    """Times random queries leaving within the first `latest` seconds of a random day."""
+    latencies = []
+    legs = []
+    base = datetime(2026, 1, 5, tzinfo=IST)  # a Monday
+    for _ in range(queries):
+        origin, destination = random_point(rng), random_point(rng)
+        departure = base + timedelta(days=rng.randrange(7), seconds=rng.randrange(latest))
+        started = time.perf_counter()
+        journey = router.earliest_arrival(origin, destination, departure)
+        latencies.append((time.perf_counter() - started) * 1000)
+        legs.append(len(journey["legs"]))
+    return latencies, legs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multimodal connection-scan query latency")
+    parser.add_argument("--stations", type=int, default=7000)
+    parser.add_argument("--trains", type=int, default=4000, help="Long-distance trains per day")
+    parser.add_argument("--flights", type=int, default=3000, help="Domestic flights per day")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    sample = ConnectionScanRouter(load_timetable())
+    latencies, _ = time_queries(sample, args.queries, rng)
+    print(f"Sample timetable: {len(sample.timetable.stops)} stops, {sample.timetable.connection_count} connections, "
+          f"p50 {statistics.median(latencies):.2f} ms, p99 {percentile(latencies, 99):.2f} ms")
+    # Bhopal -> Nagpur, Tuesday 04:00: the daily 12622 calls at Bhopal at 05:45 on its second day
+    journey = sample.earliest_arrival((23.2599, 77.4126), (21.1458, 79.0882),
+                                      datetime(2026, 10, 20, 4, 0, tzinfo=IST))
+    services = [leg.get("service_id") for leg in journey["legs"]]
+    print(f"Bhopal -> Nagpur, Tue 04:00: arrives {journey['arrival']} via {services}"
+          f"{'' if '12622' in services else ' (MISSED the previous-day 12622)'}\n")
+
+    started = time.perf_counter()
+    timetable = synthetic_timetable(args.stations, args.trains, args.flights, rng)
+    router = ConnectionScanRouter(timetable)
+    for weekday in range(7):
+        timetable.window(weekday)
+    print(f"National timetable: {len(timetable.stops)} stops, {timetable.connection_count} connections "
+          f"({len(timetable.window(0)['departure'])} in a weekday's window), built in "
+          f"{time.perf_counter() - started:.1f}s")
+
+    time_queries(router, 10, rng)  # warm-up
+    latencies, legs = time_queries(router, args.queries, rng)
+    print(f"{args.queries} queries: p50 {statistics.median(latencies):.2f} ms, "
+          f"p95 {percentile(latencies, 95):.2f} ms, p99 {percentile(latencies, 99):.2f} ms, "
+          f"max {max(latencies):.2f} ms; {sum(n > 1 for n in legs) / len(legs):.0%} of journeys use rail or air")
+    latencies, legs = time_queries(router, args.queries, rng, latest=6 * 3600)
+    print(f"{args.queries} queries before 06:00: p50 {statistics.median(latencies):.2f} ms, "
+          f"p95 {percentile(latencies, 95):.2f} ms, p99 {percentile(latencies, 99):.2f} ms, "
+          f"max {max(latencies):.2f} ms; {sum(n > 1 for n in legs) / len(legs):.0%} of journeys use rail or air")
+
+
+if __name__ == "__main__":
+    main()
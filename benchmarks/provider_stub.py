@@ -0,0 +1,175 @@
+# Local stand-in for the upstream providers (Nominatim, Azure Maps route /
+# traffic flow / traffic incidents, OpenWeather) with configurable latency.
+#
+# Point the map API at it with:
+#   NOMINATIM_URL=http://127.0.0.1:9100/search
+#   AZURE_MAPS_URL=http://127.0.0.1:9100
+#   OPENWEATHER_URL=http://127.0.0.1:9100
+#   AZURE_MAPS_KEY=stub OPENWEATHER_API_KEY=stub
+#
+# Responses are deterministic per query, so different location names geocode
+# to different coordinates and caches behave as they would with real data.
+
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def _unit(text, salt=""):
+    """Deterministic float in [0, 1) derived from text."""
+    digest = hashlib.sha1((salt + text).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+def geocode_response(query):
+    # Somewhere inside India's bounding box
+    lat = 8.0 + _unit(query, "lat") * 26.0
+    lon = 68.0 + _unit(query, "lon") * 29.0
+    return [{"lat": f"{lat:.7f}", "lon": f"{lon:.7f}", "display_name": query}]
+
+
+def route_response(query, max_alternatives=0):
+    (start_lat, start_lon), (end_lat, end_lon) = [tuple(map(float, p.split(","))) for p in query.split(":")[:2]]
+    routes = []
+    for alt in range(max_alternatives + 1):
+        points = []
+        for i in range(101):
+            t = i / 100
+            bend = (alt * 0.05) * (1 - abs(2 * t - 1))
+            points.append({"latitude": start_lat + (end_lat - start_lat) * t + bend,
+                           "longitude": start_lon + (end_lon - start_lon) * t})
+        length = int((abs(end_lat - start_lat) + abs(end_lon - start_lon)) * 111000 * (1 + 0.05 * alt))
+        routes.append({
+            "summary": {
+                "lengthInMeters": length,
+                "travelTimeInSeconds": int(length / 14),
+                "trafficDelayInSeconds": int(_unit(query, str(alt)) * 600)
+            },
+            "legs": [{"points": points}]
+        })
+    return {"routes": routes}
+
+
+def traffic_flow_response(query):
+    free_flow = 60 + int(_unit(query, "ff") * 40)
+    return {"flowSegmentData": {
+        "currentSpeed": int(free_flow * (0.4 + _unit(query, "cs") * 0.6)),
+        "freeFlowSpeed": free_flow,
+        "confidence": 0.9,
+        "roadClosure": False
+    }}
+
+
+def traffic_incident_response(bbox):
+    min_lon, min_lat, max_lon, max_lat = map(float, bbox.split(","))
+    features = []
+    for i in range(int(_unit(bbox, "n") * 4)):
+        features.append({
+            "geometry": {"type": "Point", "coordinates": [
+                min_lon + (max_lon - min_lon) * _unit(bbox, f"x{i}"),
+                min_lat + (max_lat - min_lat) * _unit(bbox, f"y{i}")
+            ]},
+            "properties": {
+                "incidentType": "Accident" if i % 2 else "Construction",
+                "title": f"Stub incident {i}",
+                "severity": "Major" if _unit(bbox, f"s{i}") > 0.7 else "Minor",
+                "isRoadClosed": False,
+                "isTrafficJam": _unit(bbox, f"j{i}") > 0.5,
+                "delay": int(_unit(bbox, f"d{i}") * 900)
+            }
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+def weather_response(lat, lon):
+    key = f"{lat},{lon}"
+    conditions = ["Clear", "Clouds", "Rain", "Mist", "Thunderstorm"]
+    return {
+        "weather": [{"main": conditions[int(_unit(key, "w") * len(conditions))]}],
+        "main": {"temp": round(15 + _unit(key, "t") * 25, 1)},
+        "wind": {"speed": round(_unit(key, "ws") * 12, 1), "deg": int(_unit(key, "wd") * 360)}
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    latency_ms = 50.0
+    jitter_ms = 10.0
+    error_rate = 0.0
+    requests_served = 0
+    _count_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        with StubHandler._count_lock:
+            StubHandler.requests_served += 1
+        delay = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        time.sleep(delay)
+        if self.error_rate and random.random() < self.error_rate:
+            return self._send(503, {"error": "stub injected failure"})
+
+        url = urlparse(self.path)
+        q = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            if url.path.endswith("/search"):
+                body = geocode_response(q.get("q", ""))
+            elif url.path.endswith("/route/directions/json"):
+                body = route_response(q["query"], int(q.get("maxAlternatives", 0)))
+            elif url.path.endswith("/traffic/flow/segment/json"):
+                body = traffic_flow_response(q["query"])
+            elif url.path.endswith("/traffic/incident"):
+                body = traffic_incident_response(q["bbox"])
+            elif url.path.endswith("/data/2.5/weather"):
+                body = weather_response(q["lat"], q["lon"])
+            else:
+                return self._send(404, {"error": f"unknown stub path {url.path}"})
+        except (KeyError, ValueError) as e:
+            return self._send(400, {"error": f"bad stub request: {e}"})
+        self._send(200, body)
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        try:
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # client gave up, e.g. a cancelled hedged request
+
+
+def serve(host="127.0.0.1", port=9100, latency_ms=50.0, jitter_ms=10.0, error_rate=0.0):
+    """Starts the stub in a background thread and returns the server."""
+    StubHandler.latency_ms = latency_ms
+    StubHandler.jitter_ms = jitter_ms
+    StubHandler.error_rate = error_rate
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    threading.Thread(target=server.serve_forever, name="provider-stub", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upstream provider stub with configurable latency")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    serve(args.host, args.port, args.latency_ms, args.jitter_ms, args.error_rate)
+    print(f"Provider stub listening on http://{args.host}:{args.port} "
+          f"(latency {args.latency_ms}±{args.jitter_ms} ms, error rate {args.error_rate})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
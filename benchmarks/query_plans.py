@@ -0,0 +1,110 @@
+# Checks that the backend's hot queries are served by indexes.
+#
+# Builds each list/filter query the way its router does (same filters,
+# same keyset page from pagination.page_query), runs EXPLAIN on it and
+# reports the plan. A query fails the check if it scans a whole table or
+# sorts rows instead of reading them in index order; the exit status is 1
+# if any query fails.
+#
+#   python benchmarks/query_plans.py                        # fresh SQLite database
+#   DATABASE_URL=postgresql://... python benchmarks/query_plans.py
+#
+# On PostgreSQL sequential scans are disabled for the session, so a small
+# table still shows whether an index could serve the query.
+
+import os
+import re
+import sys
+import tempfile
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(os.path.dirname(BENCH_DIR), "python_backend")
+sys.path.insert(0, BACKEND_DIR)
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='query-plans-'), 'plans.db')}"
+
+from sqlalchemy import select  # noqa: E402
+
+import models  # noqa: E402
+from database import engine  # noqa: E402
+from migrate import run_migrations  # noqa: E402
+from pagination import PageParams, encode_cursor, filter_by, page_query  # noqa: E402
+
+DIALECT = engine.dialect.name
+SQLITE_PROBLEMS = (re.compile(r"^SCAN (\w+)$"), re.compile(r"USE TEMP B-TREE FOR ORDER BY"))
+POSTGRES_PROBLEMS = (re.compile(r"Seq Scan on (\w+)"), re.compile(r"^\s*(->\s*)?Sort\b"))
+
+
+def page(cursor=None, limit=100):
+    return PageParams(limit=limit, cursor=cursor, created_after=None, created_before=None)
+
+
+def hot_queries():
+    """(name, select) for each router query on a hot path."""
+    parcel_cursor = page(encode_cursor([100]))
+    created_cursor = page(encode_cursor([datetime(2025, 1, 1), 100]))
+    return [
+        ("parcels: sender's list", page_query(
+            select(models.Parcel).where(models.Parcel.user_id == 1), models.Parcel, parcel_cursor, DIALECT)),
+        ("parcels: by status", page_query(
+            filter_by(select(models.Parcel), models.Parcel, status="delayed"), models.Parcel, parcel_cursor, DIALECT)),
+        ("parcels: track", select(models.Parcel).where(models.Parcel.tracking_number == "MRS-00000001-AA")),
+        ("routes: for parcel", select(models.Route).where(models.Route.parcel_id == 1)),
+        ("routes: active", page_query(
+            select(models.Route).where(models.Route.active == True), models.Route, parcel_cursor, DIALECT)),
+        ("notifications: user's list", page_query(
+            select(models.Notification).where(models.Notification.user_id == 1),
+            models.Notification, created_cursor, DIALECT, newest_first=True)),
+        ("notifications: unread", page_query(
+            select(models.Notification).where(models.Notification.user_id == 1, models.Notification.read == False),
+            models.Notification, created_cursor, DIALECT, newest_first=True)),
+        ("issues: list", page_query(
+            select(models.Issue), models.Issue, created_cursor, DIALECT, newest_first=True)),
+        ("issues: active", page_query(
+            select(models.Issue).where(models.Issue.status == "active"),
+            models.Issue, created_cursor, DIALECT, newest_first=True)),
+        ("issues: by type", page_query(
+            filter_by(select(models.Issue), models.Issue, issue_type="weather"),
+            models.Issue, created_cursor, DIALECT, newest_first=True)),
+        ("outbox: unpublished batch", select(models.OutboxEvent).where(
+            models.OutboxEvent.published_at.is_(None)).order_by(models.OutboxEvent.id).limit(500)),
+    ]
+
+
+def explain(connection, statement):
+    compiled = statement.compile(dialect=engine.dialect)
+    params = compiled.params
+    if compiled.positiontup is not None:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    if DIALECT == "sqlite":
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+        return [row[-1] for row in rows]
+    return [row[0] for row in connection.exec_driver_sql(f"EXPLAIN {compiled}", params).all()]
+
+
+def problems(plan):
+    patterns = SQLITE_PROBLEMS if DIALECT == "sqlite" else POSTGRES_PROBLEMS
+    return [line.strip() for line in plan for pattern in patterns if pattern.search(line.strip())]
+
+
+def main():
+    run_migrations()
+    failed = 0
+    with engine.connect() as connection:
+        if DIALECT == "postgresql":
+            connection.exec_driver_sql("SET enable_seqscan = off")
+        for name, statement in hot_queries():
+            plan = explain(connection, statement)
+            issues = problems(plan)
+            failed += bool(issues)
+            print(f"{'FAIL' if issues else 'ok':<5}{name}")
+            for line in plan:
+                print(f"       {line}")
+    print(f"\n{failed} quer{'y' if failed == 1 else 'ies'} without index use" if failed else "\nAll queries use indexes")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
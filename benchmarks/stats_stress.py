@@ -0,0 +1,249 @@
+# Concurrent-write stress test for the Stats counters of the mail routing API.
+#
+# Many clients move their own parcel and route through the transitions that
+# maintain the counters at the same time: create a parcel (active_parcels),
+# create a route (active_routes), delay the parcel and clear the delay
+# (delayed_parcels), deactivate the route, and delay/clear the parcel
+# through an issue and its resolution. Afterwards the counters must equal
+# the baseline plus the net change of the successful requests, and must
+# match what /api/stats/recalculate counts from the tables.
+#
+# A second phase has all clients fight over the SAME parcel, route and
+# issue: delay / clear the one parcel, deactivate / reactivate the one
+# route, open issues against the parcel and resolve one issue, each round
+# fired concurrently. How many of those requests actually change state is
+# up to the race, so here the counters must match the recalculated ones.
+# The exit status is 1 if any counter is off.
+#
+# Start the API on a throwaway SQLite database (one worker already
+# interleaves the requests; more workers need DATABASE_URL pointing at
+# PostgreSQL, since SQLite does not serialize startup migrations across
+# processes):
+#
+#   python benchmarks/stats_stress.py --start --tasks 400 --concurrency 32
+#   DATABASE_URL=postgresql://... python benchmarks/stats_stress.py --start --workers 4
+#
+# Against an API that is already running (nothing else should write to it
+# during the run):
+#
+#   python benchmarks/stats_stress.py --backend-url http://127.0.0.1:5000
+
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+
+from load_test import BACKEND_APP_DIR, wait_until_ready
+
+COUNTERS = ("active_parcels", "active_routes", "delayed_parcels")
+
+
+async def login(client):
+    """Seeds the demo data if needed; returns the admin's auth headers and user id."""
+    (await client.get("/api/seed-data")).raise_for_status()
+    response = await client.post("/token", data={"username": "admin", "password": "password"})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = await client.get("/api/user", headers=headers)
+    response.raise_for_status()
+    return headers, response.json()["id"]
+
+
+async def recalculated(client, headers):
+    response = await client.post("/api/stats/recalculate", headers=headers)
+    response.raise_for_status()
+    return {counter: response.json()[counter] for counter in COUNTERS}
+
+
+async def current(client, headers):
+    response = await client.get("/api/stats", headers=headers)
+    response.raise_for_status()
+    return {counter: response.json()[counter] for counter in COUNTERS}
+
+
+async def run_task(client, headers, user_id, n, run_id, expected, failures):
+    """One client's sequence of counter-changing requests; stops at the first failure."""
+    async def call(method, path, deltas, **kwargs):
+        response = await client.request(method, path, headers=headers, **kwargs)
+        if response.status_code >= 400:
+            failures[f"{method} {path.split('/')[2]} {response.status_code}"] += 1
+            return None
+        expected.update(deltas)
+        return response.json()
+
+    parcel = await call("POST", "/api/parcels", {"active_parcels": 1}, json={
+        "tracking_number": f"STRESS-{run_id}-{n}", "origin": "stress-a", "destination": "stress-b",
+        "transport_mode": "road", "weight": "1kg", "user_id": user_id
+    })
+    if parcel is None:
+        return
+    route = await call("POST", "/api/routes", {"active_routes": 1}, json={
+        "parcel_id": parcel["id"], "route_path": {"stops": ["stress-a", "stress-b"]}, "transport_mode": "road",
+        "duration": "1h", "distance": "10km"
+    })
+    if route is None:
+        return
+    if await call("PUT", f"/api/parcels/{parcel['id']}", {"delayed_parcels": 1}, json={"status": "delayed"}) is None:
+        return
+    if n % 2 and await call("PUT", f"/api/parcels/{parcel['id']}", {"delayed_parcels": -1},
+                            json={"status": "in_transit"}) is None:
+        return
+    if n % 3 == 0 and await call("PUT", f"/api/routes/{route['id']}", {"active_routes": -1},
+                                 json={"active": False}) is None:
+        return
+    if n % 2 and n % 4 == 1:
+        # The parcel is in transit again: an issue delays it, resolving the issue clears it
+        issue = await call("POST", "/api/issues", {"delayed_parcels": 1}, json={
+            "title": f"Stress {run_id}-{n}", "description": "stress test", "severity": "low",
+            "issue_type": "mechanical", "affected_parcels": [parcel["id"]]
+        })
+        if issue is not None:
+            await call("PUT", f"/api/issues/{issue['id']}", {"delayed_parcels": -1}, json={"status": "resolved"})
+
+
+async def run_shared(client, headers, user_id, run_id, rounds, failures):
+    """Concurrent rounds of requests all moving one parcel, route and issue."""
+    async def call(method, path, **kwargs):
+        response = await client.request(method, path, headers=headers, **kwargs)
+        if response.status_code >= 400:
+            failures[f"{method} {path.split('/')[2]} {response.status_code}"] += 1
+            return None
+        return response.json()
+
+    async def burst(calls):
+        return await asyncio.gather(*calls)
+
+    parcel = await call("POST", "/api/parcels", json={
+        "tracking_number": f"STRESS-{run_id}-shared", "origin": "stress-a", "destination": "stress-b",
+        "transport_mode": "road", "weight": "1kg", "user_id": user_id
+    })
+    route = parcel and await call("POST", "/api/routes", json={
+        "parcel_id": parcel["id"], "route_path": {"stops": ["stress-a", "stress-b"]}, "transport_mode": "road",
+        "duration": "1h", "distance": "10km"
+    })
+    if not route:
+        return
+    parcel_path, route_path = f"/api/parcels/{parcel['id']}", f"/api/routes/{route['id']}"
+    for status in ("delayed", "in_transit", "delayed"):
+        await burst(call("PUT", parcel_path, json={"status": status}) for _ in range(rounds))
+    await burst(call("PUT", parcel_path, json={"status": ("delayed", "in_transit")[n % 2]}) for n in range(rounds))
+    for active in (False, True, False):
+        await burst(call("PUT", route_path, json={"active": active}) for _ in range(rounds))
+    await burst(call("PUT", route_path, json={"active": bool(n % 2)}) for n in range(rounds))
+
+    # Issues against the parcel: only one of them may delay it, and only that one's resolution clears it
+    await call("PUT", parcel_path, json={"status": "in_transit"})
+    issues = await burst(call("POST", "/api/issues", json={
+        "title": f"Stress {run_id} shared {n}", "description": "stress test", "severity": "low",
+        "issue_type": "mechanical", "affected_parcels": [parcel["id"]]
+    }) for n in range(rounds))
+    issues = [issue for issue in issues if issue]
+    await burst(call("PUT", f"/api/issues/{issue['id']}", json={"status": "resolved"})
+                for issue in issues for _ in range(2))
+
+
+def report(title, counters, want, truth):
+    """Prints maintained / expected / recalculated per counter; returns how many are off."""
+    wrong = 0
+    print(f"\n{title}")
+    print(f"{'counter':<18}{'maintained':>12}{'expected':>12}{'recalculated':>14}")
+    for counter in COUNTERS:
+        ok = counters[counter] == want[counter] == truth[counter]
+        wrong += not ok
+        print(f"{counter:<18}{counters[counter]:>12}{want[counter]:>12}{truth[counter]:>14}  "
+              f"{'ok' if ok else 'MISMATCH'}")
+    return wrong
+
+
+async def run(args):
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.backend_url, timeout=60.0, limits=limits) as client:
+        headers, user_id = await login(client)
+        baseline = await recalculated(client, headers)
+        print(f"Baseline: {baseline}")
+
+        expected = Counter()
+        failures = Counter()
+        semaphore = asyncio.Semaphore(args.concurrency)
+        run_id = f"{int(time.time())}"
+
+        async def limited(n):
+            async with semaphore:
+                await run_task(client, headers, user_id, n, run_id, expected, failures)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(limited(n) for n in range(args.tasks)))
+        elapsed = time.perf_counter() - started
+        print(f"{args.tasks} clients finished in {elapsed:.1f}s")
+        for failure, count in sorted(failures.items()):
+            print(f"  failed: {failure} x{count}")
+
+        counters = await current(client, headers)
+        truth = await recalculated(client, headers)
+        wrong = report("Own rows", counters, {c: baseline[c] + expected[c] for c in COUNTERS}, truth)
+
+        # Recalculation reset the counters to the truth; the shared phase starts from there
+        failures.clear()
+        started = time.perf_counter()
+        await run_shared(client, headers, user_id, run_id, args.concurrency, failures)
+        print(f"\nShared rows: {args.concurrency} concurrent requests per round, "
+              f"finished in {time.perf_counter() - started:.1f}s")
+        for failure, count in sorted(failures.items()):
+            print(f"  failed: {failure} x{count}")
+        counters = await current(client, headers)
+        truth = await recalculated(client, headers)
+        wrong += report("Shared rows (expected = recalculated)", counters, truth, truth)
+
+    print("\nAll counters exact" if not wrong else f"\n{wrong} counter(s) drifted under concurrent writes")
+    return wrong
+
+
+def start_backend(args, workdir):
+    """Starts the mail routing API; returns its process."""
+    env = dict(os.environ, RATE_LIMIT_ENABLED="false")
+    env.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'mail_routing.db')}")
+    # The mail routing API serves the frontend from ../client/dist relative to its working directory
+    os.makedirs(os.path.join(workdir, "client", "dist", "assets"), exist_ok=True)
+    os.makedirs(os.path.join(workdir, "run"), exist_ok=True)
+    port = args.backend_url.rsplit(":", 1)[1].rstrip("/")
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", BACKEND_APP_DIR, "--port", port,
+               "--log-level", "warning", "--workers", str(args.workers)]
+    logs = open(os.path.join(workdir, "backend.log"), "w")
+    process = subprocess.Popen(command, cwd=os.path.join(workdir, "run"), env=env,
+                               stdout=logs, stderr=subprocess.STDOUT)
+    wait_until_ready(args.backend_url, process)
+    print(f"Started {args.backend_url} with {args.workers} worker(s)")
+    return process
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-write stress test for the Stats counters")
+    parser.add_argument("--backend-url", default=os.getenv("MAIL_ROUTING_API_URL", "http://127.0.0.1:5000"))
+    parser.add_argument("--tasks", type=int, default=400, help="Clients, each with its own parcel and route")
+    parser.add_argument("--concurrency", type=int, default=32, help="Clients running at the same time")
+    parser.add_argument("--start", action="store_true", help="Start the mail routing API locally for the run")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers with --start")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="stats-stress-") if args.start else None
+    process = start_backend(args, workdir) if args.start else None
+    try:
+        wrong = asyncio.run(run(args))
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=30)
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if wrong else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,28 +1,91 @@
-from fastapi import FastAPI, Query
+import asyncio
+import hmac
+import os
+import time
+
+from fastapi import FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 
 from data_ingestion import (
-    geocode_location,
     generate_bounding_box,
-    fetch_traffic_incidents,
-    fetch_real_time_traffic_flow,
-    fetch_weather_data,
-    fetch_transport_schedules
+    fetch_transport_schedules,
+    geocode_location_async,
+    fetch_traffic_incidents_async,
+    fetch_real_time_traffic_flow_async,
+    fetch_weather_data_async,
+    close_async_client
+)
+from routing_engine import (
+    get_optimized_route_async,
+    calculate_dynamic_route_async,
+    iter_dynamic_route_legs_async,
+    AZURE_MAPS_KEY
+)
+from multimodal_routing import get_multimodal_route
+from route_planner import (
+    get_registry_info,
+    load_post_office_data,
+    start_post_office_watcher,
+    stop_post_office_watcher
 )
-from routing_engine import get_optimized_route, calculate_dynamic_route
+from cache_warmer import get_warmer_status, start_cache_warmer, stop_cache_warmer
+from circuit_breaker import get_breaker_status
+from consumer import get_consumer_status, start_event_consumer, stop_event_consumer
+from live_updates import dirty_routes
+from vector_tiles import TILE_LIVE_TTL_SECONDS, invalidate_route_tiles, render_tile
+from trunk_legs import get_trunk_leg, get_trunk_table, start_trunk_refresher, stop_trunk_refresher
+from rate_limit import RATE_LIMIT_ENABLED, RateLimitMiddleware, charge, client_identity, route_plan_cost
+from responses import FastJSONResponse, ResponseCompressionMiddleware, get_response_stats, json_dumps
+from metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, render_metrics, route_stream_duration,
+    route_stream_first_leg
+)
+
+app = FastAPI(title="Smart Traffic & Route API", default_response_class=FastJSONResponse)
 
-app = FastAPI(title="Smart Traffic & Route API")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+BATCH_MAX_JOBS = int(os.getenv("BATCH_MAX_JOBS", "1000"))
+CACHE_WARMER_ENABLED = os.getenv("CACHE_WARMER_ENABLED", "true").lower() in ("1", "true", "yes")
 
-# Enable CORS for frontend interaction
+# Reject over-quota clients before their requests fan out to paid upstream calls
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(RateLimitMiddleware)
+# Enable CORS for frontend interaction; added after the rate limiter so 429s carry CORS headers too
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "X-RateLimit-Limit", "X-RateLimit-Remaining"],
 )
+# Compress large route payloads (gzip/brotli) and record serialization stats
+app.add_middleware(ResponseCompressionMiddleware)
+# Outermost, so request latency includes compression
+app.add_middleware(MetricsMiddleware)
+
+@app.on_event("startup")
+async def start_background_jobs():
+    start_post_office_watcher()
+    if AZURE_MAPS_KEY:
+        start_trunk_refresher()
+    else:
+        print("AZURE_MAPS_KEY is not set; trunk leg refresher not started.")
+    if CACHE_WARMER_ENABLED:
+        start_cache_warmer()
+    start_event_consumer()
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    stop_event_consumer()
+    await stop_cache_warmer()
+    stop_trunk_refresher()
+    stop_post_office_watcher()
+    await close_async_client()
 
 class DynamicRouteRequest(BaseModel):
     origin: str
@@ -31,95 +94,301 @@ class DynamicRouteRequest(BaseModel):
     travel_mode: Optional[str] = "car"   # transit mode, e.g., 'car' or 'rail'
     route_type: Optional[str] = "fastest"  # routeType: 'fastest' or 'shortest'
 
+class BatchRouteJob(BaseModel):
+    id: Optional[str] = None  # echoed back so the caller can match results
+    origin: str
+    destination: str
+    intermediate_post_offices: List[str] = []
+    travel_mode: Optional[str] = "car"
+    route_type: Optional[str] = "fastest"
+
+class BatchRouteRequest(BaseModel):
+    jobs: List[BatchRouteJob]
+    max_concurrency: Optional[int] = None
+
+def require_admin(x_admin_token):
+    """Admin endpoints fail closed: they are disabled unless ADMIN_TOKEN is set, and need it in X-Admin-Token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=503, detail="Admin endpoints are disabled; set ADMIN_TOKEN")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
 @app.get("/geocode")
-def geocode(location: str):
-    lat, lon = geocode_location(location)
+async def geocode(location: str):
+    lat, lon = await geocode_location_async(location)
     if lat is None or lon is None:
         return {"error": f"Could not geocode location: {location}"}
     return {"location": location, "lat": lat, "lon": lon}
 
 @app.get("/traffic/incidents")
-def traffic_incidents(location: str, incident_type: Optional[str] = Query(None)):
-    lat, lon = geocode_location(location)
+async def traffic_incidents(location: str, incident_type: Optional[str] = Query(None)):
+    lat, lon = await geocode_location_async(location)
     if lat is None or lon is None:
         return {"error": f"Could not geocode location: {location}"}
     bbox = generate_bounding_box(lat, lon)
-    return fetch_traffic_incidents(bbox, incident_type=incident_type)
+    return await fetch_traffic_incidents_async(bbox, incident_type=incident_type)
 
 @app.get("/traffic/flow")
-def traffic_flow(location: str):
-    lat, lon = geocode_location(location)
+async def traffic_flow(location: str):
+    lat, lon = await geocode_location_async(location)
     if lat is None or lon is None:
         return {"error": f"Could not geocode location: {location}"}
-    return fetch_real_time_traffic_flow(lat, lon)
+    return await fetch_real_time_traffic_flow_async(lat, lon)
 
 @app.get("/weather")
-def weather(location: str):
-    lat, lon = geocode_location(location)
+async def weather(location: str):
+    lat, lon = await geocode_location_async(location)
     if lat is None or lon is None:
         return {"error": f"Could not geocode location: {location}"}
-    return fetch_weather_data(lat, lon)
+    return await fetch_weather_data_async(lat, lon)
 
 @app.get("/transport/schedules")
 def transport_schedules():
     return fetch_transport_schedules()
 
 @app.get("/route/optimized")
-def optimized_route(start: str, end: str, optimized_mode: Optional[str] = "shortest"):
-    result = get_optimized_route(start, end, optimized_mode)
+async def optimized_route(start: str, end: str, optimized_mode: Optional[str] = "shortest"):
+    result = await get_optimized_route_async(start, end, optimized_mode)
     if "error" in result:
         return {"error": result["error"]}
     return result
 
+@app.get("/route/multimodal")
+def multimodal_route(origin: str, destination: str, departure: Optional[str] = None,
+                     modes: Optional[str] = "rail,air"):
+    mode_list = tuple(m.strip().lower() for m in modes.split(",") if m.strip()) if modes else ()
+    return get_multimodal_route(origin, destination, departure=departure, modes=mode_list)
+
+@app.get("/trunk/leg")
+def trunk_leg(origin: str, destination: str):
+    leg = get_trunk_leg(origin, destination)
+    if leg is None:
+        return {"error": f"No precomputed trunk leg for {origin} -> {destination}"}
+    return leg
+
+@app.get("/trunk/status")
+def trunk_status():
+    return get_trunk_table().status()
+
+@app.get("/post-offices/registry")
+def post_office_registry():
+    return get_registry_info()
+
+@app.post("/admin/post-offices/reload")
+def reload_post_offices(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    load_post_office_data()
+    return get_registry_info()
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/cache/warmer")
+def cache_warmer_status():
+    return get_warmer_status()
+
+@app.get("/upstream/status")
+def upstream_status():
+    return get_breaker_status()
+
+@app.get("/stream/status")
+def stream_status():
+    start_event_consumer()  # restarts the consumer thread if it died
+    return get_consumer_status()
+
+@app.get("/routes/dirty")
+def get_dirty_routes():
+    """Active routes whose traffic, incidents or weather changed since they were last recalculated."""
+    return dirty_routes.snapshot()
+
+@app.post("/admin/routes/dirty/claim")
+def claim_dirty_routes(route_ids: Optional[List[int]] = None, x_admin_token: Optional[str] = Header(None)):
+    """
+    Removes dirty routes (all, or the given ids) and returns them to the
+    caller. This service only tracks them; recalculating and saving the
+    routes is up to the caller (e.g. a job of the mail routing API).
+    """
+    require_admin(x_admin_token)
+    return dirty_routes.claim(route_ids)
+
+@app.get("/metrics/responses")
+def response_metrics():
+    return get_response_stats()
+
+@app.get("/tiles/{layer}/{z}/{x}/{y}.mvt")
+def vector_tile(layer: str, z: int, x: int, y: int):
+    """Mapbox vector tile for 'routes', 'incidents', 'traffic' or 'all'; 204 if the tile is empty."""
+    try:
+        tile = render_tile(layer, z, x, y)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    headers = {"Cache-Control": f"public, max-age={TILE_LIVE_TTL_SECONDS}"}
+    if not tile:
+        return Response(status_code=204, headers=headers)
+    return Response(content=tile, media_type="application/vnd.mapbox-vector-tile", headers=headers)
+
+@app.post("/admin/tiles/invalidate")
+def invalidate_tiles(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    invalidate_route_tiles()
+    return {"invalidated": "routes"}
+
 @app.get("/all-data")
-def all_data(location: str):
-    lat, lon = geocode_location(location)
+async def all_data(location: str):
+    lat, lon = await geocode_location_async(location)
     if lat is None or lon is None:
         return {"error": f"Could not geocode location: {location}"}
 
     bbox = generate_bounding_box(lat, lon)
+    weather_data, traffic_incidents_data, traffic_flow_data = await asyncio.gather(
+        fetch_weather_data_async(lat, lon),
+        fetch_traffic_incidents_async(bbox),
+        fetch_real_time_traffic_flow_async(lat, lon)
+    )
     return {
         "location": {"name": location, "lat": lat, "lon": lon},
-        "weather": fetch_weather_data(lat, lon),
-        "traffic_incidents": fetch_traffic_incidents(bbox),
-        "traffic_flow": fetch_real_time_traffic_flow(lat, lon),
+        "weather": weather_data,
+        "traffic_incidents": traffic_incidents_data,
+        "traffic_flow": traffic_flow_data,
         "schedules": fetch_transport_schedules()
     }
 
 @app.get("/weather/coords")
-def weather_coords(lat: float, lon: float):
-    return fetch_weather_data(lat, lon)
+async def weather_coords(lat: float, lon: float):
+    return await fetch_weather_data_async(lat, lon)
+
+async def compute_dynamic_route(origin, destination, intermediate_post_offices, travel_mode="car", route_type="fastest"):
+    full_route = [origin] + intermediate_post_offices + [destination]
+
+    # Collect traffic and weather data for all points concurrently
+    coordinates = await asyncio.gather(*(geocode_location_async(location) for location in full_route))
+    for location, (lat, lon) in zip(full_route, coordinates):
+        if lat is None or lon is None:
+            return {"error": f"Could not geocode location: {location}"}
+    traffic_results = await asyncio.gather(*(fetch_real_time_traffic_flow_async(lat, lon) for lat, lon in coordinates))
+    weather_results = await asyncio.gather(*(fetch_weather_data_async(lat, lon) for lat, lon in coordinates))
+    traffic_data = dict(zip(full_route, traffic_results))
+    weather_data = dict(zip(full_route, weather_results))
+
+    # Calculate optimized dynamic route
+    # pass requested travel mode into routing engine
+    optimized_route = await calculate_dynamic_route_async(
+        full_route,
+        traffic_data,
+        weather_data,
+        travel_mode=travel_mode,
+        route_type=route_type
+    )
+
+    return {
+        "optimized_route": optimized_route,
+        "message": "Dynamically recalibrated route based on real-time traffic and weather"
+    }
 
 # ✅ NEW: Dynamic Recalibrated Route with Real-Time Data
 @app.post("/route/optimized")
-def dynamic_route(request: DynamicRouteRequest):
+async def dynamic_route(request: DynamicRouteRequest):
     try:
-        full_route = [request.origin] + request.intermediate_post_offices + [request.destination]
-
-        # Collect traffic and weather data for all points
-        traffic_data = {}
-        weather_data = {}
-        for location in full_route:
-            lat, lon = geocode_location(location)
-            if lat is None or lon is None:
-                return {"error": f"Could not geocode location: {location}"}
-            traffic_data[location] = fetch_real_time_traffic_flow(lat, lon)
-            weather_data[location] = fetch_weather_data(lat, lon)
-
-        # Calculate optimized dynamic route
-        # pass requested travel mode into routing engine
-        optimized_route = calculate_dynamic_route(
-            full_route,
-            traffic_data,
-            weather_data,
+        return await compute_dynamic_route(
+            request.origin,
+            request.destination,
+            request.intermediate_post_offices,
             travel_mode=request.travel_mode,
             route_type=request.route_type
         )
 
-        return {
-            "optimized_route": optimized_route,
-            "message": "Dynamically recalibrated route based on real-time traffic and weather"
-        }
-
     except Exception as e:
         return {"error": str(e)}
+
+@app.post("/route/optimized/stream")
+async def dynamic_route_stream(request: DynamicRouteRequest):
+    """
+    Streaming variant of POST /route/optimized. Each leg (geometry, ETA,
+    traffic, weather, reroute suggestion) is sent as a Server-Sent Event as
+    soon as it is computed, followed by a 'done' event with timings.
+    """
+    full_route = [request.origin] + request.intermediate_post_offices + [request.destination]
+
+    async def events():
+        started = time.perf_counter()
+        time_to_first_leg_ms = None
+        legs = 0
+        outcome = "ok"
+        try:
+            async for leg in iter_dynamic_route_legs_async(full_route, travel_mode=request.travel_mode,
+                                                           route_type=request.route_type):
+                elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+                if time_to_first_leg_ms is None:
+                    time_to_first_leg_ms = elapsed_ms
+                    route_stream_first_leg.observe(value=elapsed_ms / 1000)
+                leg["index"] = legs
+                leg["elapsed_ms"] = elapsed_ms
+                legs += 1
+                yield f"event: leg\ndata: {json_dumps(leg)}\n\n"
+        except Exception as e:
+            outcome = "error"
+            yield f"event: error\ndata: {json_dumps({'error': str(e)})}\n\n"
+        total_ms = round((time.perf_counter() - started) * 1000, 1)
+        route_stream_duration.observe(outcome, value=total_ms / 1000)
+        summary = {"legs": legs, "time_to_first_leg_ms": time_to_first_leg_ms, "total_ms": total_ms}
+        yield f"event: done\ndata: {json_dumps(summary)}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def run_batch_job(index, job, semaphore, client=None):
+    """
+    Runs one batch job; errors are reported in the result instead of raised.
+    With a rate limited `client`, the job's route plan cost is taken from its
+    bucket when the job starts.
+    """
+    async with semaphore:
+        started = time.perf_counter()
+        allowed, retry_after = True, 0.0
+        if client is not None:
+            allowed, retry_after = charge(client, route_plan_cost(2 + len(job.intermediate_post_offices)),
+                                          "POST", "/route/batch")
+        if not allowed:
+            result = {"error": "Rate limit exceeded", "retry_after": round(retry_after, 1)}
+        else:
+            try:
+                # Jobs with and without intermediate stops get the same per-leg result shape
+                result = await compute_dynamic_route(job.origin, job.destination, job.intermediate_post_offices,
+                                                     travel_mode=job.travel_mode, route_type=job.route_type)
+            except Exception as e:
+                result = {"error": str(e)}
+    line = {"index": index, "id": job.id, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)}
+    if "error" in result:
+        line["error"] = result["error"]
+        if "retry_after" in result:
+            line["retry_after"] = result["retry_after"]
+    else:
+        line["result"] = result
+    return line
+
+@app.post("/route/batch")
+async def batch_route(request: BatchRouteRequest, http_request: Request):
+    """
+    Runs many routing jobs with bounded concurrency and streams one NDJSON
+    line per job as soon as it finishes (not in request order). All jobs
+    share the provider caches, so repeated locations are fetched once. Each
+    job is charged to the caller's rate limit bucket as it starts.
+    """
+    if len(request.jobs) > BATCH_MAX_JOBS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_JOBS} jobs per batch")
+    concurrency = max(1, min(request.max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    client = client_identity(http_request.scope) if RATE_LIMIT_ENABLED else None
+
+    async def results():
+        semaphore = asyncio.Semaphore(concurrency)
+        tasks = [asyncio.create_task(run_batch_job(i, job, semaphore, client)) for i, job in enumerate(request.jobs)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json_dumps(await next_done) + "\n"
+        finally:
+            # Stop outstanding jobs if the client goes away mid-stream
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
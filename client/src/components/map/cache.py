@@ -0,0 +1,198 @@
+import math
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from metrics import CallbackMetric
+
+_MISSING = object()
+_caches = weakref.WeakSet()
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire `ttl` seconds after being set.
+    Keeps hit/miss counts so callers can report cache effectiveness.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300, name=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        if name:
+            _caches.add(self)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_set(self, key, factory, ttl=None):
+        """Returns the cached value for key, computing and storing it with factory() on a miss."""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value, ttl)
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def peek(self, key, default=None):
+        """Like get, but without touching LRU order or hit counts."""
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            return default
+        return entry[1]
+
+    def expires_in(self, key):
+        """Seconds until key expires (negative once expired), or None if it is not held."""
+        with self._lock:
+            entry = self._data.get(key)
+        return None if entry is None else entry[0] - time.monotonic()
+
+    def values(self):
+        """Snapshot of the unexpired values, without touching LRU order or hit counts."""
+        now = time.monotonic()
+        with self._lock:
+            return [value for expires_at, value in self._data.values() if expires_at > now]
+
+    def items(self):
+        """Snapshot of the unexpired (key, value) pairs, without touching LRU order or hit counts."""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (expires_at, value) in self._data.items() if expires_at > now]
+
+    def replace(self, key, value):
+        """Swaps the value of a held, unexpired key while keeping its expiry; returns False if not held."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                return False
+            self._data[key] = (entry[0], value)
+            return True
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None
+        }
+
+
+class LastKnownGood:
+    """
+    Bounded LRU store of the last successful value per key, without expiry.
+    Used to keep serving data, marked stale, while a provider is failing.
+    """
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # key -> (fetched_at epoch seconds, value)
+        self._lock = threading.Lock()
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.time(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get(self, key):
+        """Returns (fetched_at, value) or None."""
+        with self._lock:
+            return self._data.get(key)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DemandCounter:
+    """
+    Exponentially decayed request counts per key, so recent demand outweighs
+    old demand. Keeps the `maxsize` highest-scoring keys with a payload each
+    (e.g. the coordinates needed to refresh that key).
+    """
+
+    def __init__(self, maxsize=5000, half_life=1800):
+        self.maxsize = maxsize
+        self.decay = math.log(2) / half_life
+        self._scores = {}  # key -> [score at last update, last update time, payload]
+        self._lock = threading.Lock()
+
+    def record(self, key, payload=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._scores.get(key)
+            if entry is None:
+                self._scores[key] = [1.0, now, payload]
+                if len(self._scores) > self.maxsize * 1.25:
+                    self._prune(now)
+            else:
+                entry[0] = entry[0] * math.exp(-self.decay * (now - entry[1])) + 1.0
+                entry[1] = now
+                entry[2] = payload
+
+    def _prune(self, now):
+        ranked = sorted(self._scores.items(),
+                        key=lambda item: item[1][0] * math.exp(-self.decay * (now - item[1][1])), reverse=True)
+        self._scores = dict(ranked[:self.maxsize])
+
+    def top(self, n, prefix=None):
+        """[(key, score, payload), ...] for the n most requested keys, optionally only keys starting with prefix."""
+        now = time.monotonic()
+        with self._lock:
+            items = [(key, entry[0] * math.exp(-self.decay * (now - entry[1])), entry[2])
+                     for key, entry in self._scores.items() if prefix is None or key[0] == prefix]
+        items.sort(key=lambda item: item[1], reverse=True)
+        return items[:n]
+
+
+def named_caches():
+    """All live caches created with a name, for metrics export."""
+    return sorted(list(_caches), key=lambda cache: cache.name)
+
+
+CallbackMetric("cache_hits_total", "Cache lookups that found a fresh entry.", "counter", ("cache",),
+               lambda: [((cache.name,), cache.hits) for cache in named_caches()])
+CallbackMetric("cache_misses_total", "Cache lookups that found no fresh entry.", "counter", ("cache",),
+               lambda: [((cache.name,), cache.misses) for cache in named_caches()])
+CallbackMetric("cache_hit_ratio", "Share of cache lookups that were hits since start.", "gauge", ("cache",),
+               lambda: [((cache.name,), cache.hits / (cache.hits + cache.misses))
+                        for cache in named_caches() if cache.hits + cache.misses])
+CallbackMetric("cache_entries", "Entries currently held by the cache.", "gauge", ("cache",),
+               lambda: [((cache.name,), len(cache)) for cache in named_caches()])
@@ -0,0 +1,264 @@
+import asyncio
+import os
+import time
+
+from circuit_breaker import OPEN, get_breaker
+from data_ingestion import (
+    AZURE_MAPS_KEY,
+    WEATHER_API_KEY,
+    bbox_key,
+    demand,
+    fetch_real_time_traffic_flow_async,
+    fetch_traffic_incidents_async,
+    fetch_weather_data_async,
+    generate_bounding_box,
+    geocode_cache,
+    point_key,
+    traffic_flow_cache,
+    traffic_incidents_cache,
+    weather_cache
+)
+from metrics import CallbackMetric, Counter
+from route_planner import POST_OFFICE_FILE, get_post_office_registry
+
+# --- Background cache warmer ---
+#
+# Keeps traffic flow, weather and incident data warm for every office in the
+# post office registry so interactive requests hit the provider caches.
+# Each data kind has its own worker that refreshes entries shortly before
+# they expire, one request every 60 / WARMER_<KIND>_PER_MINUTE seconds so the
+# load on each provider is spread out evenly. Keys requested most often
+# recently (data_ingestion.demand) are refreshed first on every round, then
+# the worker continues its pass through the registry.
+
+WARMER_HOT_KEYS = int(os.getenv("WARMER_HOT_KEYS", "200"))
+WARMER_ROUND_SECONDS = float(os.getenv("WARMER_ROUND_SECONDS", "30"))  # hot keys are revisited this often
+WARMER_LEAD_FRACTION = float(os.getenv("WARMER_LEAD_FRACTION", "0.25"))  # refresh in the last 25% of the TTL
+WARMER_IDLE_SECONDS = 1.0
+
+WARMER_RATES_PER_MINUTE = {
+    "weather": float(os.getenv("WARMER_WEATHER_PER_MINUTE", "50")),
+    "traffic_flow": float(os.getenv("WARMER_TRAFFIC_FLOW_PER_MINUTE", "120")),
+    "traffic_incidents": float(os.getenv("WARMER_TRAFFIC_INCIDENTS_PER_MINUTE", "60"))
+}
+
+warmer_refreshes = Counter("cache_warmer_refreshes_total", "Cache warmer refreshes by outcome.", ("kind", "outcome"))
+
+
+def _point_target(office):
+    lat, lon = office["Latitude"], office["Longitude"]
+    return point_key(lat, lon), (lat, lon)
+
+
+def _bbox_target(office):
+    bbox = generate_bounding_box(office["Latitude"], office["Longitude"])
+    return bbox_key(bbox), (bbox, None)
+
+
+class WarmerKind:
+    """Refresh schedule and progress for one kind of provider data."""
+
+    def __init__(self, name, cache, fetch, provider, target):
+        self.name = name
+        self.cache = cache
+        self.fetch = fetch
+        self.provider = provider
+        self.target = target          # office row -> (cache key, fetch args)
+        self.interval = 60.0 / WARMER_RATES_PER_MINUTE[name]
+        self.lead = cache.ttl * WARMER_LEAD_FRACTION
+        self.last_refreshed = {}      # cache key -> monotonic time of the warmer's last successful refresh
+        self.targets = []
+        self.registry_version = None
+        self.cursor = 0
+        self.pass_fresh = 0
+        self.coverage = None          # share of registry targets fresh at the end of the last full pass
+        self.hot_coverage = None
+        self.lag = 0.0                # worst lateness past the planned refresh time in the last round
+        self.last_pass_seconds = None
+        self.pass_started = time.monotonic()
+
+    def sync_targets(self):
+        registry = get_post_office_registry()
+        if registry.version == self.registry_version:
+            return
+        targets = {}
+        for office in registry.offices.values():
+            key, args = self.target(office)
+            targets.setdefault(key, args)
+        self.targets = list(targets.items())
+        self.registry_version = registry.version
+        if not self.targets:
+            # Only hot keys get warmed until the registry has offices
+            print(f"Error: cache warmer {self.name} has no corridors: the post office registry "
+                  f"(version {registry.version}) is empty; check POST_OFFICE_FILE ({registry.source or POST_OFFICE_FILE})")
+        self.cursor = 0
+        self.pass_fresh = 0
+        self.pass_started = time.monotonic()
+
+    def is_fresh(self, key):
+        remaining = self.cache.expires_in(key)
+        return remaining is not None and remaining > self.lead
+
+    def lateness(self, key, now):
+        refreshed = self.last_refreshed.get(key)
+        if refreshed is None:
+            return 0.0
+        return max(0.0, now - (refreshed + self.cache.ttl - self.lead))
+
+    async def refresh(self, key, args):
+        """Refreshes one key; returns True if the cache now holds a fresh value."""
+        now = time.monotonic()
+        self.lag = max(self.lag, self.lateness(key, now))
+        await self.fetch(*args, refresh=True)
+        ok = self.is_fresh(key)
+        warmer_refreshes.inc(self.name, "ok" if ok else "failed")
+        if ok:
+            self.last_refreshed[key] = now
+        return ok
+
+    def status(self):
+        return {
+            "targets": len(self.targets),
+            "cursor": self.cursor,
+            "coverage": self.coverage,
+            "hot_coverage": self.hot_coverage,
+            "lag_seconds": round(self.lag, 1),
+            "last_pass_seconds": self.last_pass_seconds,
+            "requests_per_minute": WARMER_RATES_PER_MINUTE[self.name]
+        }
+
+
+_seeded = {"version": None, "at": 0.0}
+
+
+def seed_geocode_cache():
+    """
+    Maps office names and pincodes to their registry coordinates in the geocode
+    cache (without overwriting real geocodes), so requests by office name land
+    on the same cache keys the warmer keeps fresh.
+    """
+    seeded = 0
+    for office in get_post_office_registry().offices.values():
+        coords = (office["Latitude"], office["Longitude"])
+        for name in (office.get("OfficeName"), office.get("Pincode")):
+            if name and geocode_cache.peek(name.strip().lower()) is None:
+                geocode_cache.set(name.strip().lower(), coords)
+                seeded += 1
+    _seeded["version"] = get_post_office_registry().version
+    _seeded["at"] = time.monotonic()
+    return seeded
+
+
+def _reseed_if_needed():
+    # Again after a registry reload, and before the seeded geocodes expire
+    if (_seeded["version"] != get_post_office_registry().version
+            or time.monotonic() - _seeded["at"] > geocode_cache.ttl / 2):
+        seed_geocode_cache()
+
+
+_kinds = {}
+_tasks = []
+
+
+def get_warmer_kinds():
+    if not _kinds:
+        if WEATHER_API_KEY:
+            _kinds["weather"] = WarmerKind("weather", weather_cache, fetch_weather_data_async,
+                                           "openweather", _point_target)
+        if AZURE_MAPS_KEY:
+            _kinds["traffic_flow"] = WarmerKind("traffic_flow", traffic_flow_cache, fetch_real_time_traffic_flow_async,
+                                                "azure_traffic_flow", _point_target)
+            _kinds["traffic_incidents"] = WarmerKind("traffic_incidents", traffic_incidents_cache,
+                                                     fetch_traffic_incidents_async, "azure_traffic_incident",
+                                                     _bbox_target)
+    return _kinds
+
+
+async def _pace(kind):
+    # While the provider's breaker is open, wait instead of burning requests on fast failures
+    breaker = get_breaker(kind.provider)
+    if breaker.state == OPEN:
+        await asyncio.sleep(max(0.0, breaker.opened_at + breaker.open_seconds - time.monotonic()))
+    await asyncio.sleep(kind.interval)
+
+
+async def _warm(kind):
+    while True:
+        round_started = time.monotonic()
+        kind.lag = 0.0
+        _reseed_if_needed()
+        kind.sync_targets()
+        version = kind.registry_version
+
+        # 1. Hot keys: whatever interactive requests asked for most recently
+        hot = demand.top(WARMER_HOT_KEYS, prefix=kind.name)
+        hot_fresh = 0
+        for (_, key), _, args in hot:
+            if kind.is_fresh(key):
+                hot_fresh += 1
+                continue
+            try:
+                hot_fresh += await kind.refresh(key, args)
+            except Exception as e:
+                print(f"Cache warmer failed to refresh {kind.name} {key}: {e}")
+            await _pace(kind)
+        kind.hot_coverage = round(hot_fresh / len(hot), 4) if hot else None
+
+        # 2. Continue the pass through the registry until the next round is due
+        worked = False
+        while kind.targets and time.monotonic() - round_started < WARMER_ROUND_SECONDS:
+            key, args = kind.targets[kind.cursor]
+            if kind.is_fresh(key):
+                kind.pass_fresh += 1
+            else:
+                worked = True
+                try:
+                    kind.pass_fresh += await kind.refresh(key, args)
+                except Exception as e:
+                    print(f"Cache warmer failed to refresh {kind.name} {key}: {e}")
+                await _pace(kind)
+            kind.cursor += 1
+            if kind.cursor >= len(kind.targets):
+                now = time.monotonic()
+                kind.coverage = round(kind.pass_fresh / len(kind.targets), 4)
+                kind.last_pass_seconds = round(now - kind.pass_started, 1)
+                kind.cursor = 0
+                kind.pass_fresh = 0
+                kind.pass_started = now
+                if not worked:
+                    break  # everything is fresh; wait for entries to approach expiry
+            if get_post_office_registry().version != version:
+                break  # registry reloaded; pick up the new offices
+        if not worked:
+            await asyncio.sleep(WARMER_IDLE_SECONDS)
+
+
+def start_cache_warmer():
+    """Starts one warmer task per configured provider on the running event loop."""
+    if _tasks:
+        return _tasks
+    print(f"Seeded {seed_geocode_cache()} office geocodes from the post office registry")
+    for kind in get_warmer_kinds().values():
+        _tasks.append(asyncio.get_running_loop().create_task(_warm(kind), name=f"cache-warmer-{kind.name}"))
+    return _tasks
+
+
+async def stop_cache_warmer():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+
+
+def get_warmer_status():
+    return {name: kind.status() for name, kind in get_warmer_kinds().items()}
+
+
+CallbackMetric("cache_warmer_lag_seconds", "How late the warmer refreshed entries in its last round.", "gauge",
+               ("kind",), lambda: [((name,), kind.lag) for name, kind in _kinds.items()])
+CallbackMetric("cache_warmer_coverage_ratio", "Share of warmer targets fresh in the cache.", "gauge",
+               ("kind", "scope"),
+               lambda: [((name, "registry"), kind.coverage) for name, kind in _kinds.items() if kind.coverage is not None]
+               + [((name, "hot"), kind.hot_coverage) for name, kind in _kinds.items() if kind.hot_coverage is not None])
+CallbackMetric("cache_warmer_targets", "Registry targets per warmer.", "gauge",
+               ("kind",), lambda: [((name,), len(kind.targets)) for name, kind in _kinds.items()])
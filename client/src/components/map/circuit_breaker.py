@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+from collections import deque
+
+from metrics import CallbackMetric, Counter
+
+# --- Per-provider circuit breakers ---
+#
+# Each upstream provider has a breaker that watches the error rate over a
+# rolling time window. Once it crosses BREAKER_ERROR_RATE (with at least
+# BREAKER_MIN_CALLS calls in the window) the breaker opens and calls fail
+# fast with CircuitOpenError for BREAKER_OPEN_SECONDS. After that a single
+# trial call is let through (half-open): success closes the breaker,
+# failure opens it again.
+
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_WINDOW_SECONDS = float(os.getenv("BREAKER_WINDOW_SECONDS", "30"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider whose breaker is open."""
+
+    def __init__(self, provider, retry_after):
+        super().__init__(f"Circuit breaker open for {provider}; retry in {retry_after:.0f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+breaker_rejections = Counter("circuit_breaker_rejections_total", "Calls rejected by an open breaker.", ("provider",))
+breaker_transitions = Counter("circuit_breaker_transitions_total", "Breaker state changes.", ("provider", "state"))
+
+
+class CircuitBreaker:
+    def __init__(self, name, error_rate=BREAKER_ERROR_RATE, min_calls=BREAKER_MIN_CALLS,
+                 window_seconds=BREAKER_WINDOW_SECONDS, open_seconds=BREAKER_OPEN_SECONDS):
+        self.name = name
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._trial_started = 0.0
+        self._calls = deque()  # (monotonic time, failed)
+        self._failures = 0
+        self._lock = threading.Lock()
+
+    def _trim(self, now):
+        cutoff = now - self.window_seconds
+        while self._calls and self._calls[0][0] < cutoff:
+            _, failed = self._calls.popleft()
+            self._failures -= failed
+
+    def _transition(self, state, now):
+        self.state = state
+        if state == OPEN:
+            self.opened_at = now
+        elif state == CLOSED:
+            self._calls.clear()
+            self._failures = 0
+        breaker_transitions.inc(self.name, state)
+        print(f"Circuit breaker for {self.name} is now {state}")
+
+    def before_call(self):
+        """Raises CircuitOpenError if the call should not be made."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN:
+                remaining = self.opened_at + self.open_seconds - now
+                if remaining > 0:
+                    breaker_rejections.inc(self.name)
+                    raise CircuitOpenError(self.name, remaining)
+                self._transition(HALF_OPEN, now)
+            # Half-open: one trial at a time; a trial that never reports back
+            # (e.g. a cancelled hedge) stops blocking after open_seconds
+            if self._trial_started and now - self._trial_started < self.open_seconds:
+                breaker_rejections.inc(self.name)
+                raise CircuitOpenError(self.name, self.open_seconds - (now - self._trial_started))
+            self._trial_started = now
+
+    def record(self, failed):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._trial_started = 0.0
+                self._transition(OPEN if failed else CLOSED, now)
+                return
+            if self.state == OPEN:
+                return
+            self._calls.append((now, failed))
+            self._failures += failed
+            self._trim(now)
+            calls = len(self._calls)
+            if failed and calls >= self.min_calls and self._failures / calls >= self.error_rate:
+                self._transition(OPEN, now)
+
+    def status(self):
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            calls = len(self._calls)
+            return {
+                "state": self.state,
+                "calls_in_window": calls,
+                "error_rate": round(self._failures / calls, 3) if calls else 0.0,
+                "retry_after_seconds": round(max(0.0, self.opened_at + self.open_seconds - now), 1)
+                if self.state == OPEN else None
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(provider):
+    """Returns the breaker for a provider, creating it on first use."""
+    breaker = _breakers.get(provider)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(provider, CircuitBreaker(provider))
+    return breaker
+
+
+def get_breaker_status():
+    return {name: breaker.status() for name, breaker in sorted(_breakers.items())}
+
+
+CallbackMetric("circuit_breaker_state", "Breaker state per provider (0 closed, 1 half-open, 2 open).", "gauge",
+               ("provider",), lambda: [((name,), STATE_VALUES[b.state]) for name, b in sorted(_breakers.items())])
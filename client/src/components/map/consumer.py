@@ -0,0 +1,147 @@
+import os
+import socket
+import threading
+import time
+
+from event_codec import decode_event
+from event_transport import PARTITION_EOF, TransportError, create_consumer, transport_available
+from incident_index import incident_index
+from live_updates import apply_event
+from metrics import Counter, Histogram
+
+# --- Traffic / incident / weather event consumer ---
+#
+# Runs in a background thread of the map API, because the caches it updates
+# live in this process. Every API process reads all events, so each one
+# uses its own consumer group and starts from the latest offset; events
+# published while a process was down are covered by normal polling.
+#
+# Client errors from consume() (a broker restart, a network blip) are
+# retried with exponential backoff in the loop. If the thread still dies,
+# start_event_consumer() (also called by the /stream/status endpoint)
+# starts a new one.
+
+KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
+KAFKA_CONSUMER_ENABLED = os.getenv("KAFKA_CONSUMER_ENABLED", "false").lower() in ("1", "true", "yes")
+KAFKA_CONSUMER_GROUP = os.getenv("KAFKA_CONSUMER_GROUP", f"map-api-{socket.gethostname()}-{os.getpid()}")
+KAFKA_CONSUMER_BATCH = int(os.getenv("KAFKA_CONSUMER_BATCH", "500"))
+KAFKA_CONSUMER_RETRY_SECONDS = float(os.getenv("KAFKA_CONSUMER_RETRY_SECONDS", "0.5"))
+KAFKA_CONSUMER_RETRY_MAX_SECONDS = float(os.getenv("KAFKA_CONSUMER_RETRY_MAX_SECONDS", "30"))
+
+# Kind of event -> topic
+KAFKA_TOPICS = {
+    "traffic_flow": os.getenv("KAFKA_TRAFFIC_FLOW_TOPIC", "traffic-flow"),
+    "traffic_incidents": os.getenv("KAFKA_TRAFFIC_INCIDENTS_TOPIC", "traffic-incidents"),
+    "weather": os.getenv("KAFKA_WEATHER_TOPIC", "weather"),
+}
+
+events_consumed = Counter("kafka_events_consumed_total", "Events read from the stream.", ("topic",))
+consumer_errors = Counter("kafka_consumer_errors_total", "Consumer errors by kind.", ("kind",))
+event_delay = Histogram("kafka_event_apply_delay_seconds",
+                        "Time from an event being published to it being applied to the caches.", ("topic",),
+                        buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+
+_thread = None
+_stop = threading.Event()
+_status = {"started_at": None, "last_event_at": None, "events": 0, "restarts": 0, "last_error": None}
+
+
+def _consume_loop(consumer):
+    kinds = {topic: kind for kind, topic in KAFKA_TOPICS.items()}
+    last_purge = time.monotonic()
+    retry_delay = KAFKA_CONSUMER_RETRY_SECONDS
+    try:
+        consumer.subscribe(list(kinds))
+        while not _stop.is_set():
+            try:
+                messages = consumer.consume(num_messages=KAFKA_CONSUMER_BATCH, timeout=0.5)
+            except TransportError as e:
+                consumer_errors.inc("transport")
+                _status["last_error"] = str(e)
+                print(f"Kafka consume failed, retrying in {retry_delay:.1f}s: {e}")
+                _stop.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, KAFKA_CONSUMER_RETRY_MAX_SECONDS)
+                continue
+            retry_delay = KAFKA_CONSUMER_RETRY_SECONDS
+            for message in messages:
+                error = message.error()
+                if error is not None:
+                    if error.code() != PARTITION_EOF:
+                        consumer_errors.inc("kafka")
+                        print(f"Kafka consumer error: {error}")
+                    continue
+                topic = message.topic()
+                try:
+                    event = decode_event(message.value())
+                except Exception as e:
+                    consumer_errors.inc("decode")
+                    print(f"Could not decode event on {topic}: {e}")
+                    continue
+                apply_event(kinds[topic], event)
+                events_consumed.inc(topic)
+                _status["events"] += 1
+                _status["last_event_at"] = time.time()
+                timestamp_type, timestamp_ms = message.timestamp()
+                if timestamp_ms > 0:
+                    event_delay.observe(topic, value=max(0.0, time.time() - timestamp_ms / 1000))
+            if time.monotonic() - last_purge > 60:
+                incident_index.purge()
+                last_purge = time.monotonic()
+    except Exception as e:
+        consumer_errors.inc("fatal")
+        _status["last_error"] = str(e)
+        print(f"Kafka consumer stopped: {e}")
+    finally:
+        consumer.close()
+
+
+def start_event_consumer():
+    """Starts the consumer thread if enabled and confluent-kafka is installed, or restarts it if it died."""
+    global _thread
+    if _thread is not None:
+        if _thread.is_alive():
+            return _thread
+        _status["restarts"] += 1
+        print("Kafka consumer thread had stopped; starting a new one.")
+    if not KAFKA_CONSUMER_ENABLED:
+        return None
+    if not transport_available():
+        # The consumer is optional; without it the caches are filled by polling only
+        print("KAFKA_CONSUMER_ENABLED is set but confluent-kafka is not installed; event consumer not started.")
+        return None
+    consumer = create_consumer({
+        'bootstrap.servers': KAFKA_BOOTSTRAP_SERVERS,
+        'group.id': KAFKA_CONSUMER_GROUP,
+        'auto.offset.reset': 'latest',
+        'enable.auto.commit': False,  # offsets are never reused; each process starts from the latest
+        'fetch.wait.max.ms': 100,
+    })
+    _stop.clear()
+    _status["started_at"] = time.time()
+    _thread = threading.Thread(target=_consume_loop, args=(consumer,), name="kafka-event-consumer", daemon=True)
+    _thread.start()
+    return _thread
+
+
+def stop_event_consumer():
+    global _thread
+    if _thread is None:
+        return
+    _stop.set()
+    _thread.join(timeout=10)
+    _thread = None
+
+
+def get_consumer_status():
+    return {
+        "enabled": KAFKA_CONSUMER_ENABLED,
+        "running": _thread is not None and _thread.is_alive(),
+        "group": KAFKA_CONSUMER_GROUP,
+        "topics": KAFKA_TOPICS,
+        "events": _status["events"],
+        "started_at": _status["started_at"],
+        "last_event_at": _status["last_event_at"],
+        "restarts": _status["restarts"],
+        "last_error": _status["last_error"],
+        "live_incidents": len(incident_index),
+    }
@@ -1,39 +1,234 @@
+import asyncio
+import httpx
 import requests
 import os
+import time
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
+from cache import DemandCounter, LastKnownGood, TTLCache
+from circuit_breaker import get_breaker
+from metrics import Counter, Histogram
+from timetable import MODES, get_timetable
+
 load_dotenv() 
 
 AZURE_MAPS_KEY = os.getenv("AZURE_MAPS_KEY")
 WEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
+IST = timezone(timedelta(hours=5, minutes=30))
 
+# Provider base URLs can be overridden, e.g. to point at a local stub for benchmarks
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+AZURE_MAPS_URL = os.getenv("AZURE_MAPS_URL", "https://atlas.microsoft.com")
+OPENWEATHER_URL = os.getenv("OPENWEATHER_URL", "https://api.openweathermap.org")
+UPSTREAM_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_TIMEOUT_SECONDS", "15"))
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "200"))
 
-def geocode_location(location_name):
-    base_url = "https://nominatim.openstreetmap.org/search"
+# Process-wide caches shared by all requests. Only successful responses are cached;
+# coordinates are rounded to ~100 m so nearby lookups share an entry.
+geocode_cache = TTLCache(maxsize=10000, ttl=int(os.getenv("GEOCODE_CACHE_TTL_SECONDS", "86400")), name="geocode")
+traffic_flow_cache = TTLCache(maxsize=5000, ttl=int(os.getenv("TRAFFIC_FLOW_CACHE_TTL_SECONDS", "60")), name="traffic_flow")
+traffic_incidents_cache = TTLCache(maxsize=2000, ttl=int(os.getenv("TRAFFIC_INCIDENTS_CACHE_TTL_SECONDS", "120")), name="traffic_incidents")
+weather_cache = TTLCache(maxsize=5000, ttl=int(os.getenv("WEATHER_CACHE_TTL_SECONDS", "600")), name="weather")
+
+# Recent interactive demand per cache key; the cache warmer refreshes the hottest keys first
+demand = DemandCounter(maxsize=int(os.getenv("DEMAND_TRACKED_KEYS", "5000")),
+                       half_life=int(os.getenv("DEMAND_HALF_LIFE_SECONDS", "1800")))
+
+# Last successful value per cache key, served with a stale_since marker when a provider fails
+last_known_good = LastKnownGood(maxsize=int(os.getenv("LAST_KNOWN_GOOD_MAXSIZE", "20000")))
+
+def point_key(lat, lon):
+    return (round(lat, 3), round(lon, 3))
+
+def bbox_key(bbox, incident_type=None):
+    return tuple(round(v, 3) for v in bbox) + (incident_type,)
+
+# --- Upstream HTTP ---
+# Every provider call goes through upstream_get_json (blocking, for scripts and sync
+# code) or upstream_get_json_async (shared httpx client, for the async API path).
+
+_async_client = None
+
+def get_async_client():
+    """Returns the shared httpx.AsyncClient, creating it on first use."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            timeout=UPSTREAM_TIMEOUT_SECONDS,
+            limits=httpx.Limits(max_connections=UPSTREAM_MAX_CONNECTIONS,
+                                max_keepalive_connections=UPSTREAM_MAX_CONNECTIONS)
+        )
+    return _async_client
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+upstream_latency = Histogram(
+    "upstream_request_duration_seconds", "Upstream provider call latency.", ("provider", "outcome")
+)
+upstream_errors = Counter("upstream_errors_total", "Failed upstream provider calls.", ("provider", "kind"))
+
+def _error_kind(e):
+    status_code = getattr(getattr(e, "response", None), "status_code", None)
+    if status_code is not None:
+        return f"http_{status_code // 100}xx"
+    if isinstance(e, (requests.exceptions.Timeout, httpx.TimeoutException)):
+        return "timeout"
+    if isinstance(e, (requests.exceptions.ConnectionError, httpx.TransportError)):
+        return "connection"
+    return "other"
+
+upstream_hedges = Counter("upstream_hedged_requests_total", "Hedged upstream requests by winner.", ("provider", "winner"))
+stale_responses = Counter("stale_responses_total", "Last known good values served after a provider failure.", ("kind",))
+
+def _is_provider_failure(e):
+    """Errors that count against a provider's breaker; other 4xx are the caller's fault."""
+    status_code = getattr(getattr(e, "response", None), "status_code", None)
+    if status_code is not None:
+        return status_code >= 500 or status_code == 429
+    return True
+
+def _record_upstream(provider, started, error=None):
+    upstream_latency.observe(provider, "error" if error else "ok", value=time.perf_counter() - started)
+    if error is not None:
+        upstream_errors.inc(provider, _error_kind(error))
+    get_breaker(provider).record(error is not None and _is_provider_failure(error))
+
+def upstream_get_json(provider, url, params=None, headers=None):
+    get_breaker(provider).before_call()
+    started = time.perf_counter()
+    try:
+        response = requests.get(url, params=params, headers=headers, timeout=UPSTREAM_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        data = response.json()
+    except Exception as e:
+        _record_upstream(provider, started, e)
+        raise
+    _record_upstream(provider, started)
+    return data
+
+async def upstream_get_json_async(provider, url, params=None, headers=None):
+    get_breaker(provider).before_call()
+    started = time.perf_counter()
+    try:
+        response = await get_async_client().get(url, params=params, headers=headers)
+        response.raise_for_status()
+        data = response.json()
+    except Exception as e:
+        _record_upstream(provider, started, e)
+        raise
+    _record_upstream(provider, started)
+    return data
+
+async def hedged_get_json_async(provider, url, params=None, headers=None, hedge_after=None):
+    """
+    upstream_get_json_async that sends a second identical request if the first
+    has not answered within hedge_after seconds, and returns whichever succeeds
+    first. The slower request is cancelled. hedge_after=None disables hedging.
+    """
+    if not hedge_after:
+        return await upstream_get_json_async(provider, url, params, headers)
+
+    primary = asyncio.ensure_future(upstream_get_json_async(provider, url, params, headers))
+    done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+    if done:
+        return primary.result()
+
+    hedge = asyncio.ensure_future(upstream_get_json_async(provider, url, params, headers))
+    pending = {primary, hedge}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    upstream_hedges.inc(provider, "hedge" if task is hedge else "primary")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+def remember(kind, key, value, store=last_known_good):
+    store.set((kind, key), value)
+
+def _mark_stale(value, stale_since):
+    if isinstance(value, dict):
+        return dict(value, stale_since=stale_since)
+    if isinstance(value, list):
+        return [_mark_stale(item, stale_since) for item in value]
+    return value
+
+def stale_or(kind, key, default, store=last_known_good):
+    """
+    The last known good value for key marked with stale_since (when it was last
+    fetched successfully), or default if there is none.
+    """
+    entry = store.get((kind, key))
+    if entry is None:
+        return default
+    fetched_at, value = entry
+    stale_responses.inc(kind)
+    return _mark_stale(value, datetime.fromtimestamp(fetched_at, tz=timezone.utc).isoformat())
+
+# --- Geocoding ---
+
+def _geocode_request(location_name):
     params = {
         "q": location_name,
         "format": "json",
         "limit": 1
     }
+    return NOMINATIM_URL, params, {"User-Agent": "YourAppName/1.0"}
+
+def _parse_geocode(data, location_name):
+    if data and len(data) > 0:
+        return float(data[0]["lat"]), float(data[0]["lon"])
+    raise ValueError(f"No results found for {location_name}")
+
+def geocode_location(location_name):
+    key = location_name.strip().lower()
+    cached = geocode_cache.get(key)
+    if cached is not None:
+        return cached
+
+    url, params, headers = _geocode_request(location_name)
     try:
-        response = requests.get(base_url, params=params, headers={"User-Agent": "YourAppName/1.0"})
-        response.raise_for_status()
-        data = response.json()
-        if data and len(data) > 0:
-            lat = float(data[0]["lat"])
-            lon = float(data[0]["lon"])
-            return lat, lon
-        else:
-            raise ValueError(f"No results found for {location_name}")
+        lat, lon = _parse_geocode(upstream_get_json("nominatim", url, params, headers), location_name)
+        geocode_cache.set(key, (lat, lon))
+        remember("geocode", key, (lat, lon))
+        return lat, lon
+    except Exception as e:
+        print(f"Geocoding error: {e}")
+        return stale_or("geocode", key, (None, None))
+
+async def geocode_location_async(location_name):
+    key = location_name.strip().lower()
+    cached = geocode_cache.get(key)
+    if cached is not None:
+        return cached
+
+    url, params, headers = _geocode_request(location_name)
+    try:
+        lat, lon = _parse_geocode(await upstream_get_json_async("nominatim", url, params, headers), location_name)
+        geocode_cache.set(key, (lat, lon))
+        remember("geocode", key, (lat, lon))
+        return lat, lon
     except Exception as e:
         print(f"Geocoding error: {e}")
-        return None, None
+        return stale_or("geocode", key, (None, None))
 
 def generate_bounding_box(lat, lon, delta=0.5):
     return [lon - delta, lat - delta, lon + delta, lat + delta]
 
-def fetch_traffic_incidents(bbox, incident_type=None):
-    base_url = "https://atlas.microsoft.com/traffic/incident"
+# --- Traffic incidents ---
+
+def _traffic_incidents_request(bbox, incident_type=None):
     params = {
         "api-version": "2025-01-01",
         "bbox": ",".join(map(str, bbox)),
@@ -41,43 +236,81 @@ def fetch_traffic_incidents(bbox, incident_type=None):
     }
     if incident_type:
         params["incidentType"] = incident_type
+    return f"{AZURE_MAPS_URL}/traffic/incident", params
 
-    try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        features = data.get("features", [])
-        results = []
-
-        for feature in features:
-            geometry = feature.get("geometry", {})
-            properties = feature.get("properties", {})
-            result = {
-                "location": geometry.get("coordinates", []),
-                "type": properties.get("incidentType"),
-                "title": properties.get("title"),
-                "description": properties.get("description"),
-                "start_time": properties.get("startTime"),
-                "end_time": properties.get("endTime"),
-                "severity": properties.get("severity"),
-                "isRoadClosed": properties.get("isRoadClosed"),
-                "isTrafficJam": properties.get("isTrafficJam"),
-                "delay": properties.get("delay"),
-                "end_point": properties.get("endPoint", {}).get("coordinates", [])
-            }
-            results.append(result)
+def _parse_traffic_incidents(data):
+    features = data.get("features", [])
+    results = []
+
+    for feature in features:
+        geometry = feature.get("geometry", {})
+        properties = feature.get("properties", {})
+        result = {
+            "location": geometry.get("coordinates", []),
+            "type": properties.get("incidentType"),
+            "title": properties.get("title"),
+            "description": properties.get("description"),
+            "start_time": properties.get("startTime"),
+            "end_time": properties.get("endTime"),
+            "severity": properties.get("severity"),
+            "isRoadClosed": properties.get("isRoadClosed"),
+            "isTrafficJam": properties.get("isTrafficJam"),
+            "delay": properties.get("delay"),
+            "end_point": properties.get("endPoint", {}).get("coordinates", [])
+        }
+        results.append(result)
+
+    return results
 
+def fetch_traffic_incidents(bbox, incident_type=None):
+    key = bbox_key(bbox, incident_type)
+    demand.record(("traffic_incidents", key), (bbox, incident_type))
+    cached = traffic_incidents_cache.get(key)
+    if cached is not None:
+        return cached
+
+    url, params = _traffic_incidents_request(bbox, incident_type)
+    try:
+        results = _parse_traffic_incidents(upstream_get_json("azure_traffic_incident", url, params))
+        traffic_incidents_cache.set(key, results)
+        remember("traffic_incidents", key, results)
         return results
 
     except requests.exceptions.RequestException as e:
         print(f"Traffic Incident API request failed: {str(e)}")
-        return {"error": "request_failed", "status_code": response.status_code}
+        status_code = e.response.status_code if e.response is not None else None
+        return stale_or("traffic_incidents", key, {"error": "request_failed", "status_code": status_code})
     except Exception as e:
         print(f"Unexpected error: {str(e)}")
-        return {"error": str(e)}
+        return stale_or("traffic_incidents", key, {"error": str(e)})
 
-def fetch_real_time_traffic_flow(lat, lon):
-    base_url = "https://atlas.microsoft.com/traffic/flow/segment/json"
+async def fetch_traffic_incidents_async(bbox, incident_type=None, refresh=False):
+    """refresh=True skips the cache read and demand tracking (used by the cache warmer)."""
+    key = bbox_key(bbox, incident_type)
+    if not refresh:
+        demand.record(("traffic_incidents", key), (bbox, incident_type))
+        cached = traffic_incidents_cache.get(key)
+        if cached is not None:
+            return cached
+
+    url, params = _traffic_incidents_request(bbox, incident_type)
+    try:
+        results = _parse_traffic_incidents(await upstream_get_json_async("azure_traffic_incident", url, params))
+        traffic_incidents_cache.set(key, results)
+        remember("traffic_incidents", key, results)
+        return results
+
+    except httpx.HTTPError as e:
+        print(f"Traffic Incident API request failed: {str(e)}")
+        status_code = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+        return stale_or("traffic_incidents", key, {"error": "request_failed", "status_code": status_code})
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        return stale_or("traffic_incidents", key, {"error": str(e)})
+
+# --- Traffic flow ---
+
+def _traffic_flow_request(lat, lon):
     params = {
         "api-version": "1.0",
         "subscription-key": AZURE_MAPS_KEY,
@@ -86,29 +319,71 @@ def fetch_real_time_traffic_flow(lat, lon):
         "style": "relative",
         "format": "json"
     }
+    return f"{AZURE_MAPS_URL}/traffic/flow/segment/json", params
+
+def _parse_traffic_flow(data, lat, lon):
+    segment = data.get("flowSegmentData", {})
+    if not segment:
+        return None
+
+    return {
+        "location": {"lat": lat, "lon": lon},
+        "current_speed_kmh": segment.get("currentSpeed", 0),
+        "free_flow_speed_kmh": segment.get("freeFlowSpeed", 0),
+        "congestion_level": calculate_congestion_level(segment),
+        "confidence": segment.get("confidence", "unknown"),
+        "road_closure": segment.get("roadClosure", False)
+    }
+
+NO_TRAFFIC_FLOW = {"message": "No traffic flow data available for this location."}
+
+def fetch_real_time_traffic_flow(lat, lon):
+    key = point_key(lat, lon)
+    demand.record(("traffic_flow", key), (lat, lon))
+    cached = traffic_flow_cache.get(key)
+    if cached is not None:
+        return cached
+
+    url, params = _traffic_flow_request(lat, lon)
     try:
-        response = requests.get(base_url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        segment = data.get("flowSegmentData", {})
-        if not segment:
-            return {"message": "No traffic flow data available for this location."}
-
-        return {
-            "location": {"lat": lat, "lon": lon},
-            "current_speed_kmh": segment.get("currentSpeed", 0),
-            "free_flow_speed_kmh": segment.get("freeFlowSpeed", 0),
-            "congestion_level": calculate_congestion_level(segment),
-            "confidence": segment.get("confidence", "unknown"),
-            "road_closure": segment.get("roadClosure", False)
-        }
+        result = _parse_traffic_flow(upstream_get_json("azure_traffic_flow", url, params), lat, lon)
+        if result is None:
+            return dict(NO_TRAFFIC_FLOW)
+        traffic_flow_cache.set(key, result)
+        remember("traffic_flow", key, result)
+        return result
 
     except requests.exceptions.RequestException as e:
         print(f"Traffic flow API request failed: {str(e)}")
-        return {"error": "request_failed", "message": str(e)}
+        return stale_or("traffic_flow", key, {"error": "request_failed", "message": str(e)})
     except Exception as e:
         print(f"Unexpected error fetching traffic flow: {str(e)}")
-        return {"error": str(e)}
+        return stale_or("traffic_flow", key, {"error": str(e)})
+
+async def fetch_real_time_traffic_flow_async(lat, lon, refresh=False):
+    """refresh=True skips the cache read and demand tracking (used by the cache warmer)."""
+    key = point_key(lat, lon)
+    if not refresh:
+        demand.record(("traffic_flow", key), (lat, lon))
+        cached = traffic_flow_cache.get(key)
+        if cached is not None:
+            return cached
+
+    url, params = _traffic_flow_request(lat, lon)
+    try:
+        result = _parse_traffic_flow(await upstream_get_json_async("azure_traffic_flow", url, params), lat, lon)
+        if result is None:
+            return dict(NO_TRAFFIC_FLOW)
+        traffic_flow_cache.set(key, result)
+        remember("traffic_flow", key, result)
+        return result
+
+    except httpx.HTTPError as e:
+        print(f"Traffic flow API request failed: {str(e)}")
+        return stale_or("traffic_flow", key, {"error": "request_failed", "message": str(e)})
+    except Exception as e:
+        print(f"Unexpected error fetching traffic flow: {str(e)}")
+        return stale_or("traffic_flow", key, {"error": str(e)})
 
 def calculate_congestion_level(segment):
     try:
@@ -130,38 +405,102 @@ def deg_to_compass(deg):
     ix = int((deg / 22.5) + 0.5) % 16
     return directions[ix]
 
+# --- Weather ---
+
+def _weather_request(lat, lon):
+    params = {
+        "lat": lat,
+        "lon": lon,
+        "appid": WEATHER_API_KEY,
+        "units": "metric"
+    }
+    return f"{OPENWEATHER_URL}/data/2.5/weather", params
+
+def _parse_weather(data, lat, lon):
+    weather = data.get('weather', [{}])[0].get('main', 'Clear')
+    temperature = data.get('main', {}).get('temp')  # °C
+    wind_speed_ms = data.get('wind', {}).get('speed')  # m/s
+    wind_speed_kmh = round(wind_speed_ms * 3.6, 1) if wind_speed_ms is not None else None
+    wind_deg = data.get('wind', {}).get('deg')
+    wind_direction = deg_to_compass(wind_deg) if wind_deg is not None else None
+    risk = "high" if weather and weather.lower() in ["thunderstorm", "rain", "snow"] else "low"
+    return {
+        "lat": lat,
+        "lon": lon,
+        "weather": weather,
+        "temperature": temperature,  # °C
+        "windSpeed": wind_speed_kmh,  # km/h
+        "windDirection": wind_direction,
+        "risk": risk
+    }
+
+def unknown_weather(lat, lon):
+    """Weather result when the provider fails and nothing is cached; same keys as a parsed one."""
+    return {"lat": lat, "lon": lon, "weather": "Unknown", "temperature": None, "windSpeed": None,
+            "windDirection": None, "risk": "unknown"}
+
 def fetch_weather_data(lat, lon):
-    url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={WEATHER_API_KEY}&units=metric"
+    key = point_key(lat, lon)
+    demand.record(("weather", key), (lat, lon))
+    cached = weather_cache.get(key)
+    if cached is not None:
+        return cached
+
+    url, params = _weather_request(lat, lon)
     try:
-        response = requests.get(url)
-        data = response.json()
-        weather = data.get('weather', [{}])[0].get('main', 'Clear')
-        temperature = data.get('main', {}).get('temp')  # °C
-        wind_speed_ms = data.get('wind', {}).get('speed')  # m/s
-        wind_speed_kmh = round(wind_speed_ms * 3.6, 1) if wind_speed_ms is not None else None
-        wind_deg = data.get('wind', {}).get('deg')
-        wind_direction = deg_to_compass(wind_deg) if wind_deg is not None else None
-        risk = "high" if weather and weather.lower() in ["thunderstorm", "rain", "snow"] else "low"
-        return {
-            "lat": lat,
-            "lon": lon,
-            "weather": weather,
-            "temperature": temperature,  # °C
-            "windSpeed": wind_speed_kmh,  # km/h
-            "windDirection": wind_direction,
-            "risk": risk
-        }
+        data = upstream_get_json("openweather", url, params)
+        result = _parse_weather(data, lat, lon)
+        if "main" in data:
+            weather_cache.set(key, result)
+            remember("weather", key, result)
+        return result
+    except Exception as e:
+        print("Weather API error:", e)
+        return stale_or("weather", key, unknown_weather(lat, lon))
+
+async def fetch_weather_data_async(lat, lon, refresh=False):
+    """refresh=True skips the cache read and demand tracking (used by the cache warmer)."""
+    key = point_key(lat, lon)
+    if not refresh:
+        demand.record(("weather", key), (lat, lon))
+        cached = weather_cache.get(key)
+        if cached is not None:
+            return cached
+
+    url, params = _weather_request(lat, lon)
+    try:
+        data = await upstream_get_json_async("openweather", url, params)
+        result = _parse_weather(data, lat, lon)
+        if "main" in data:
+            weather_cache.set(key, result)
+            remember("weather", key, result)
+        return result
     except Exception as e:
         print("Weather API error:", e)
-        return {"lat": lat, "lon": lon, "weather": "Unknown", "risk": "unknown"}
+        return stale_or("weather", key, unknown_weather(lat, lon))
 
 def fetch_transport_schedules():
+    """Summarises the rail and air mail timetable: service count and next departure per mode."""
     try:
-        railway_schedules = {
-            "status": "on time",
-            "next_departure": "2023-10-10T10:00:00Z"
-        }
-        return {"rail": railway_schedules}
+        timetable = get_timetable()
+        now = datetime.now(IST)
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        window = timetable.window(now.weekday())
+        first = timetable.first_departure_index(now.weekday(), int((now - midnight).total_seconds()))
+        schedules = {}
+        for mode_index, mode in enumerate(MODES):
+            services = sum(1 for service in timetable.services if service["mode"] == mode)
+            next_departure = None
+            for c in range(first, len(window["departure"])):
+                if window["mode"][c] == mode_index:
+                    next_departure = (midnight + timedelta(seconds=window["departure"][c])).isoformat()
+                    break
+            schedules[mode] = {
+                "status": "scheduled" if next_departure else "unavailable",
+                "services": services,
+                "next_departure": next_departure
+            }
+        return schedules
     except Exception as e:
         print(f"Error fetching transport schedules: {e}")
         return {"rail": {"status": "unknown"}}
@@ -0,0 +1,282 @@
+import json
+import os
+import struct
+
+# --- Compact binary encoding for stream events ---
+#
+# Event layouts are declared in a local schema registry (event_schemas.json).
+# An encoded event is:
+#
+#   magic byte 0xC5 | schema id (uint16) | null bitmap | fixed-width fields | variable-width fields
+#
+# The schema id names both the event type and its version, so a consumer
+# always decodes with the schema the event was written with; new versions
+# get new ids and old ones stay in the registry while they may still be in
+# flight. All fixed-width fields (f64, f32, i32, bool, enum) are packed with
+# one precompiled struct; strings, geometries and json values (for loosely
+# typed fields, e.g. a number or "unknown") follow as varint-length prefixed
+# data. Decoding reads straight from a memoryview of the message.
+#
+# Encoding is lossless or fails: a key the schema does not declare, an enum
+# value outside its symbols or a value of the wrong type raises ValueError
+# rather than being dropped or sent as null. An f32 field only takes numbers
+# that f32 holds exactly, so measurements use f64. Fields marked "optional" are
+# left out of the decoded event when they were absent.
+# Anything that does not start with the magic byte is treated as JSON, so
+# JSON and binary producers can share a topic during a migration.
+
+EVENT_SCHEMA_FILE = os.getenv("EVENT_SCHEMA_FILE",
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), "event_schemas.json"))
+
+MAGIC = 0xC5
+_HEADER = struct.Struct("<BH")
+_POINT = struct.Struct("<dd")
+FIXED_FORMATS = {"f64": "d", "f32": "f", "i32": "i", "bool": "?", "enum": "B"}
+VARIABLE_TYPES = ("string", "geometry", "json")
+_F32 = struct.Struct("<f")
+
+GEOMETRY_POINT = 0
+GEOMETRY_LINE = 1
+
+
+def _varint(value):
+    if value < 0x80:
+        return bytes((value,))
+    out = bytearray()
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _read_varint(view, offset):
+    value = shift = 0
+    while True:
+        byte = view[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def _get(event, path):
+    for part in path:
+        if not isinstance(event, dict):
+            return None
+        event = event.get(part)
+    return event
+
+
+def _set(event, path, value):
+    for part in path[:-1]:
+        event = event.setdefault(part, {})
+    event[path[-1]] = value
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class Schema:
+    def __init__(self, spec):
+        self.id = spec["id"]
+        self.name = spec["name"]
+        self.version = spec["version"]
+        self.fields = []  # (path, type, symbols)
+        self.optional = set()  # indexes of fields left out of decoded events when absent
+        self.shape = {}  # nested field names; True marks a field
+        for i, field in enumerate(spec["fields"]):
+            if field["type"] not in FIXED_FORMATS and field["type"] not in VARIABLE_TYPES:
+                raise ValueError(f"Schema {self.name} v{self.version}: unknown type {field['type']}")
+            path = tuple(field["name"].split("."))
+            self.fields.append((path, field["type"], field.get("symbols")))
+            if field.get("optional"):
+                self.optional.add(i)
+            node = self.shape
+            for part in path[:-1]:
+                node = node.setdefault(part, {})
+            node[path[-1]] = True
+        # Per field: (index, path, type, symbols, bitmap byte, bitmap bit), split by encoding
+        layout = [(i, path, kind, symbols, i >> 3, 1 << (i & 7)) for i, (path, kind, symbols) in enumerate(self.fields)]
+        self.fixed = [field for field in layout if field[2] in FIXED_FORMATS]
+        self.variable = [field for field in layout if field[2] in VARIABLE_TYPES]
+        self.fixed_struct = struct.Struct("<" + "".join(FIXED_FORMATS[field[2]] for field in self.fixed))
+        self.bitmap_size = (len(self.fields) + 7) // 8
+        self.symbol_index = {i: {symbol: n for n, symbol in enumerate(symbols)}
+                             for i, (_, kind, symbols) in enumerate(self.fields) if kind == "enum"}
+
+    def _mismatch(self, path, value):
+        return ValueError(f"Schema {self.name} v{self.version}: {'.'.join(path)} cannot hold {value!r}")
+
+    def _check_keys(self, event, shape, prefix=()):
+        for key, value in event.items():
+            node = shape.get(key)
+            if node is None:
+                raise ValueError(f"Schema {self.name} v{self.version} has no field {'.'.join(prefix + (key,))}")
+            if node is not True and value is not None:
+                if not isinstance(value, dict):
+                    raise self._mismatch(prefix + (key,), value)
+                self._check_keys(value, node, prefix + (key,))
+
+    def _fixed_value(self, index, path, kind, value):
+        """Value to pack for a fixed-width field, or None if it is missing; raises if it does not fit the type."""
+        if value is None:
+            return None
+        if kind == "f64":
+            if _is_number(value):
+                return float(value)
+        elif kind == "f32":
+            if _is_number(value):
+                try:
+                    if _F32.unpack(_F32.pack(value))[0] == value:
+                        return float(value)
+                except OverflowError:
+                    pass
+        elif kind == "i32":
+            if _is_number(value) and value == int(value) and -2 ** 31 <= value < 2 ** 31:
+                return int(value)
+        elif kind == "bool":
+            if isinstance(value, bool):
+                return value
+        elif isinstance(value, str) and value in self.symbol_index[index]:
+            return self.symbol_index[index][value]
+        raise self._mismatch(path, value)
+
+    def encode(self, event):
+        if not isinstance(event, dict):
+            raise ValueError(f"Schema {self.name} v{self.version}: expected an object, got {event!r}")
+        self._check_keys(event, self.shape)
+        bitmap = bytearray(self.bitmap_size)
+        fixed_values = []
+        for i, path, kind, _, byte, bit in self.fixed:
+            value = self._fixed_value(i, path, kind, event.get(path[0]) if len(path) == 1 else _get(event, path))
+            if value is None:
+                fixed_values.append(False if kind == "bool" else 0)
+            else:
+                bitmap[byte] |= bit
+                fixed_values.append(value)
+
+        variable = []
+        for i, path, kind, _, byte, bit in self.variable:
+            value = event.get(path[0]) if len(path) == 1 else _get(event, path)
+            if value is None:
+                continue
+            if kind == "string":
+                if not isinstance(value, str):
+                    raise self._mismatch(path, value)
+                data = value.encode("utf-8")
+                variable.append(_varint(len(data)) + data)
+            elif kind == "json":
+                data = json.dumps(value, separators=(",", ":")).encode("utf-8")
+                variable.append(_varint(len(data)) + data)
+            else:
+                if not isinstance(value, (list, tuple)):
+                    raise self._mismatch(path, value)
+                if not value or isinstance(value[0], (list, tuple)):
+                    points = [(p[0], p[1]) for p in value]
+                    variable.append(bytes([GEOMETRY_LINE]) + _varint(len(points)) +
+                                    struct.pack(f"<{2 * len(points)}d", *(c for p in points for c in p)))
+                else:
+                    variable.append(bytes([GEOMETRY_POINT]) + _POINT.pack(value[0], value[1]))
+            bitmap[byte] |= bit
+
+        return b"".join([_HEADER.pack(MAGIC, self.id), bytes(bitmap),
+                         self.fixed_struct.pack(*fixed_values)] + variable)
+
+    def decode(self, view, offset):
+        bitmap = view[offset:offset + self.bitmap_size]
+        offset += self.bitmap_size
+        fixed_values = self.fixed_struct.unpack_from(view, offset)
+        offset += self.fixed_struct.size
+
+        event = {}
+        optional = self.optional
+        for (i, path, kind, symbols, byte, bit), value in zip(self.fixed, fixed_values):
+            if not bitmap[byte] & bit:
+                if i in optional:
+                    continue
+                value = None
+            elif kind == "enum":
+                value = symbols[value]
+            if len(path) == 1:
+                event[path[0]] = value
+            else:
+                _set(event, path, value)
+
+        for i, path, kind, _, byte, bit in self.variable:
+            if not bitmap[byte] & bit:
+                if i in optional:
+                    continue
+                value = None
+            elif kind == "string":
+                length, offset = _read_varint(view, offset)
+                value = str(view[offset:offset + length], "utf-8")
+                offset += length
+            elif kind == "json":
+                length, offset = _read_varint(view, offset)
+                value = json.loads(view[offset:offset + length].tobytes())
+                offset += length
+            elif view[offset] == GEOMETRY_POINT:
+                value = list(_POINT.unpack_from(view, offset + 1))
+                offset += 1 + _POINT.size
+            else:
+                count, offset = _read_varint(view, offset + 1)
+                coords = struct.unpack_from(f"<{2 * count}d", view, offset)
+                value = [[coords[j], coords[j + 1]] for j in range(0, 2 * count, 2)]
+                offset += 16 * count
+            if len(path) == 1:
+                event[path[0]] = value
+            else:
+                _set(event, path, value)
+        return event
+
+
+class SchemaRegistry:
+    def __init__(self, specs):
+        self.by_id = {}
+        self.latest = {}
+        for spec in specs:
+            schema = Schema(spec)
+            if schema.id in self.by_id:
+                raise ValueError(f"Duplicate schema id {schema.id}")
+            self.by_id[schema.id] = schema
+            current = self.latest.get(schema.name)
+            if current is None or schema.version > current.version:
+                self.latest[schema.name] = schema
+
+    @classmethod
+    def from_file(cls, path=EVENT_SCHEMA_FILE):
+        with open(path) as f:
+            return cls(json.load(f)["schemas"])
+
+
+_registry = None
+
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        _registry = SchemaRegistry.from_file()
+    return _registry
+
+
+def encode_event(name, event):
+    """Encodes an event with the latest version of the named schema."""
+    schema = get_registry().latest.get(name)
+    if schema is None:
+        raise ValueError(f"No schema registered for {name}")
+    return schema.encode(event)
+
+
+def decode_event(data):
+    """Decodes a binary event with the schema it was written with; other payloads are parsed as JSON."""
+    view = memoryview(data)
+    if not view or view[0] != MAGIC:
+        return json.loads(data)
+    _, schema_id = _HEADER.unpack_from(view, 0)
+    schema = get_registry().by_id.get(schema_id)
+    if schema is None:
+        raise ValueError(f"Unknown event schema id {schema_id}")
+    return schema.decode(view, _HEADER.size)
@@ -0,0 +1,318 @@
+import os
+import threading
+import time
+import zlib
+from collections import deque
+
+try:
+    import confluent_kafka
+except ImportError:  # only needed for EVENT_TRANSPORT=kafka
+    confluent_kafka = None
+
+# --- Pluggable event transport ---
+#
+# producer.py and consumer.py get their clients from create_producer() /
+# create_consumer(). EVENT_TRANSPORT=kafka (default) returns confluent-kafka
+# clients; EVENT_TRANSPORT=memory returns clients backed by an in-process
+# partitioned log that behaves like a broker for the calls this code makes:
+# topics with a fixed number of partitions, keyed partitioning, per-partition
+# offsets, consumer groups sharing partitions, delivery callbacks served by
+# poll(), and a bounded local queue that raises BufferError when full.
+# Tests and benchmarks use it to run the event pipeline without a broker.
+
+EVENT_TRANSPORT = os.getenv("EVENT_TRANSPORT", "kafka")
+MEMORY_PARTITIONS = int(os.getenv("EVENT_MEMORY_PARTITIONS", "6"))
+MEMORY_RETENTION_MESSAGES = int(os.getenv("EVENT_MEMORY_RETENTION_MESSAGES", "1000000"))  # per partition
+
+if confluent_kafka is not None:
+    TransportError = confluent_kafka.KafkaException
+    PARTITION_EOF = confluent_kafka.KafkaError._PARTITION_EOF
+else:
+    class TransportError(Exception):
+        """Raised by the transport for client errors (stands in for KafkaException)."""
+
+    PARTITION_EOF = -191
+
+TIMESTAMP_CREATE_TIME = 1
+
+
+class Message:
+    """A record in the in-memory log, with the accessors of confluent_kafka.Message."""
+
+    __slots__ = ("_topic", "_partition", "_offset", "_key", "_value", "_timestamp")
+
+    def __init__(self, topic, partition, offset, key, value, timestamp):
+        self._topic = topic
+        self._partition = partition
+        self._offset = offset
+        self._key = key
+        self._value = value
+        self._timestamp = timestamp
+
+    def topic(self):
+        return self._topic
+
+    def partition(self):
+        return self._partition
+
+    def offset(self):
+        return self._offset
+
+    def key(self):
+        return self._key
+
+    def value(self):
+        return self._value
+
+    def timestamp(self):
+        return TIMESTAMP_CREATE_TIME, self._timestamp
+
+    def error(self):
+        return None
+
+
+def _to_bytes(value):
+    if value is None or isinstance(value, bytes):
+        return value
+    return value.encode("utf-8") if isinstance(value, str) else bytes(value)
+
+
+class _Partition:
+    def __init__(self):
+        self.messages = []
+        self.start_offset = 0  # offset of messages[0]; advances as retention drops old messages
+
+    @property
+    def end_offset(self):
+        return self.start_offset + len(self.messages)
+
+
+class InMemoryBroker:
+    """Topics of partitioned, offset-addressed logs shared by every client in the process."""
+
+    def __init__(self, partitions=MEMORY_PARTITIONS, retention=MEMORY_RETENTION_MESSAGES):
+        self.default_partitions = partitions
+        self.retention = retention
+        self._topics = {}
+        self._groups = {}     # group -> {"members": [consumer, ...], "committed": {(topic, partition): offset}}
+        self._round_robin = 0
+        self._cond = threading.Condition()
+
+    def create_topic(self, topic, partitions=None):
+        with self._cond:
+            if topic not in self._topics:
+                self._topics[topic] = [_Partition() for _ in range(partitions or self.default_partitions)]
+            return len(self._topics[topic])
+
+    def _partitions(self, topic):
+        partitions = self._topics.get(topic)
+        if partitions is None:
+            partitions = self._topics[topic] = [_Partition() for _ in range(self.default_partitions)]
+        return partitions
+
+    def append(self, topic, key, value, partition=None):
+        """Appends a record and returns the stored Message."""
+        with self._cond:
+            partitions = self._partitions(topic)
+            if partition is None:
+                if key is None:
+                    partition = self._round_robin % len(partitions)
+                    self._round_robin += 1
+                else:
+                    partition = zlib.crc32(key) % len(partitions)
+            log = partitions[partition]
+            message = Message(topic, partition, log.end_offset, key, value, int(time.time() * 1000))
+            log.messages.append(message)
+            if len(log.messages) > self.retention + self.retention // 10:
+                # Trim in chunks so appends stay O(1) amortized
+                dropped = len(log.messages) - self.retention
+                del log.messages[:dropped]
+                log.start_offset += dropped
+            self._cond.notify_all()
+        return message
+
+    def end_offsets(self, topic):
+        with self._cond:
+            return [p.end_offset for p in self._partitions(topic)]
+
+    # Consumer groups: partitions of the subscribed topics are spread over the group's members
+
+    def join(self, group, consumer):
+        with self._cond:
+            state = self._groups.setdefault(group, {"members": [], "committed": {}})
+            if consumer not in state["members"]:
+                state["members"].append(consumer)
+            self._rebalance(group)
+
+    def leave(self, group, consumer):
+        with self._cond:
+            state = self._groups.get(group)
+            if state and consumer in state["members"]:
+                state["members"].remove(consumer)
+                self._rebalance(group)
+
+    def group_size(self, group):
+        """Number of consumers currently in a group."""
+        with self._cond:
+            return len(self._groups.get(group, {}).get("members", []))
+
+    def _rebalance(self, group):
+        state = self._groups[group]
+        members = state["members"]
+        previous = {}
+        for member in members:
+            for topic_partition, position in member._assignment.items():
+                previous[(id(member), topic_partition)] = position
+            member._assignment = {}
+        topics = sorted({topic for member in members for topic in member._topics})
+        slot = 0
+        for topic in topics:
+            subscribers = [m for m in members if topic in m._topics]
+            for partition, log in enumerate(self._partitions(topic)):
+                member = subscribers[slot % len(subscribers)]
+                slot += 1
+                # A member keeping a partition keeps its position; others resume from the committed offset
+                committed = previous.get((id(member), (topic, partition)), state["committed"].get((topic, partition)))
+                if committed is None:
+                    committed = log.start_offset if member._reset == "earliest" else log.end_offset
+                member._assignment[(topic, partition)] = max(committed, log.start_offset)
+
+    def commit(self, group, offsets):
+        with self._cond:
+            self._groups.setdefault(group, {"members": [], "committed": {}})["committed"].update(offsets)
+
+    def fetch(self, consumer, max_messages, timeout):
+        """Returns up to max_messages from the consumer's assigned partitions, waiting up to timeout."""
+        deadline = time.monotonic() + max(timeout, 0)
+        with self._cond:
+            while True:
+                batch = []
+                for (topic, partition), position in consumer._assignment.items():
+                    log = self._topics[topic][partition]
+                    position = max(position, log.start_offset)
+                    take = min(log.end_offset - position, max_messages - len(batch))
+                    if take > 0:
+                        first = position - log.start_offset
+                        batch.extend(log.messages[first:first + take])
+                        position += take
+                    consumer._assignment[(topic, partition)] = position
+                    if len(batch) >= max_messages:
+                        break
+                remaining = deadline - time.monotonic()
+                if batch or remaining <= 0:
+                    return batch
+                self._cond.wait(remaining)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """The process-wide in-memory broker."""
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = InMemoryBroker()
+    return _broker
+
+
+class InMemoryProducer:
+    """Producer with the produce/poll/flush/len interface of confluent_kafka.Producer."""
+
+    def __init__(self, config, broker=None):
+        self.broker = broker or get_broker()
+        self.max_messages = int(config.get('queue.buffering.max.messages', 100000))
+        self._pending = deque()  # (callback, message) awaiting poll()
+        self._lock = threading.Lock()
+
+    def produce(self, topic, value=None, key=None, partition=None, callback=None, on_delivery=None):
+        with self._lock:
+            if len(self._pending) >= self.max_messages:
+                raise BufferError("Local: Queue full")
+        message = self.broker.append(topic, _to_bytes(key), _to_bytes(value), partition)
+        with self._lock:
+            self._pending.append((callback or on_delivery, message))
+
+    def poll(self, timeout=0):
+        """Serves delivery callbacks; returns how many were served."""
+        with self._lock:
+            delivered, self._pending = self._pending, deque()
+        if not delivered and timeout:
+            time.sleep(min(timeout, 0.01))
+        for callback, message in delivered:
+            if callback is not None:
+                callback(None, message)
+        return len(delivered)
+
+    def flush(self, timeout=None):
+        self.poll(0)
+        return len(self)
+
+    def __len__(self):
+        return len(self._pending)
+
+
+class InMemoryConsumer:
+    """Consumer with the subscribe/consume/poll/commit/close interface of confluent_kafka.Consumer."""
+
+    def __init__(self, config, broker=None):
+        self.broker = broker or get_broker()
+        self.group = config['group.id']
+        self._reset = config.get('auto.offset.reset', 'latest')
+        self._auto_commit = config.get('enable.auto.commit', True)
+        self._topics = []
+        self._assignment = {}  # (topic, partition) -> next offset to read
+        self._closed = False
+
+    def subscribe(self, topics):
+        self._topics = list(topics)
+        self.broker.join(self.group, self)
+
+    def assignment(self):
+        return sorted(self._assignment)
+
+    def consume(self, num_messages=1, timeout=-1):
+        if self._closed:
+            raise RuntimeError("Consumer closed")
+        batch = self.broker.fetch(self, num_messages, 3600 if timeout is None or timeout < 0 else timeout)
+        if batch and self._auto_commit:
+            self.commit(asynchronous=True)
+        return batch
+
+    def poll(self, timeout=-1):
+        batch = self.consume(1, timeout)
+        return batch[0] if batch else None
+
+    def commit(self, message=None, asynchronous=True):
+        if message is not None:
+            offsets = {(message.topic(), message.partition()): message.offset() + 1}
+        else:
+            offsets = dict(self._assignment)
+        self.broker.commit(self.group, offsets)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.broker.leave(self.group, self)
+
+
+def create_producer(config):
+    if EVENT_TRANSPORT == "memory":
+        return InMemoryProducer(config)
+    if confluent_kafka is None:
+        raise TransportError("confluent-kafka is not installed; set EVENT_TRANSPORT=memory to run without Kafka")
+    return confluent_kafka.Producer(config)
+
+
+def create_consumer(config):
+    if EVENT_TRANSPORT == "memory":
+        return InMemoryConsumer(config)
+    if confluent_kafka is None:
+        raise TransportError("confluent-kafka is not installed; set EVENT_TRANSPORT=memory to run without Kafka")
+    return confluent_kafka.Consumer(config)
+
+
+def transport_available():
+    return EVENT_TRANSPORT == "memory" or confluent_kafka is not None
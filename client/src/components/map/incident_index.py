@@ -0,0 +1,124 @@
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+
+# --- Live incident index ---
+#
+# Incidents received from the event stream, bucketed into a lat/lon grid so
+# "what is near this point / inside this bbox" is a handful of dict lookups.
+# Entries expire INCIDENT_TTL_SECONDS after their last update unless an
+# update or a clear event arrives first.
+
+INCIDENT_CELL_DEGREES = float(os.getenv("INCIDENT_CELL_DEGREES", "0.1"))
+INCIDENT_TTL_SECONDS = float(os.getenv("INCIDENT_TTL_SECONDS", "3600"))
+
+
+def incident_id(incident):
+    """Stable id for an incident: its own id if it has one, else a hash of title and location."""
+    if incident.get("id"):
+        return str(incident["id"])
+    key = f"{incident.get('title')}|{json.dumps(incident.get('location') or [])}"
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def incident_points(incident):
+    """(lat, lon) points of an incident located by a GeoJSON Point or LineString ([lon, lat] order)."""
+    location = incident.get("location") or []
+    if not location:
+        return []
+    if isinstance(location[0], (list, tuple)):
+        return [(point[1], point[0]) for point in location if len(point) >= 2]
+    return [(location[1], location[0])] if len(location) >= 2 else []
+
+
+def _cell(lat, lon):
+    return (math.floor(lat / INCIDENT_CELL_DEGREES), math.floor(lon / INCIDENT_CELL_DEGREES))
+
+
+class IncidentIndex:
+    def __init__(self, ttl=INCIDENT_TTL_SECONDS):
+        self.ttl = ttl
+        self._incidents = {}  # id -> (expires_at, incident, cells)
+        self._cells = {}      # cell -> set of ids
+        self._lock = threading.Lock()
+
+    def _remove(self, incident_key):
+        entry = self._incidents.pop(incident_key, None)
+        if entry is None:
+            return None
+        for cell in entry[2]:
+            ids = self._cells.get(cell)
+            if ids is not None:
+                ids.discard(incident_key)
+                if not ids:
+                    del self._cells[cell]
+        return entry[1]
+
+    def upsert(self, incident):
+        """Adds or replaces an incident; returns (id, the incident it replaced or None)."""
+        incident_key = incident_id(incident)
+        cells = {_cell(lat, lon) for lat, lon in incident_points(incident)}
+        with self._lock:
+            previous = self._remove(incident_key)
+            self._incidents[incident_key] = (time.monotonic() + self.ttl, incident, cells)
+            for cell in cells:
+                self._cells.setdefault(cell, set()).add(incident_key)
+        return incident_key, previous
+
+    def remove(self, incident):
+        """Removes an incident (matched by id); returns the removed incident or None."""
+        with self._lock:
+            return self._remove(incident_id(incident))
+
+    def in_bbox(self, bbox):
+        """Unexpired incidents with a point inside bbox = [min_lon, min_lat, max_lon, max_lat]."""
+        min_lon, min_lat, max_lon, max_lat = bbox[:4]
+        lo, hi = _cell(min_lat, min_lon), _cell(max_lat, max_lon)
+        now = time.monotonic()
+        found = []
+        with self._lock:
+            ids = set()
+            if (hi[0] - lo[0] + 1) * (hi[1] - lo[1] + 1) > len(self._cells):
+                for cell, cell_ids in self._cells.items():
+                    if lo[0] <= cell[0] <= hi[0] and lo[1] <= cell[1] <= hi[1]:
+                        ids.update(cell_ids)
+            else:
+                for row in range(lo[0], hi[0] + 1):
+                    for col in range(lo[1], hi[1] + 1):
+                        ids.update(self._cells.get((row, col), ()))
+            for incident_key in ids:
+                expires_at, incident, _ = self._incidents[incident_key]
+                if expires_at <= now:
+                    continue
+                if any(min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+                       for lat, lon in incident_points(incident)):
+                    found.append(incident)
+        return found
+
+    def near(self, lat, lon, radius_km):
+        delta_lat = radius_km / 111.0
+        delta_lon = radius_km / (111.0 * max(math.cos(math.radians(lat)), 0.01))
+        return self.in_bbox([lon - delta_lon, lat - delta_lat, lon + delta_lon, lat + delta_lat])
+
+    def values(self):
+        now = time.monotonic()
+        with self._lock:
+            return [incident for expires_at, incident, _ in self._incidents.values() if expires_at > now]
+
+    def purge(self):
+        """Drops expired incidents; returns how many were removed."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (expires_at, _, _) in self._incidents.items() if expires_at <= now]
+            for incident_key in expired:
+                self._remove(incident_key)
+        return len(expired)
+
+    def __len__(self):
+        return len(self._incidents)
+
+
+incident_index = IncidentIndex()
@@ -0,0 +1,208 @@
+import math
+import os
+import threading
+import time
+
+from data_ingestion import point_key, remember, traffic_flow_cache, traffic_incidents_cache, weather_cache
+from incident_index import incident_id, incident_index, incident_points
+from metrics import CallbackMetric, Counter
+from vector_tiles import get_route_index, mercator
+
+# --- Incremental updates from the event stream ---
+#
+# apply_event() takes one traffic flow, incident or weather event and writes
+# it straight into the provider caches (resetting their TTL, so routing reads
+# it instead of polling the provider), the last-known-good store and the
+# incident index. When an event materially changes conditions (congestion
+# level, a closure, an incident appearing or clearing, weather risk), active
+# routes passing within DIRTY_ROUTE_RADIUS_KM are marked dirty so they can be
+# recalculated. Recalculation happens outside this service: a job with the
+# admin token claims them from POST /admin/routes/dirty/claim.
+#
+# Event payloads use the same shapes the fetchers cache:
+#   traffic flow: the parsed flow dict, including "location": {"lat", "lon"}
+#   weather:      the parsed weather dict, including "lat" and "lon"
+#   incident:     {"action": "upsert" | "clear", "incident": <parsed incident>}
+
+DIRTY_ROUTE_RADIUS_KM = float(os.getenv("DIRTY_ROUTE_RADIUS_KM", "2"))
+EARTH_CIRCUMFERENCE_KM = 40075.0
+
+live_updates_applied = Counter("live_updates_applied_total", "Stream events applied to the caches.",
+                               ("kind", "outcome"))
+routes_marked_dirty = Counter("routes_marked_dirty_total", "Active routes marked for recalculation.", ("reason",))
+
+
+class DirtyRoutes:
+    """Active routes whose conditions changed since they were last recalculated."""
+
+    def __init__(self):
+        self._routes = {}  # route id -> {"since", "updated", "reasons"}
+        self._lock = threading.Lock()
+
+    def mark(self, route_id, reason):
+        now = time.time()
+        with self._lock:
+            entry = self._routes.get(route_id)
+            if entry is None:
+                entry = self._routes[route_id] = {"since": now, "updated": now, "reasons": []}
+            entry["updated"] = now
+            if reason not in entry["reasons"]:
+                entry["reasons"].append(reason)
+
+    def snapshot(self):
+        with self._lock:
+            return {route_id: dict(entry, reasons=list(entry["reasons"])) for route_id, entry in self._routes.items()}
+
+    def claim(self, route_ids=None):
+        """Removes and returns dirty routes (all of them, or just `route_ids`) for recalculation."""
+        with self._lock:
+            if route_ids is None:
+                claimed, self._routes = self._routes, {}
+                return claimed
+            return {route_id: self._routes.pop(route_id) for route_id in route_ids if route_id in self._routes}
+
+    def __len__(self):
+        return len(self._routes)
+
+
+dirty_routes = DirtyRoutes()
+
+
+def _segment_distance(px, py, x0, y0, x1, y1):
+    dx, dy = x1 - x0, y1 - y0
+    length = dx * dx + dy * dy
+    t = 0.0 if length == 0 else max(0.0, min(1.0, ((px - x0) * dx + (py - y0) * dy) / length))
+    return math.hypot(px - (x0 + t * dx), py - (y0 + t * dy))
+
+
+def routes_near(points, radius_km=DIRTY_ROUTE_RADIUS_KM):
+    """Ids of active routes passing within radius_km of any of the (lat, lon) points."""
+    found = set()
+    routes = get_route_index().routes
+    for lat, lon in points:
+        px, py = mercator(lat, lon)
+        # Normalized Mercator units per km at this latitude
+        radius = radius_km / (EARTH_CIRCUMFERENCE_KM * max(math.cos(math.radians(lat)), 0.01))
+        for route in routes:
+            if route["id"] in found:
+                continue
+            min_x, min_y, max_x, max_y = route["bbox"]
+            if px < min_x - radius or px > max_x + radius or py < min_y - radius or py > max_y + radius:
+                continue
+            route_points = route["points"]
+            for (x0, y0), (x1, y1) in zip(route_points, route_points[1:]):
+                if _segment_distance(px, py, x0, y0, x1, y1) <= radius:
+                    found.add(route["id"])
+                    break
+    return found
+
+
+def _mark_routes(points, reason):
+    route_ids = routes_near(points)
+    for route_id in route_ids:
+        dirty_routes.mark(route_id, reason)
+    if route_ids:
+        routes_marked_dirty.inc(reason.split(":", 1)[0], amount=len(route_ids))
+    return route_ids
+
+
+def apply_traffic_flow(event):
+    location = event.get("location") or {}
+    lat, lon = location.get("lat"), location.get("lon")
+    if lat is None or lon is None:
+        raise ValueError("traffic flow event without location")
+    key = point_key(lat, lon)
+    previous = traffic_flow_cache.peek(key)
+    traffic_flow_cache.set(key, event)
+    remember("traffic_flow", key, event)
+
+    level, closed = event.get("congestion_level"), bool(event.get("road_closure"))
+    if isinstance(previous, dict) and "congestion_level" in previous:
+        changed = previous.get("congestion_level") != level or bool(previous.get("road_closure")) != closed
+    else:
+        changed = closed or level == "high"
+    if changed:
+        return _mark_routes([(lat, lon)], "road_closure" if closed else f"traffic:{level}")
+    return set()
+
+
+def apply_weather(event):
+    lat, lon = event.get("lat"), event.get("lon")
+    if lat is None or lon is None:
+        raise ValueError("weather event without lat/lon")
+    key = point_key(lat, lon)
+    previous = weather_cache.peek(key)
+    weather_cache.set(key, event)
+    remember("weather", key, event)
+
+    risk = event.get("risk")
+    previous_risk = previous.get("risk") if isinstance(previous, dict) else None
+    if risk != previous_risk and "high" in (risk, previous_risk):
+        return _mark_routes([(lat, lon)], f"weather:{event.get('weather')}")
+    return set()
+
+
+def _update_cached_incident_lists(incident, points, remove):
+    # Incident lists are cached per queried bbox; patch every list whose bbox holds the incident
+    target = incident_id(incident)
+    for key, incidents in traffic_incidents_cache.items():
+        if not isinstance(incidents, list):
+            continue
+        min_lon, min_lat, max_lon, max_lat, incident_type = key
+        if incident_type and incident_type != incident.get("type"):
+            continue
+        if not any(min_lat <= lat <= max_lat and min_lon <= lon <= max_lon for lat, lon in points):
+            continue
+        updated = [item for item in incidents if incident_id(item) != target]
+        if not remove:
+            updated.append(incident)
+        traffic_incidents_cache.replace(key, updated)
+
+
+def apply_incident(event):
+    incident = event.get("incident")
+    if not isinstance(incident, dict):
+        raise ValueError("incident event without incident")
+    action = event.get("action", "upsert")
+    if action == "clear":
+        removed = incident_index.remove(incident)
+        points = incident_points(removed or incident)
+        _update_cached_incident_lists(removed or incident, points, remove=True)
+        return _mark_routes(points, "incident_cleared")
+    if action != "upsert":
+        raise ValueError(f"unknown incident action: {action}")
+
+    _, previous = incident_index.upsert(incident)
+    points = incident_points(incident)
+    if not points:
+        raise ValueError("incident event without location")
+    _update_cached_incident_lists(incident, points, remove=False)
+    if previous is None or (previous.get("severity"), previous.get("isRoadClosed"), previous.get("delay")) != \
+            (incident.get("severity"), incident.get("isRoadClosed"), incident.get("delay")):
+        return _mark_routes(points, f"incident:{incident.get('type')}")
+    return set()
+
+
+APPLIERS = {
+    "traffic_flow": apply_traffic_flow,
+    "traffic_incidents": apply_incident,
+    "weather": apply_weather,
+}
+
+
+def apply_event(kind, event):
+    """Applies one event of `kind`; returns the ids of routes it marked dirty."""
+    try:
+        marked = APPLIERS[kind](event)
+    except Exception as e:
+        live_updates_applied.inc(kind, "invalid")
+        print(f"Could not apply {kind} event: {e}")
+        return set()
+    live_updates_applied.inc(kind, "ok")
+    return marked
+
+
+CallbackMetric("routes_dirty", "Active routes waiting for recalculation.", "gauge",
+               (), lambda: [((), len(dirty_routes))])
+CallbackMetric("live_incidents", "Incidents held in the live incident index.", "gauge",
+               (), lambda: [((), len(incident_index))])
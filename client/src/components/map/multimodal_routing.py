@@ -0,0 +1,227 @@
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from data_ingestion import IST, geocode_location
+from timetable import MODES, get_timetable
+
+# --- Multimodal earliest-arrival routing (Connection Scan Algorithm) ---
+#
+# Rail and air links come from the mail timetable; first/last mile and
+# transfers between nearby stops (station <-> airport) are road legs whose
+# duration is estimated from great-circle distance, so a query never waits
+# on an external API once the endpoints are geocoded.
+
+ROAD_AVERAGE_SPEED_KMH = float(os.getenv("ROAD_AVERAGE_SPEED_KMH", "40"))
+ROAD_DETOUR_FACTOR = 1.3  # road distance vs. great-circle distance
+FIRST_MILE_RADIUS_KM = float(os.getenv("FIRST_MILE_RADIUS_KM", "150"))
+TRANSFER_RADIUS_KM = float(os.getenv("TRANSFER_RADIUS_KM", "30"))
+GRID_CELL_DEGREES = 1.0
+INFINITY = 2 ** 31 - 1
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(a))
+
+
+def estimate_road_leg(lat1, lon1, lat2, lon2):
+    """Returns (seconds, km) for a road leg estimated from straight-line distance."""
+    km = haversine_km(lat1, lon1, lat2, lon2) * ROAD_DETOUR_FACTOR
+    return int(km / ROAD_AVERAGE_SPEED_KMH * 3600), round(km, 2)
+
+
+class ConnectionScanRouter:
+    """Earliest-arrival router over a Timetable, with road first/last mile."""
+
+    def __init__(self, timetable):
+        self.timetable = timetable
+        stops = timetable.stops
+        self._grid = {}
+        for i, stop in enumerate(stops):
+            self._grid.setdefault(self._cell(stop["lat"], stop["lon"]), []).append(i)
+        # Road transfers between stops close to each other, e.g. a station and an airport
+        self.transfers = [
+            [(j, estimate_road_leg(stop["lat"], stop["lon"], stops[j]["lat"], stops[j]["lon"])[0])
+             for j, _ in self.nearby_stops(stop["lat"], stop["lon"], TRANSFER_RADIUS_KM) if j != i]
+            for i, stop in enumerate(stops)
+        ]
+
+    @staticmethod
+    def _cell(lat, lon):
+        return int(math.floor(lat / GRID_CELL_DEGREES)), int(math.floor(lon / GRID_CELL_DEGREES))
+
+    def nearby_stops(self, lat, lon, radius_km):
+        """Returns [(stop index, road seconds)] for stops within radius_km of a point."""
+        stops = self.timetable.stops
+        span = int(math.ceil(radius_km / (111.0 * GRID_CELL_DEGREES * max(math.cos(math.radians(lat)), 0.1)))) + 1
+        row, col = self._cell(lat, lon)
+        found = []
+        for r in range(row - span, row + span + 1):
+            for c in range(col - span, col + span + 1):
+                for i in self._grid.get((r, c), ()):
+                    if haversine_km(lat, lon, stops[i]["lat"], stops[i]["lon"]) <= radius_km:
+                        found.append((i, estimate_road_leg(lat, lon, stops[i]["lat"], stops[i]["lon"])[0]))
+        return found
+
+    def earliest_arrival(self, origin, destination, departure, modes=MODES):
+        """
+        Finds the earliest-arrival journey between two (lat, lon) points leaving
+        at `departure` (aware datetime). Returns a list of legs and the arrival time.
+        """
+        timetable = self.timetable
+        stops = timetable.stops
+        local = departure.astimezone(IST)
+        midnight = local.replace(hour=0, minute=0, second=0, microsecond=0)
+        start = int((local - midnight).total_seconds())
+        window = timetable.window(local.weekday())
+        dep = window["departure"]
+        arr = window["arrival"]
+        from_stop = window["from_stop"]
+        to_stop = window["to_stop"]
+        trip_of = window["trip"]
+        mode_of = window["mode"]
+        transfer_seconds = timetable.transfer_seconds
+        transfers = self.transfers
+        allowed = [mode in modes for mode in MODES]
+        filter_modes = not all(allowed)
+
+        # Per-query state is kept in lists: indexing them is cheaper than typed arrays in the scan
+        earliest = [INFINITY] * len(stops)
+        # Earliest departure a bag at the stop can board (arrival plus the stop's transfer time)
+        ready = [INFINITY] * len(stops)
+        reached_by = [None] * len(stops)  # ("road", secs) | ("transfer", stop) | ("connection", index)
+        # Trips are numbered per day in the window, so the same service on different days boards independently
+        boarded_at = [-1] * (3 * len(timetable.services))
+
+        direct_seconds, _ = estimate_road_leg(origin[0], origin[1], destination[0], destination[1])
+        best = start + direct_seconds
+        best_stop = None
+
+        for i, secs in self.nearby_stops(origin[0], origin[1], FIRST_MILE_RADIUS_KM):
+            earliest[i] = start + secs
+            ready[i] = start + secs + transfer_seconds[i]
+            reached_by[i] = ("road", secs)
+        last_mile = dict(self.nearby_stops(destination[0], destination[1], FIRST_MILE_RADIUS_KM))
+
+        for c in range(timetable.first_departure_index(local.weekday(), start), len(dep)):
+            d = dep[c]
+            if d >= best:
+                break
+            trip = trip_of[c]
+            if boarded_at[trip] < 0:
+                # Most connections leave stops not reached yet; a trip's mode is checked once, on boarding
+                if ready[from_stop[c]] > d or (filter_modes and not allowed[mode_of[c]]):
+                    continue
+                boarded_at[trip] = c
+            a = arr[c]
+            t = to_stop[c]
+            if a >= earliest[t]:
+                continue
+            earliest[t] = a
+            ready[t] = a + transfer_seconds[t]
+            reached_by[t] = ("connection", c)
+            if t in last_mile and a + last_mile[t] < best:
+                best = a + last_mile[t]
+                best_stop = t
+            for t2, secs in transfers[t]:
+                if a + secs < earliest[t2]:
+                    earliest[t2] = a + secs
+                    ready[t2] = a + secs + transfer_seconds[t2]
+                    reached_by[t2] = ("transfer", t)
+                    if t2 in last_mile and a + secs + last_mile[t2] < best:
+                        best = a + secs + last_mile[t2]
+                        best_stop = t2
+
+        def at(seconds):
+            return (midnight + timedelta(seconds=seconds)).isoformat()
+
+        def road_leg(frm, to, from_point, to_point, begin):
+            secs, km = estimate_road_leg(from_point[0], from_point[1], to_point[0], to_point[1])
+            return {"mode": "road", "from": frm, "to": to, "departure": at(begin),
+                    "arrival": at(begin + secs), "distance_km": km}
+
+        if best_stop is None:
+            legs = [road_leg("origin", "destination", origin, destination, start)]
+        else:
+            def point(s):
+                return stops[s]["lat"], stops[s]["lon"]
+
+            legs = [road_leg(stops[best_stop]["name"], "destination", point(best_stop), destination,
+                             earliest[best_stop])]
+            s = best_stop
+            while True:
+                kind, ref = reached_by[s]
+                if kind == "road":
+                    legs.append(road_leg("origin", stops[s]["name"], origin, point(s), start))
+                    break
+                if kind == "transfer":
+                    legs.append(road_leg(stops[ref]["name"], stops[s]["name"], point(ref), point(s), earliest[ref]))
+                    s = ref
+                    continue
+                board = boarded_at[trip_of[ref]]
+                service = timetable.services[trip_of[ref] % len(timetable.services)]
+                legs.append({
+                    "mode": service["mode"],
+                    "service_id": service["service_id"],
+                    "from": stops[from_stop[board]]["name"],
+                    "to": stops[s]["name"],
+                    "departure": at(dep[board]),
+                    "arrival": at(arr[ref])
+                })
+                s = from_stop[board]
+            legs.reverse()
+
+        return {"departure": at(start), "arrival": at(best), "duration": str(timedelta(seconds=best - start)),
+                "legs": legs}
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """Returns the process-wide router over the timetable, building it on first use."""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ConnectionScanRouter(get_timetable())
+    return _router
+
+
+def get_multimodal_route(origin, destination, departure=None, modes=MODES):
+    """
+    Earliest-arrival road/rail/air route between two named locations.
+    `departure` is an ISO datetime (IST assumed if naive); defaults to now.
+    """
+    start_lat, start_lon = geocode_location(origin)
+    end_lat, end_lon = geocode_location(destination)
+    if None in [start_lat, start_lon, end_lat, end_lon]:
+        return {"error": "Unable to geocode one or both locations."}
+
+    try:
+        if departure:
+            when = datetime.fromisoformat(departure)
+            if when.tzinfo is None:
+                when = when.replace(tzinfo=IST)
+        else:
+            when = datetime.now(IST)
+    except ValueError:
+        return {"error": f"Invalid departure time: {departure}"}
+
+    unknown = [mode for mode in modes if mode not in MODES]
+    if unknown:
+        return {"error": f"Unsupported transport modes: {', '.join(unknown)}"}
+
+    started = time.perf_counter()
+    journey = get_router().earliest_arrival((start_lat, start_lon), (end_lat, end_lon), when, modes)
+    journey["search_ms"] = round((time.perf_counter() - started) * 1000, 2)
+    journey["origin"] = origin
+    journey["destination"] = destination
+    journey["legs"][0]["from"] = origin
+    journey["legs"][-1]["to"] = destination
+    return journey
@@ -1,25 +1,144 @@
-from confluent_kafka import Producer
+import atexit
 import json
 import os
+import threading
+import time
+
+from event_codec import encode_event
+from event_transport import TransportError, create_producer
+from metrics import CallbackMetric, Counter
+
+# --- Batched, non-blocking event publishing ---
+#
+# publish_event only appends to the producer's local queue; librdkafka sends
+# messages in batches (KAFKA_LINGER_MS / KAFKA_BATCH_SIZE) and a background
+# thread polls for delivery reports, which feed counters. When the local
+# queue is full, publish_event waits up to KAFKA_PUBLISH_TIMEOUT_SECONDS for
+# room before dropping the event. Outstanding messages are flushed once, at
+# shutdown (close_producer, also registered with atexit).
 
 KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
+KAFKA_LINGER_MS = int(os.getenv("KAFKA_LINGER_MS", "20"))
+KAFKA_BATCH_SIZE = int(os.getenv("KAFKA_BATCH_SIZE", "131072"))  # bytes per partition batch
+KAFKA_COMPRESSION = os.getenv("KAFKA_COMPRESSION", "lz4")
+KAFKA_ACKS = os.getenv("KAFKA_ACKS", "all")
+KAFKA_QUEUE_MAX_MESSAGES = int(os.getenv("KAFKA_QUEUE_MAX_MESSAGES", "100000"))
+KAFKA_QUEUE_MAX_KBYTES = int(os.getenv("KAFKA_QUEUE_MAX_KBYTES", "65536"))
+KAFKA_PUBLISH_TIMEOUT_SECONDS = float(os.getenv("KAFKA_PUBLISH_TIMEOUT_SECONDS", "1.0"))
+KAFKA_FLUSH_TIMEOUT_SECONDS = float(os.getenv("KAFKA_FLUSH_TIMEOUT_SECONDS", "10"))
+
+PRODUCER_CONFIG = {
+    'bootstrap.servers': KAFKA_BOOTSTRAP_SERVERS,
+    'linger.ms': KAFKA_LINGER_MS,
+    'batch.size': KAFKA_BATCH_SIZE,
+    'compression.type': KAFKA_COMPRESSION,
+    'acks': KAFKA_ACKS,
+    'enable.idempotence': KAFKA_ACKS == "all",
+    'queue.buffering.max.messages': KAFKA_QUEUE_MAX_MESSAGES,
+    'queue.buffering.max.kbytes': KAFKA_QUEUE_MAX_KBYTES,
+}
+
+events_published = Counter("kafka_events_published_total", "Events handed to the producer queue.", ("topic",))
+events_delivered = Counter("kafka_events_delivered_total", "Events acknowledged by the broker.", ("topic",))
+delivery_failures = Counter("kafka_delivery_failures_total", "Events the broker did not acknowledge.",
+                            ("topic", "error"))
+events_dropped = Counter("kafka_events_dropped_total", "Events dropped before reaching the producer queue.",
+                         ("topic", "reason"))
+queue_full_waits = Counter("kafka_queue_full_waits_total", "Times publish_event waited for queue space.", ("topic",))
+
+_producer = None
+_poll_thread = None
+_stop = threading.Event()
+_lock = threading.Lock()
 
-producer = Producer({'bootstrap.servers': KAFKA_BOOTSTRAP_SERVERS})
 
 def delivery_report(err, msg):
     if err:
-        print(f"Message delivery failed: {err}")
+        delivery_failures.inc(msg.topic(), err.name())
     else:
-        print(f"Message delivered to {msg.topic()} [{msg.partition()}]")
+        events_delivered.inc(msg.topic())
+
+
+def _poll_loop(producer):
+    # Serves delivery callbacks; produce() never has to
+    while not _stop.is_set():
+        producer.poll(0.1)
+
+
+def get_producer():
+    """Creates the producer and its poll thread on first use."""
+    global _producer, _poll_thread
+    if _producer is None:
+        with _lock:
+            if _producer is None:
+                producer = create_producer(PRODUCER_CONFIG)
+                _stop.clear()
+                _poll_thread = threading.Thread(target=_poll_loop, args=(producer,), name="kafka-producer-poll",
+                                                daemon=True)
+                _poll_thread.start()
+                _producer = producer
+    return _producer
 
-def publish_event(topic, key, value):
+
+def publish_event(topic, key, value, schema=None):
+    """
+    Queues an event for delivery without waiting for the broker. With
+    `schema` (a name in event_schemas.json) the event is binary encoded,
+    otherwise it is sent as JSON. Returns False if the event was dropped
+    (queue full for longer than KAFKA_PUBLISH_TIMEOUT_SECONDS, or a
+    serialization/config error).
+    """
     try:
-        producer.produce(
-            topic=topic,
-            key=key,
-            value=json.dumps(value),
-            callback=delivery_report
-        )
-        producer.flush()
+        payload = encode_event(schema, value) if schema else json.dumps(value)
+        producer = get_producer()
     except Exception as e:
-        print(f"Kafka publish error: {e}")
\ No newline at end of file
+        print(f"Kafka publish error: {e}")
+        events_dropped.inc(topic, "error")
+        return False
+
+    deadline = None
+    while True:
+        try:
+            producer.produce(topic=topic, key=key, value=payload, callback=delivery_report)
+            events_published.inc(topic)
+            return True
+        except BufferError:
+            # Local queue is full: back-pressure the caller until the poll thread frees room
+            now = time.monotonic()
+            if deadline is None:
+                deadline = now + KAFKA_PUBLISH_TIMEOUT_SECONDS
+                queue_full_waits.inc(topic)
+            if now >= deadline:
+                events_dropped.inc(topic, "queue_full")
+                return False
+            time.sleep(min(0.01, deadline - now))
+        except (TransportError, TypeError, ValueError) as e:
+            print(f"Kafka publish error: {e}")
+            events_dropped.inc(topic, "error")
+            return False
+
+
+def pending_events():
+    return len(_producer) if _producer is not None else 0
+
+
+def close_producer(timeout=KAFKA_FLUSH_TIMEOUT_SECONDS):
+    """Stops the poll thread and flushes outstanding events; returns how many are still undelivered."""
+    global _producer, _poll_thread
+    with _lock:
+        producer, thread = _producer, _poll_thread
+        _producer = _poll_thread = None
+    if producer is None:
+        return 0
+    _stop.set()
+    thread.join()
+    remaining = producer.flush(timeout)
+    if remaining:
+        print(f"Kafka producer closed with {remaining} undelivered events")
+    return remaining
+
+
+atexit.register(close_producer)
+
+CallbackMetric("kafka_producer_queue_length", "Events waiting in the producer's local queue.", "gauge",
+               (), lambda: [((), pending_events())])
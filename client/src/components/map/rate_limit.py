@@ -0,0 +1,220 @@
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+
+from metrics import CallbackMetric, Counter
+from responses import json_dumps
+
+try:
+    from jose import JWTError, jwt
+except ImportError:  # without python-jose, bearer tokens are not used to identify users
+    jwt = None
+
+# --- Per-client token-bucket rate limiting ---
+#
+# Every client gets a bucket of RATE_LIMIT_BURST tokens that refills at
+# RATE_LIMIT_TOKENS_PER_SECOND. Each request to a limited endpoint takes
+# tokens according to ENDPOINT_COSTS, which reflect how many paid upstream
+# calls the endpoint fans out to. When the bucket is short the request is
+# rejected with 429 and a Retry-After header, before any upstream call is made.
+# Route plans cost per stop, read from the request body; a batch is charged
+# per job as each job starts (see charge()), and jobs the bucket cannot cover
+# fail with a rate limit error in their result line.
+#
+# Clients are identified by, in order: an X-API-Key listed in
+# RATE_LIMIT_API_KEYS, the subject of a bearer token signed with
+# JWT_SECRET_KEY, or the client IP.
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+RATE_LIMIT_TOKENS_PER_SECOND = float(os.getenv("RATE_LIMIT_TOKENS_PER_SECOND", "2"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "40"))
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))
+# Comma separated; only these API keys get their own bucket, any other X-API-Key is ignored
+RATE_LIMIT_API_KEYS = {k.strip() for k in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if k.strip()}
+# Only trust X-Forwarded-For when the API runs behind a proxy that sets it
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
+JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
+JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+
+
+
+def route_plan_cost(stops):
+    """Tokens for planning a route through `stops` locations: a geocode per stop and a route per leg."""
+    return max(1, 2 * stops - 1)
+
+
+def _route_plan_request_cost(body):
+    return route_plan_cost(2 + len(body.get("intermediate_post_offices") or []))
+
+
+# (method, path) -> tokens per request, or a function of the JSON request body
+# returning them; endpoints not listed are not limited.
+ENDPOINT_COSTS = {
+    ("GET", "/all-data"): 4,                  # geocode + weather + traffic flow + incidents
+    ("GET", "/route/optimized"): 4,           # 2 geocodes + route + traffic
+    ("POST", "/route/optimized"): _route_plan_request_cost,
+    ("POST", "/route/optimized/stream"): _route_plan_request_cost,
+    ("POST", "/route/batch"): 1,              # plus route_plan_cost per job, charged as it runs
+    ("GET", "/route/multimodal"): 4,
+    ("GET", "/traffic/incidents"): 2,         # geocode + incidents
+    ("GET", "/traffic/flow"): 2,
+    ("GET", "/weather"): 2,
+    ("GET", "/weather/coords"): 1,
+    ("GET", "/geocode"): 1,
+}
+
+rate_limit_rejections = Counter("rate_limit_rejections_total", "Requests rejected by the rate limiter.",
+                                ("method", "path"))
+
+
+class TokenBuckets:
+    """
+    Token buckets keyed by client, stored as [tokens, last refill time] and
+    refilled lazily when the client next calls. The least recently seen
+    clients are dropped beyond `max_clients`; a dropped client simply starts
+    again with a full bucket.
+    """
+
+    def __init__(self, rate=RATE_LIMIT_TOKENS_PER_SECOND, burst=RATE_LIMIT_BURST, max_clients=RATE_LIMIT_MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+
+    def take(self, client, cost, now=None):
+        """Takes `cost` tokens; returns (allowed, tokens left, seconds until the request would be allowed)."""
+        now = time.monotonic() if now is None else now
+        cost = min(cost, self.burst)
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            bucket = self._buckets[client] = [self.burst, now]
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client)
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            return True, bucket[0], 0.0
+        return False, bucket[0], (cost - bucket[0]) / self.rate
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+rate_limit_buckets = TokenBuckets()
+
+CallbackMetric("rate_limit_clients", "Clients with a tracked token bucket.", "gauge",
+               (), lambda: [((), len(rate_limit_buckets))])
+
+
+def _header(scope, name):
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def client_identity(scope):
+    """Bucket key for a request: 'key:<api key>', 'user:<subject>' or 'ip:<address>'."""
+    api_key = _header(scope, b"x-api-key")
+    if api_key and api_key in RATE_LIMIT_API_KEYS:
+        return f"key:{api_key}"
+
+    authorization = _header(scope, b"authorization")
+    if authorization and jwt is not None and JWT_SECRET_KEY and authorization[:7].lower() == "bearer ":
+        try:
+            subject = jwt.decode(authorization[7:], JWT_SECRET_KEY, algorithms=[JWT_ALGORITHM]).get("sub")
+            if subject:
+                return f"user:{subject}"
+        except JWTError:
+            pass
+
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = _header(scope, b"x-forwarded-for")
+        if forwarded:
+            return f"ip:{forwarded.split(',')[0].strip()}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+def charge(client, cost, method, path):
+    """Takes `cost` tokens from a client's bucket for work done inside an endpoint; returns (allowed, retry_after)."""
+    allowed, _, retry_after = rate_limit_buckets.take(client, cost)
+    if not allowed:
+        rate_limit_rejections.inc(method, path)
+    return allowed, retry_after
+
+
+async def _read_body(receive):
+    """Reads the whole request body; returns it with a receive callable that replays it to the app."""
+    messages = []
+    body = b""
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            break
+        body += message.get("body", b"")
+        if not message.get("more_body", False):
+            break
+
+    async def replay():
+        return messages.pop(0) if messages else await receive()
+
+    return body, replay
+
+
+def _body_cost(cost, body):
+    try:
+        return max(1, int(cost(json.loads(body))))
+    except (ValueError, TypeError, AttributeError):
+        return 1  # malformed; the endpoint rejects it before any upstream call
+
+
+class RateLimitMiddleware:
+    """Pure ASGI middleware applying ENDPOINT_COSTS against per-client token buckets."""
+
+    def __init__(self, app, buckets=None, costs=None):
+        self.app = app
+        self.buckets = rate_limit_buckets if buckets is None else buckets
+        self.costs = ENDPOINT_COSTS if costs is None else costs
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        cost = self.costs.get((scope["method"], scope["path"]))
+        if cost is None:
+            await self.app(scope, receive, send)
+            return
+        if callable(cost):
+            body, receive = await _read_body(receive)
+            cost = _body_cost(cost, body)
+
+        allowed, remaining, retry_after = self.buckets.take(client_identity(scope), cost)
+        if allowed:
+            await self.app(scope, receive, send)
+            return
+
+        rate_limit_rejections.inc(scope["method"], scope["path"])
+        body = json_dumps({
+            "error": "Rate limit exceeded",
+            "cost": cost,
+            "retry_after": round(retry_after, 1)
+        }).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("latin-1")),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode("latin-1")),
+                (b"x-ratelimit-limit", str(int(self.buckets.burst)).encode("latin-1")),
+                (b"x-ratelimit-remaining", str(int(remaining)).encode("latin-1")),
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,9 @@
+import metrics  # noqa: F401  (puts service_common on sys.path)
+
+# --- Fast JSON serialization and negotiated compression ---
+#
+# Shared with the other Python service; see service_common/responses.py.
+
+from service_common.responses import (  # noqa: E402,F401
+    FastJSONResponse, ResponseCompressionMiddleware, get_response_stats, json_dumps
+)
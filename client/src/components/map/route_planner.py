@@ -1,6 +1,9 @@
-import requests
 import os
 import csv
+import threading
+import time
+from datetime import datetime, timezone
+from types import MappingProxyType
 from dotenv import load_dotenv
 
 # Assuming data_ingestion.py is in the same directory
@@ -9,39 +12,102 @@ import data_ingestion
 load_dotenv()
 
 AZURE_MAPS_KEY = os.getenv("AZURE_MAPS_KEY")
-POST_OFFICE_FILE = "post_office_data.csv"
+POST_OFFICE_FILE = os.getenv(
+    "POST_OFFICE_FILE",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "..",
+                                 "india_head_post_offices_with_coords.csv"))
+)
+POST_OFFICE_WATCH_INTERVAL_SECONDS = int(os.getenv("POST_OFFICE_WATCH_INTERVAL_SECONDS", "10"))
 
 # --- 1. Post Office Network Management ---
-_post_office_data = {} # Internal cache for PO data
+
+class PostOfficeRegistry:
+    """
+    Immutable snapshot of the post office data. Reloads build a new snapshot
+    and replace the module-level reference in one assignment, so readers
+    always see either the old or the new registry, never a partial one.
+    """
+    __slots__ = ("offices", "version", "loaded_at", "source", "source_mtime")
+
+    def __init__(self, offices, version, loaded_at, source, source_mtime):
+        self.offices = MappingProxyType(offices)
+        self.version = version
+        self.loaded_at = loaded_at
+        self.source = source
+        self.source_mtime = source_mtime
+
+_registry = PostOfficeRegistry({}, 0, None, None, None) # Version 0 = never loaded
+_reload_lock = threading.Lock() # Serialises reloads; readers never take it
+_initial_load_lock = threading.Lock() # Held by the first load; readers arriving meanwhile wait for it
+_initial_load_attempted = False
+_watcher = None
+_watcher_stop = threading.Event()
 
 def load_post_office_data(file_path=POST_OFFICE_FILE):
-    """Loads post office data from a CSV file."""
-    global _post_office_data
-    _post_office_data = {} # Clear cache
-    try:
-        with open(file_path, mode='r', newline='', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                # Convert lat/lon to float, handle potential errors
-                try:
-                    row['Latitude'] = float(row['Latitude'])
-                    row['Longitude'] = float(row['Longitude'])
-                except ValueError:
-                    print(f"Warning: Could not parse lat/lon for {row['PO_ID']}. Skipping.")
-                    continue
-                _post_office_data[row['PO_ID']] = row
-        print(f"Successfully loaded {_post_office_data.__len__()} post offices from {file_path}")
-    except FileNotFoundError:
-        print(f"Error: Post office data file '{file_path}' not found.")
-    except Exception as e:
-        print(f"Error loading post office data: {e}")
-    return _post_office_data
+    """
+    Loads post office data from a CSV file into a new registry snapshot and
+    swaps it in. On failure the current snapshot is kept.
+    """
+    global _registry
+    with _reload_lock:
+        offices = {}
+        try:
+            source_mtime = os.path.getmtime(file_path)
+            with open(file_path, mode='r', newline='', encoding='utf-8') as file:
+                reader = csv.DictReader(file)
+                for row in reader:
+                    # The head post office dataset has no PO_ID column; its pincode is unique
+                    po_id = (row.get('PO_ID') or row.get('Pincode') or '').strip()
+                    # Convert lat/lon to float, handle potential errors
+                    try:
+                        row['Latitude'] = float(row['Latitude'])
+                        row['Longitude'] = float(row['Longitude'])
+                    except (TypeError, ValueError):
+                        print(f"Warning: Could not parse lat/lon for {po_id}. Skipping.")
+                        continue
+                    offices[po_id] = MappingProxyType(row)
+        except FileNotFoundError:
+            print(f"Error: Post office data file '{file_path}' not found.")
+            return _registry.offices
+        except Exception as e:
+            print(f"Error loading post office data: {e}")
+            return _registry.offices
+
+        _registry = PostOfficeRegistry(offices, _registry.version + 1, time.time(), file_path, source_mtime)
+        print(f"Successfully loaded {len(offices)} post offices from {file_path} (version {_registry.version})")
+        return _registry.offices
+
+def _ensure_loaded():
+    """Loads the registry once on first use; later reloads come from the watcher or an admin."""
+    global _initial_load_attempted
+    if _initial_load_attempted:
+        return
+    with _initial_load_lock:
+        if _initial_load_attempted:
+            return
+        if _registry.version == 0:
+            load_post_office_data()
+        _initial_load_attempted = True
+
+def get_post_office_registry():
+    """Returns the current registry snapshot, loading it on first use."""
+    if _registry.version == 0:
+        _ensure_loaded()
+    return _registry
+
+def get_registry_info():
+    """Version, load time and size of the current registry snapshot."""
+    registry = get_post_office_registry()
+    return {
+        "version": registry.version,
+        "loaded_at": datetime.fromtimestamp(registry.loaded_at, tz=timezone.utc).isoformat() if registry.loaded_at else None,
+        "source": registry.source,
+        "post_offices": len(registry.offices)
+    }
 
 def get_post_office_details(po_id):
     """Retrieves details for a specific post office by ID."""
-    if not _post_office_data: # Ensure data is loaded
-        load_post_office_data()
-    return _post_office_data.get(po_id)
+    return get_post_office_registry().offices.get(po_id)
 
 def get_post_office_coordinates(po_id):
     """Retrieves latitude and longitude for a specific post office by ID."""
@@ -50,6 +116,29 @@ def get_post_office_coordinates(po_id):
         return details.get("Latitude"), details.get("Longitude")
     return None, None
 
+def _watch_post_office_file(file_path, interval):
+    while not _watcher_stop.wait(interval):
+        try:
+            mtime = os.path.getmtime(file_path)
+        except OSError:
+            continue
+        if mtime != _registry.source_mtime:
+            load_post_office_data(file_path)
+
+def start_post_office_watcher(file_path=POST_OFFICE_FILE, interval=POST_OFFICE_WATCH_INTERVAL_SECONDS):
+    """Starts a background thread that reloads the registry when the CSV file changes."""
+    global _watcher
+    if _watcher is not None and _watcher.is_alive():
+        return _watcher
+    _watcher_stop.clear()
+    _watcher = threading.Thread(target=_watch_post_office_file, args=(file_path, interval),
+                                name="post-office-watcher", daemon=True)
+    _watcher.start()
+    return _watcher
+
+def stop_post_office_watcher():
+    _watcher_stop.set()
+
 # --- 2. Data Processing & Impact Assessment ---
 
 def assess_weather_impact(weather_data):
@@ -127,7 +216,7 @@ def get_route_details(start_lat, start_lon, end_lat, end_lon, travel_mode="truck
         print("Error: AZURE_MAPS_KEY is not set.")
         return None
 
-    route_url = "https://atlas.microsoft.com/route/directions/json"
+    route_url = f"{data_ingestion.AZURE_MAPS_URL}/route/directions/json"
     params = {
         "api-version": "1.0",
         "subscription-key": AZURE_MAPS_KEY,
@@ -139,9 +228,7 @@ def get_route_details(start_lat, start_lon, end_lat, end_lon, travel_mode="truck
     }
 
     try:
-        response = requests.get(route_url, params=params)
-        response.raise_for_status()
-        route_data = response.json()
+        route_data = data_ingestion.upstream_get_json("azure_route", route_url, params)
 
         if "routes" in route_data and route_data["routes"]:
             summary = route_data["routes"][0]["summary"]
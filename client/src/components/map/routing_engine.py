@@ -1,12 +1,44 @@
+import asyncio
 import os
+import httpx
 import requests
 from dotenv import load_dotenv
 from data_ingestion import geocode_location, fetch_real_time_traffic_flow, fetch_weather_data, generate_bounding_box, fetch_traffic_incidents
+from data_ingestion import (
+    AZURE_MAPS_URL,
+    upstream_get_json,
+    hedged_get_json_async,
+    remember,
+    stale_or,
+    geocode_location_async,
+    fetch_real_time_traffic_flow_async,
+    fetch_weather_data_async,
+    fetch_traffic_incidents_async
+)
 from datetime import timedelta
 
+from cache import LastKnownGood, TTLCache
+from route_planner import assess_weather_impact, assess_traffic_flow_impact, assess_traffic_incidents_impact
+from trunk_legs import get_trunk_route_response
+
 load_dotenv()
 AZURE_MAPS_KEY = os.getenv("AZURE_MAPS_KEY")
-def calculate_dynamic_route(locations, traffic_data, weather_data, travel_mode="car"):
+
+ALTERNATIVE_ROUTE_COUNT = int(os.getenv("ALTERNATIVE_ROUTE_COUNT", "3"))  # Azure allows up to 5
+ALTERNATIVES_TTL_SECONDS = int(os.getenv("ALTERNATIVES_TTL_SECONDS", "600"))
+MAX_ROUTE_OVERLAP = 0.8  # alternatives sharing more of their path with a better one are dropped
+
+# Scored alternatives per corridor, so repeated reroute checks don't hit Azure again
+_alternatives_cache = TTLCache(maxsize=2048, ttl=ALTERNATIVES_TTL_SECONDS, name="alternatives")
+# Impact factors of the leg's own route per corridor, which the alternatives are compared against
+_leg_impact_cache = TTLCache(maxsize=2048, ttl=ALTERNATIVES_TTL_SECONDS, name="leg_impact")
+
+# Send a second route request if the first has not answered in this many ms (0 = off)
+ROUTE_HEDGE_AFTER_MS = float(os.getenv("ROUTE_HEDGE_AFTER_MS", "0"))
+# Route responses are large, so fewer of them are kept for the stale fallback
+_last_known_routes = LastKnownGood(maxsize=int(os.getenv("ROUTE_LAST_KNOWN_GOOD_MAXSIZE", "500")))
+
+def calculate_dynamic_route(locations, traffic_data, weather_data, travel_mode="car", route_type="fastest"):
     """
     Calculates an optimized route from origin -> intermediate post offices -> destination.
     Dynamically checks traffic and weather at each hop and adjusts path accordingly.
@@ -15,12 +47,23 @@ def calculate_dynamic_route(locations, traffic_data, weather_data, travel_mode="
         locations (List[str]): Full list of post office locations from origin to destination.
         traffic_data (dict): Real-time traffic flow data keyed by location.
         weather_data (dict): Real-time weather data keyed by location.
+        travel_mode (str): Azure Maps travel mode, e.g. 'car' or 'truck'.
+        route_type (str): Azure Maps route type, 'fastest' or 'shortest'.
 
     Returns:
         List[dict]: Optimized route steps with traffic/weather/rerouting info per leg.
     """
-    optimized_route = []
-    
+    return list(iter_dynamic_route_legs(locations, traffic_data, weather_data, travel_mode, route_type))
+
+def iter_dynamic_route_legs(locations, traffic_data=None, weather_data=None, travel_mode="car", route_type="fastest"):
+    """
+    Yields each leg of calculate_dynamic_route as soon as it is computed.
+    Traffic and weather missing from traffic_data/weather_data are fetched
+    for the leg start when that leg is reached.
+    """
+    traffic_data = traffic_data or {}
+    weather_data = weather_data or {}
+
     for i in range(len(locations) - 1):
         start = locations[i]
         end = locations[i + 1]
@@ -28,65 +71,181 @@ def calculate_dynamic_route(locations, traffic_data, weather_data, travel_mode="
         start_lat, start_lon = geocode_location(start)
         end_lat, end_lon = geocode_location(end)
         if None in [start_lat, start_lon, end_lat, end_lon]:
-            optimized_route.append({
+            yield {
                 "from": start,
                 "to": end,
                 "error": "Geocoding failed"
-            })
+            }
             continue
 
         # Base route data (supports car, rail/publicTransport)
-        url, params = build_route_url(start_lat, start_lon, end_lat, end_lon, travel_mode)
+        url, params = build_route_url(start_lat, start_lon, end_lat, end_lon, travel_mode, route_type)
         try:
-            response = requests.get(url, params=params)
-            response.raise_for_status()
-            data = response.json()
-            routes = data.get("routes", [])
-            if not routes:
-                raise Exception("No route found.")
-
-            summary = routes[0]["summary"]
-            leg_points = routes[0]["legs"][0]["points"]
-            route_coords = [[pt["latitude"], pt["longitude"]] for pt in leg_points]
-            total_seconds = summary.get("travelTimeInSeconds", 0) + summary.get("trafficDelayInSeconds", 0)
-
-            eta = str(timedelta(seconds=total_seconds))
-            distance_km = round(summary.get("lengthInMeters", 0) / 1000, 2)
+            data = fetch_leg_route_json(start, end, url, params)
+            summary, route_coords = parse_route(data)
 
             # Fetch traffic & weather for current leg start
-            traffic_info = traffic_data[start]
-            weather_info = weather_data[start]
+            traffic_info = traffic_data.get(start) or fetch_real_time_traffic_flow(start_lat, start_lon)
+            weather_info = weather_data.get(start) or fetch_weather_data(start_lat, start_lon)
             should_reroute, reason = suggest_rerouting(traffic_info, weather_info)
+            alternative = None
+            if should_reroute:
+                alternative = find_best_alternative(start_lat, start_lon, end_lat, end_lon,
+                                                    route_coords, leg_travel_time(summary), travel_mode)
+
+            yield build_leg(start, end, summary, route_coords, traffic_info, weather_info,
+                            should_reroute, reason, alternative, stale_since=data.get("stale_since"))
 
-            optimized_route.append({
+        except Exception as e:
+            yield {
+                "from": start,
+                "to": end,
+                "error": f"Routing failed: {str(e)}"
+            }
+
+async def calculate_dynamic_route_async(locations, traffic_data, weather_data, travel_mode="car", route_type="fastest"):
+    """Async calculate_dynamic_route, for use from the async API handlers."""
+    return [leg async for leg in iter_dynamic_route_legs_async(locations, traffic_data, weather_data,
+                                                               travel_mode, route_type)]
+
+async def iter_dynamic_route_legs_async(locations, traffic_data=None, weather_data=None, travel_mode="car", route_type="fastest"):
+    """Async iter_dynamic_route_legs; the leg's route, traffic and weather are fetched concurrently."""
+    traffic_data = traffic_data or {}
+    weather_data = weather_data or {}
+
+    for i in range(len(locations) - 1):
+        start = locations[i]
+        end = locations[i + 1]
+
+        (start_lat, start_lon), (end_lat, end_lon) = await asyncio.gather(
+            geocode_location_async(start), geocode_location_async(end)
+        )
+        if None in [start_lat, start_lon, end_lat, end_lon]:
+            yield {
                 "from": start,
                 "to": end,
-                "eta": eta,
-                "distance_km": distance_km,
-                "route": route_coords,
-                "traffic_info": traffic_info,
-                "weather_info": weather_info,
-                "reroute_suggestion": {
-                    "reroute": should_reroute,
-                    "reason": reason
-                }
-            })
+                "error": "Geocoding failed"
+            }
+            continue
+
+        url, params = build_route_url(start_lat, start_lon, end_lat, end_lon, travel_mode, route_type)
+        try:
+            data, traffic_info, weather_info = await asyncio.gather(
+                fetch_leg_route_json_async(start, end, url, params),
+                _known_or_fetch(traffic_data.get(start), fetch_real_time_traffic_flow_async, start_lat, start_lon),
+                _known_or_fetch(weather_data.get(start), fetch_weather_data_async, start_lat, start_lon)
+            )
+            summary, route_coords = parse_route(data)
+            should_reroute, reason = suggest_rerouting(traffic_info, weather_info)
+            alternative = None
+            if should_reroute:
+                # Alternatives and the leg's own score are cached per corridor; misses run in a worker thread
+                alternative = await asyncio.to_thread(find_best_alternative, start_lat, start_lon, end_lat, end_lon,
+                                                      route_coords, leg_travel_time(summary), travel_mode)
+
+            yield build_leg(start, end, summary, route_coords, traffic_info, weather_info,
+                            should_reroute, reason, alternative, stale_since=data.get("stale_since"))
 
         except Exception as e:
-            optimized_route.append({
+            yield {
                 "from": start,
                 "to": end,
                 "error": f"Routing failed: {str(e)}"
-            })
+            }
+
+async def _known_or_fetch(known, fetch, lat, lon):
+    return known if known else await fetch(lat, lon)
 
-    return optimized_route
+def _route_key(params):
+    return (params["query"], params["travelMode"], params["routeType"])
+
+def fetch_route_json(url, params):
+    """
+    Azure Maps route request. If Azure fails (or its breaker is open) the last
+    successful response for the same query is returned with a stale_since marker.
+    """
+    key = _route_key(params)
+    try:
+        data = upstream_get_json("azure_route", url, params)
+    except Exception as e:
+        data = stale_or("route", key, None, store=_last_known_routes)
+        if data is None:
+            raise
+        print(f"Azure Maps route request failed, serving last known route: {e}")
+        return data
+    remember("route", key, data, store=_last_known_routes)
+    return data
+
+async def fetch_route_json_async(url, params):
+    """Async fetch_route_json; hedged when ROUTE_HEDGE_AFTER_MS is set."""
+    key = _route_key(params)
+    try:
+        data = await hedged_get_json_async("azure_route", url, params,
+                                           hedge_after=ROUTE_HEDGE_AFTER_MS / 1000 or None)
+    except Exception as e:
+        data = stale_or("route", key, None, store=_last_known_routes)
+        if data is None:
+            raise
+        print(f"Azure Maps route request failed, serving last known route: {e}")
+        return data
+    remember("route", key, data, store=_last_known_routes)
+    return data
+
+def fetch_leg_route_json(start, end, url, params):
+    """Route response for a leg: the precomputed trunk leg if start and end are head post offices."""
+    trunk = get_trunk_route_response(start, end, params["travelMode"], params["routeType"])
+    return trunk if trunk else fetch_route_json(url, params)
+
+async def fetch_leg_route_json_async(start, end, url, params):
+    """Async fetch_leg_route_json."""
+    trunk = get_trunk_route_response(start, end, params["travelMode"], params["routeType"])
+    return trunk if trunk else await fetch_route_json_async(url, params)
+
+def parse_route(data):
+    """Returns (summary, [[lat, lon], ...]) of the first route in an Azure Maps route response."""
+    routes = data.get("routes", [])
+    if not routes:
+        raise Exception("No route found.")
+
+    summary = routes[0]["summary"]
+    leg_points = routes[0]["legs"][0]["points"]
+    return summary, [[pt["latitude"], pt["longitude"]] for pt in leg_points]
+
+def leg_travel_time(summary):
+    """Travel time of a route summary in seconds, including the traffic delay."""
+    return summary.get("travelTimeInSeconds", 0) + summary.get("trafficDelayInSeconds", 0)
+
+def build_leg(start, end, summary, route_coords, traffic_info, weather_info, should_reroute, reason, alternative=None,
+              stale_since=None):
+    total_seconds = leg_travel_time(summary)
+    reroute_suggestion = {
+        "reroute": should_reroute,
+        "reason": reason
+    }
+    if alternative:
+        reroute_suggestion["alternative"] = alternative
+        reroute_suggestion["time_saved_seconds"] = alternative["time_saved_seconds"]
+
+    leg = {
+        "from": start,
+        "to": end,
+        "eta": str(timedelta(seconds=total_seconds)),
+        "distance_km": round(summary.get("lengthInMeters", 0) / 1000, 2),
+        "route": route_coords,
+        "traffic_info": traffic_info,
+        "weather_info": weather_info,
+        "reroute_suggestion": reroute_suggestion
+    }
+    if stale_since:
+        leg["stale_since"] = stale_since
+    return leg
 
 def build_route_url(start_lat, start_lon, end_lat, end_lon, travel_mode="car",route_type = "shortest"):
     """
     Construct Azure Maps route URL with specified travel mode.
     travel_mode: 'car', 'publicTransport', 'rail', etc.
     """
-    base_url = "https://atlas.microsoft.com/route/directions/json"
+    base_url = f"{AZURE_MAPS_URL}/route/directions/json"
     params = {
         "api-version": "1.0",
         "query": f"{start_lat},{start_lon}:{end_lat},{end_lon}",
@@ -98,12 +257,128 @@ def build_route_url(start_lat, start_lon, end_lat, end_lon, travel_mode="car",ro
     return base_url, params
 
 def suggest_rerouting(traffic_info, weather_info):
-    if traffic_info.get("congestion_level") in ["heavy", "severe"]:
+    if traffic_info.get("congestion_level") in ["high", "heavy", "severe"]:
         return True, "Heavy traffic detected. Consider rerouting."
     if weather_info.get("risk") in ["high", "extreme"]:
         return True, "Severe weather conditions detected. Consider rerouting."
     return False, "No rerouting needed."
 
+def _route_cells(coords):
+    """Coarse (~100 m) grid cells a route passes through, used to measure overlap."""
+    return {(round(lat, 3), round(lon, 3)) for lat, lon in coords}
+
+def route_impacts(coords):
+    """
+    route_planner impact factors of a route: traffic flow and weather at its
+    midpoint and incidents along it.
+    """
+    mid_lat, mid_lon = coords[len(coords) // 2]
+    lats = [lat for lat, _ in coords]
+    lons = [lon for _, lon in coords]
+    bbox = [min(lons), min(lats), max(lons), max(lats)]
+
+    return (assess_traffic_flow_impact(fetch_real_time_traffic_flow(mid_lat, mid_lon)),
+            assess_weather_impact(fetch_weather_data(mid_lat, mid_lon)),
+            assess_traffic_incidents_impact(fetch_traffic_incidents(bbox), bbox))
+
+def score_route(coords, travel_time_seconds, impacts=None):
+    """Expected travel time of a route after applying its impact factors (computed if not given)."""
+    traffic_impact, weather_impact, incidents_impact = impacts or route_impacts(coords)
+    return {
+        "scored_seconds": int(travel_time_seconds * traffic_impact * weather_impact * incidents_impact),
+        "traffic_impact": traffic_impact,
+        "weather_impact": weather_impact,
+        "incidents_impact": incidents_impact
+    }
+
+def fetch_alternative_routes(start_lat, start_lon, end_lat, end_lon, travel_mode="car", k=ALTERNATIVE_ROUTE_COUNT):
+    """
+    Returns up to k+1 diverse routes for a corridor (the primary route first),
+    each scored with the route_planner impact functions.
+    Azure Maps computes the alternatives with its own penalty method; near
+    duplicates of a better-scored route are dropped here.
+    """
+    url, params = build_route_url(start_lat, start_lon, end_lat, end_lon, travel_mode, "fastest")
+    params["maxAlternatives"] = k
+    params["alternativeType"] = "anyRoute"
+    data = upstream_get_json("azure_route", url, params)
+
+    candidates = []
+    for route in data.get("routes", []):
+        summary = route.get("summary", {})
+        coords = [[pt["latitude"], pt["longitude"]] for leg in route.get("legs", []) for pt in leg.get("points", [])]
+        if not coords:
+            continue
+        travel_time = leg_travel_time(summary)
+        candidate = {
+            "route": coords,
+            "travel_time_seconds": travel_time,
+            "eta": str(timedelta(seconds=travel_time)),
+            "distance_km": round(summary.get("lengthInMeters", 0) / 1000, 2)
+        }
+        candidate.update(score_route(coords, travel_time))
+        candidates.append(candidate)
+
+    if not candidates:
+        return []
+    primary, others = candidates[0], sorted(candidates[1:], key=lambda c: c["scored_seconds"])
+    chosen = [primary]
+    chosen_cells = [_route_cells(primary["route"])]
+    for candidate in others:
+        cells = _route_cells(candidate["route"])
+        if all(len(cells & other) / max(len(cells), 1) <= MAX_ROUTE_OVERLAP for other in chosen_cells):
+            chosen.append(candidate)
+            chosen_cells.append(cells)
+    return chosen
+
+def get_alternative_routes(start_lat, start_lon, end_lat, end_lon, travel_mode="car"):
+    """Cached fetch_alternative_routes, keyed by corridor (endpoints rounded to ~100 m) and mode."""
+    return _alternatives_cache.get_or_set(
+        _corridor_key(start_lat, start_lon, end_lat, end_lon, travel_mode),
+        lambda: fetch_alternative_routes(start_lat, start_lon, end_lat, end_lon, travel_mode)
+    )
+
+def _corridor_key(start_lat, start_lon, end_lat, end_lon, travel_mode):
+    return (round(start_lat, 3), round(start_lon, 3), round(end_lat, 3), round(end_lon, 3), travel_mode)
+
+def get_leg_impacts(start_lat, start_lon, end_lat, end_lon, leg_coords, travel_mode="car"):
+    """
+    Cached route_impacts of a leg's own route, keyed by corridor, mode and
+    the route's length and midpoint (a fastest and a shortest leg differ).
+    """
+    mid_lat, mid_lon = leg_coords[len(leg_coords) // 2]
+    key = _corridor_key(start_lat, start_lon, end_lat, end_lon, travel_mode) + (
+        len(leg_coords), round(mid_lat, 3), round(mid_lon, 3))
+    return _leg_impact_cache.get_or_set(key, lambda: route_impacts(leg_coords))
+
+def find_best_alternative(start_lat, start_lon, end_lat, end_lon, leg_coords, leg_travel_time_seconds,
+                          travel_mode="car"):
+    """
+    Returns the best-scored alternative to the leg's own route (as requested,
+    e.g. shortest) with the time it saves over that route, or None if no
+    alternative is expected to be faster. Alternatives that mostly follow
+    the leg's route are not offered.
+    """
+    try:
+        routes = get_alternative_routes(start_lat, start_lon, end_lat, end_lon, travel_mode)
+    except Exception as e:
+        print(f"Error fetching alternative routes: {e}")
+        return None
+    leg_cells = _route_cells(leg_coords)
+    candidates = []
+    for route in routes:
+        cells = _route_cells(route["route"])
+        if len(cells & leg_cells) / max(len(cells), 1) <= MAX_ROUTE_OVERLAP:
+            candidates.append(route)
+    if not candidates:
+        return None
+    best = min(candidates, key=lambda r: r["scored_seconds"])
+    impacts = get_leg_impacts(start_lat, start_lon, end_lat, end_lon, leg_coords, travel_mode)
+    time_saved = score_route(leg_coords, leg_travel_time_seconds, impacts)["scored_seconds"] - best["scored_seconds"]
+    if time_saved <= 0:
+        return None
+    return dict(best, time_saved_seconds=time_saved)
+
 def get_optimized_route(start_location, end_location,optimized_mode=""):
     start_lat, start_lon = geocode_location(start_location)
     end_lat, end_lon = geocode_location(end_location)
@@ -114,21 +389,7 @@ def get_optimized_route(start_location, end_location,optimized_mode=""):
     url, params = build_route_url(start_lat, start_lon, end_lat, end_lon, route_type=optimized_mode)
 
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
-
-        routes = data.get("routes", [])
-        if not routes:
-            return {"error": "No route found."}
-
-        route = routes[0]
-        summary = route.get("summary", {})
-        leg = route.get("legs", [])[0]
-        points = leg.get("points", [])
-
-        # Convert points from [{"latitude": x, "longitude": y}, ...] to [[x, y], ...]
-        route_coords = [[point["latitude"], point["longitude"]] for point in points]
+        data = fetch_route_json(url, params)
 
         traffic_info = fetch_real_time_traffic_flow(start_lat, start_lon)
         weather_info = fetch_weather_data(start_lat, start_lon)
@@ -137,31 +398,74 @@ def get_optimized_route(start_location, end_location,optimized_mode=""):
         bbox = generate_bounding_box(start_lat, start_lon)
         traffic_incidents = fetch_traffic_incidents(bbox)
 
-        total_seconds = summary.get("travelTimeInSeconds", 0) + summary.get("trafficDelayInSeconds", 0)
-        total_time = timedelta(seconds=total_seconds)
+        return build_optimized_route(data, traffic_info, weather_info, traffic_incidents)
 
-        hours, remainder = divmod(total_seconds, 3600)
-        minutes, seconds = divmod(remainder, 60)
+    except requests.exceptions.RequestException as e:
+        return {"error": f"Azure Maps API request failed: {str(e)}"}
+    except Exception as e:
+        return {"error": f"Unexpected error: {str(e)}"}
 
-        if hours > 0:
-            eta = f"{hours} hour{'s' if hours != 1 else ''}, {minutes} min"
-        else:
-            eta = f"{minutes} min"
+async def get_optimized_route_async(start_location, end_location, optimized_mode=""):
+    """Async get_optimized_route; route, traffic, weather and incidents are fetched concurrently."""
+    (start_lat, start_lon), (end_lat, end_lon) = await asyncio.gather(
+        geocode_location_async(start_location), geocode_location_async(end_location)
+    )
 
-        return {
-            "route": route_coords,
-            "eta": eta,
-            "distance": round(summary.get("lengthInMeters", 0) / 1000, 2),
-            "traffic_info": traffic_info,
-            "weather_info": weather_info,
-            "traffic_incidents": traffic_incidents
-        }
+    if None in [start_lat, start_lon, end_lat, end_lon]:
+        return {"error": "Unable to geocode one or both locations."}
 
-    except requests.exceptions.RequestException as e:
+    url, params = build_route_url(start_lat, start_lon, end_lat, end_lon, route_type=optimized_mode)
+    bbox = generate_bounding_box(start_lat, start_lon)
+
+    try:
+        data, traffic_info, weather_info, traffic_incidents = await asyncio.gather(
+            fetch_route_json_async(url, params),
+            fetch_real_time_traffic_flow_async(start_lat, start_lon),
+            fetch_weather_data_async(start_lat, start_lon),
+            fetch_traffic_incidents_async(bbox)
+        )
+        return build_optimized_route(data, traffic_info, weather_info, traffic_incidents)
+
+    except httpx.HTTPError as e:
         return {"error": f"Azure Maps API request failed: {str(e)}"}
     except Exception as e:
         return {"error": f"Unexpected error: {str(e)}"}
 
+def build_optimized_route(data, traffic_info, weather_info, traffic_incidents):
+    routes = data.get("routes", [])
+    if not routes:
+        return {"error": "No route found."}
+
+    route = routes[0]
+    summary = route.get("summary", {})
+    leg = route.get("legs", [])[0]
+    points = leg.get("points", [])
+
+    # Convert points from [{"latitude": x, "longitude": y}, ...] to [[x, y], ...]
+    route_coords = [[point["latitude"], point["longitude"]] for point in points]
+
+    total_seconds = summary.get("travelTimeInSeconds", 0) + summary.get("trafficDelayInSeconds", 0)
+
+    hours, remainder = divmod(total_seconds, 3600)
+    minutes, seconds = divmod(remainder, 60)
+
+    if hours > 0:
+        eta = f"{hours} hour{'s' if hours != 1 else ''}, {minutes} min"
+    else:
+        eta = f"{minutes} min"
+
+    result = {
+        "route": route_coords,
+        "eta": eta,
+        "distance": round(summary.get("lengthInMeters", 0) / 1000, 2),
+        "traffic_info": traffic_info,
+        "weather_info": weather_info,
+        "traffic_incidents": traffic_incidents
+    }
+    if data.get("stale_since"):
+        result["stale_since"] = data["stale_since"]
+    return result
+
 
 if __name__ == "__main__":
     start = input("Enter start location: ")
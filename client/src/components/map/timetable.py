@@ -0,0 +1,178 @@
+"""
+Rail and air mail link timetable.
+
+Ingestion format: two CSV files in MAIL_TIMETABLE_DIR.
+
+stops.csv
+    stop_id,name,mode,lat,lon,min_transfer_minutes
+    e.g. NDLS,New Delhi Railway Station,rail,28.6430,77.2194,30
+
+    `min_transfer_minutes` is the mail handling time needed to move a bag
+    from an arriving service onto a different departing one at that stop.
+
+connections.csv
+    mode,service_id,from_stop,to_stop,departure,arrival,days
+    e.g. rail,12952,NDLS,BCT,16:55,08:35+1,1234567
+
+    One row per hop between consecutive stops of a service. Times are local
+    (IST) HH:MM; arrival may carry a "+N" day offset. `days` lists the
+    weekdays the hop departs on (1 = Monday ... 7 = Sunday).
+
+The timetable/ directory next to this module holds a small sample network
+(trunk stations and airports of the metro cities); point MAIL_TIMETABLE_DIR
+at a full export to replace it.
+
+Connections are kept in flat typed arrays sorted by departure so the
+connection scan in multimodal_routing can walk them in one pass.
+"""
+import csv
+import os
+import threading
+from array import array
+from bisect import bisect_left
+
+MAIL_TIMETABLE_DIR = os.getenv(
+    "MAIL_TIMETABLE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "timetable")
+)
+DEFAULT_TRANSFER_MINUTES = 30
+SECONDS_PER_DAY = 86400
+MODES = ("rail", "air")
+
+
+def parse_time(value):
+    """Parses 'HH:MM' or 'HH:MM+N' into seconds after midnight of the service day."""
+    value = value.strip()
+    day_offset = 0
+    if "+" in value:
+        value, offset = value.split("+", 1)
+        day_offset = int(offset)
+    hours, minutes = value.split(":")[:2]
+    return day_offset * SECONDS_PER_DAY + int(hours) * 3600 + int(minutes) * 60
+
+
+class Timetable:
+    """Stops and weekday-indexed connections of the rail/air mail network."""
+
+    def __init__(self, stops, connections):
+        self.stops = stops
+        self.stop_index = {stop["stop_id"]: i for i, stop in enumerate(stops)}
+        self.transfer_seconds = array('i', (stop["min_transfer_minutes"] * 60 for stop in stops))
+
+        self.services = []
+        service_index = {}
+        # Per weekday (0 = Monday) lists of (departure, arrival, from, to, trip, mode)
+        by_weekday = [[] for _ in range(7)]
+        for conn in connections:
+            key = (conn["mode"], conn["service_id"])
+            if key not in service_index:
+                service_index[key] = len(self.services)
+                self.services.append({"mode": conn["mode"], "service_id": conn["service_id"]})
+            row = (conn["departure"], conn["arrival"], self.stop_index[conn["from_stop"]],
+                   self.stop_index[conn["to_stop"]], service_index[key], MODES.index(conn["mode"]))
+            for day in conn["days"]:
+                by_weekday[day].append(row)
+        self.connection_count = len(connections)
+        self._by_weekday = by_weekday
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def window(self, weekday):
+        """
+        Connections departing on `weekday` and the following day, plus the
+        previous day's that leave after midnight ("+1"), with times relative to
+        midnight of `weekday`, as parallel arrays sorted by departure.
+        Built once per weekday and reused.
+        """
+        window = self._windows.get(weekday)
+        if window is not None:
+            return window
+        with self._lock:
+            window = self._windows.get(weekday)
+            if window is None:
+                # Next- and previous-day copies get their own trip numbers so boarding state is per day
+                offset = len(self.services)
+                rows = list(self._by_weekday[weekday])
+                rows.extend((dep + SECONDS_PER_DAY, arr + SECONDS_PER_DAY, f, t, trip + offset, mode)
+                            for dep, arr, f, t, trip, mode in self._by_weekday[(weekday + 1) % 7])
+                rows.extend((dep - SECONDS_PER_DAY, arr - SECONDS_PER_DAY, f, t, trip + 2 * offset, mode)
+                            for dep, arr, f, t, trip, mode in self._by_weekday[(weekday - 1) % 7]
+                            if dep >= SECONDS_PER_DAY)
+                rows.sort()
+                window = {
+                    "departure": array('i', (r[0] for r in rows)),
+                    "arrival": array('i', (r[1] for r in rows)),
+                    "from_stop": array('i', (r[2] for r in rows)),
+                    "to_stop": array('i', (r[3] for r in rows)),
+                    "trip": array('i', (r[4] for r in rows)),
+                    "mode": array('b', (r[5] for r in rows)),
+                }
+                self._windows[weekday] = window
+        return window
+
+    def first_departure_index(self, weekday, seconds):
+        return bisect_left(self.window(weekday)["departure"], seconds)
+
+
+def load_timetable(directory=MAIL_TIMETABLE_DIR):
+    """Loads stops.csv and connections.csv. Missing files yield an empty timetable."""
+    stops = []
+    connections = []
+    try:
+        with open(os.path.join(directory, "stops.csv"), mode='r', newline='', encoding='utf-8') as file:
+            for row in csv.DictReader(file):
+                try:
+                    stops.append({
+                        "stop_id": row["stop_id"].strip(),
+                        "name": row["name"].strip(),
+                        "mode": row["mode"].strip().lower(),
+                        "lat": float(row["lat"]),
+                        "lon": float(row["lon"]),
+                        "min_transfer_minutes": int(row.get("min_transfer_minutes") or DEFAULT_TRANSFER_MINUTES)
+                    })
+                except (KeyError, ValueError):
+                    print(f"Warning: Could not parse stop {row}. Skipping.")
+        known_stops = {stop["stop_id"] for stop in stops}
+
+        with open(os.path.join(directory, "connections.csv"), mode='r', newline='', encoding='utf-8') as file:
+            for row in csv.DictReader(file):
+                try:
+                    mode = row["mode"].strip().lower()
+                    from_stop = row["from_stop"].strip()
+                    to_stop = row["to_stop"].strip()
+                    if mode not in MODES or from_stop not in known_stops or to_stop not in known_stops:
+                        raise ValueError("unknown mode or stop")
+                    departure = parse_time(row["departure"])
+                    arrival = parse_time(row["arrival"])
+                    if arrival < departure:
+                        raise ValueError("arrival before departure")
+                    connections.append({
+                        "mode": mode,
+                        "service_id": row["service_id"].strip(),
+                        "from_stop": from_stop,
+                        "to_stop": to_stop,
+                        "departure": departure,
+                        "arrival": arrival,
+                        "days": sorted({int(d) - 1 for d in (row.get("days") or "1234567").strip() if d in "1234567"})
+                    })
+                except (KeyError, ValueError) as e:
+                    print(f"Warning: Could not parse connection {row}: {e}. Skipping.")
+        print(f"Loaded {len(stops)} stops and {len(connections)} connections from {directory}")
+    except FileNotFoundError as e:
+        print(f"Mail timetable not available: {e}")
+    return Timetable(stops, connections)
+
+
+_timetable = None
+_timetable_lock = threading.Lock()
+
+
+def get_timetable():
+    """Returns the process-wide timetable, loading it on first use."""
+    global _timetable
+    if _timetable is None:
+        with _timetable_lock:
+            if _timetable is None:
+                _timetable = load_timetable()
+    return _timetable
+
@@ -0,0 +1,328 @@
+import csv
+import os
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+
+from data_ingestion import upstream_get_json
+
+# --- Trunk network: precomputed legs between every pair of head post offices ---
+#
+# The head post offices form the trunk of the mail network and the same
+# HO -> HO legs are routed over and over. Instead of calling Azure Maps for
+# each request, a background job keeps a dense N x N table of travel time,
+# distance and geometry for every ordered pair and refreshes stale entries,
+# most volatile legs first. Queries are answered from memory, and the
+# routing engine uses a fresh entry instead of requesting the leg itself.
+
+HEAD_POST_OFFICE_FILE = os.getenv(
+    "HEAD_POST_OFFICE_FILE",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..", "..",
+                                 "india_head_post_offices_with_coords.csv"))
+)
+TRUNK_LEG_TTL_SECONDS = int(os.getenv("TRUNK_LEG_TTL_SECONDS", "1800"))
+TRUNK_REFRESH_INTERVAL_SECONDS = int(os.getenv("TRUNK_REFRESH_INTERVAL_SECONDS", "60"))
+TRUNK_REFRESH_BATCH_SIZE = int(os.getenv("TRUNK_REFRESH_BATCH_SIZE", "50"))
+TRUNK_REQUEST_SPACING_SECONDS = float(os.getenv("TRUNK_REQUEST_SPACING_SECONDS", "0.2"))
+# Legs are computed for this Azure Maps travel mode and route type only
+TRUNK_TRAVEL_MODE = "car"
+TRUNK_ROUTE_TYPE = "fastest"
+
+# Weight of the newest observation in the volatility moving average
+VOLATILITY_ALPHA = 0.3
+
+
+def load_head_post_offices(file_path=HEAD_POST_OFFICE_FILE):
+    """Loads the head post offices (name, pincode, coordinates) from CSV."""
+    offices = []
+    try:
+        with open(file_path, mode='r', newline='', encoding='utf-8') as file:
+            for row in csv.DictReader(file):
+                try:
+                    lat = float(row['Latitude'])
+                    lon = float(row['Longitude'])
+                except (TypeError, ValueError):
+                    print(f"Warning: Could not parse lat/lon for {row.get('OfficeName')}. Skipping.")
+                    continue
+                offices.append({
+                    "city": row['City'].strip(),
+                    "office_name": row['OfficeName'].strip(),
+                    "pincode": row['Pincode'].strip(),
+                    "lat": lat,
+                    "lon": lon
+                })
+    except FileNotFoundError:
+        print(f"Error: Head post office file '{file_path}' not found.")
+    return offices
+
+
+def encode_polyline(coords, precision=5):
+    """Encodes [[lat, lon], ...] using the Google polyline algorithm."""
+    factor = 10 ** precision
+    out = []
+    prev_lat = prev_lon = 0
+    for lat, lon in coords:
+        ilat = int(round(lat * factor))
+        ilon = int(round(lon * factor))
+        for delta in (ilat - prev_lat, ilon - prev_lon):
+            value = ~(delta << 1) if delta < 0 else (delta << 1)
+            while value >= 0x20:
+                out.append(chr((0x20 | (value & 0x1f)) + 63))
+                value >>= 5
+            out.append(chr(value + 63))
+        prev_lat, prev_lon = ilat, ilon
+    return "".join(out)
+
+
+def decode_polyline(encoded, precision=5):
+    """Decodes a Google polyline string back to [[lat, lon], ...]."""
+    factor = 10 ** precision
+    coords = []
+    index = lat = lon = 0
+    length = len(encoded)
+    while index < length:
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                b = ord(encoded[index]) - 63
+                index += 1
+                result |= (b & 0x1f) << shift
+                shift += 5
+                if b < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        coords.append([lat / factor, lon / factor])
+    return coords
+
+
+class TrunkLegTable:
+    """
+    Dense table of HO -> HO legs stored in flat typed arrays indexed by
+    origin * N + destination. Geometry is kept as encoded polylines.
+    """
+
+    def __init__(self, offices):
+        self.offices = offices
+        self.size = len(offices)
+        cells = self.size * self.size
+        self.travel_time = array('i', [-1]) * cells      # seconds, including traffic delay
+        self.traffic_delay = array('i', [0]) * cells     # seconds
+        self.distance = array('i', [0]) * cells          # meters
+        self.refreshed_at = array('d', [0.0]) * cells    # epoch seconds, 0 = never
+        self.volatility = array('f', [0.0]) * cells      # moving average of relative change
+        self.geometry = [None] * cells                   # encoded polylines
+        self._index = {}
+        for i, office in enumerate(offices):
+            for name in (office["city"], office["office_name"], office["pincode"]):
+                self._index.setdefault(name.lower(), i)
+        self._lock = threading.Lock()
+
+    def office_index(self, name):
+        if name is None:
+            return None
+        return self._index.get(name.strip().lower())
+
+    def store_leg(self, i, j, travel_time_seconds, traffic_delay_seconds, length_meters, coords):
+        """Writes a freshly computed leg and updates its volatility estimate."""
+        cell = i * self.size + j
+        with self._lock:
+            previous = self.travel_time[cell]
+            if previous > 0:
+                change = abs(travel_time_seconds - previous) / previous
+            else:
+                # First observation: use the share of the trip spent in traffic
+                change = traffic_delay_seconds / travel_time_seconds if travel_time_seconds else 0.0
+            self.volatility[cell] = VOLATILITY_ALPHA * change + (1 - VOLATILITY_ALPHA) * self.volatility[cell]
+            self.travel_time[cell] = travel_time_seconds
+            self.traffic_delay[cell] = traffic_delay_seconds
+            self.distance[cell] = length_meters
+            self.geometry[cell] = encode_polyline(coords)
+            self.refreshed_at[cell] = time.time()
+
+    def stale_legs(self, ttl=TRUNK_LEG_TTL_SECONDS, now=None):
+        """
+        Returns (origin, destination) index pairs due for refresh: never computed
+        legs first, then by volatility (most volatile first), then by age.
+        """
+        now = now or time.time()
+        due = []
+        with self._lock:
+            for i in range(self.size):
+                for j in range(self.size):
+                    if i == j:
+                        continue
+                    cell = i * self.size + j
+                    refreshed = self.refreshed_at[cell]
+                    if refreshed and now - refreshed < ttl:
+                        continue
+                    due.append((refreshed == 0.0, self.volatility[cell], now - refreshed, i, j))
+        due.sort(reverse=True)
+        return [(i, j) for _, _, _, i, j in due]
+
+    def get_leg(self, i, j, ttl=TRUNK_LEG_TTL_SECONDS):
+        cell = i * self.size + j
+        with self._lock:
+            refreshed = self.refreshed_at[cell]
+            if not refreshed:
+                return None
+            travel_time = self.travel_time[cell]
+            traffic_delay = self.traffic_delay[cell]
+            distance = self.distance[cell]
+            geometry = self.geometry[cell]
+        age = time.time() - refreshed
+        return {
+            "from": self.offices[i]["office_name"],
+            "to": self.offices[j]["office_name"],
+            "travel_time_seconds": travel_time,
+            "traffic_delay_seconds": traffic_delay,
+            "eta": str(timedelta(seconds=travel_time)),
+            "distance_km": round(distance / 1000, 2),
+            "route": decode_polyline(geometry),
+            "refreshed_at": datetime.fromtimestamp(refreshed, tz=timezone.utc).isoformat(),
+            "age_seconds": round(age, 1),
+            "stale": age >= ttl
+        }
+
+    def route_response(self, i, j, ttl=TRUNK_LEG_TTL_SECONDS):
+        """A fresh leg shaped like an Azure Maps route response, or None if it is missing or stale."""
+        cell = i * self.size + j
+        with self._lock:
+            refreshed = self.refreshed_at[cell]
+            if not refreshed or time.time() - refreshed >= ttl:
+                return None
+            travel_time = self.travel_time[cell]
+            traffic_delay = self.traffic_delay[cell]
+            distance = self.distance[cell]
+            geometry = self.geometry[cell]
+        summary = {
+            "travelTimeInSeconds": travel_time - traffic_delay,
+            "trafficDelayInSeconds": traffic_delay,
+            "lengthInMeters": distance
+        }
+        points = [{"latitude": lat, "longitude": lon} for lat, lon in decode_polyline(geometry)]
+        return {"routes": [{"summary": summary, "legs": [{"points": points}]}]}
+
+    def status(self, ttl=TRUNK_LEG_TTL_SECONDS):
+        now = time.time()
+        total = self.size * (self.size - 1)
+        with self._lock:
+            computed = [t for t in self.refreshed_at if t]
+        fresh = sum(1 for t in computed if now - t < ttl)
+        return {
+            "offices": self.size,
+            "legs": total,
+            "computed": len(computed),
+            "fresh": fresh,
+            "oldest_age_seconds": round(now - min(computed), 1) if computed else None
+        }
+
+
+def fetch_leg(origin, destination):
+    """Computes a single trunk leg with Azure Maps (fastest route, live traffic)."""
+    # Imported here: routing_engine reads this table when it routes a leg
+    from routing_engine import build_route_url
+    url, params = build_route_url(origin["lat"], origin["lon"], destination["lat"], destination["lon"],
+                                  TRUNK_TRAVEL_MODE, route_type=TRUNK_ROUTE_TYPE)
+    routes = upstream_get_json("azure_route", url, params).get("routes", [])
+    if not routes:
+        raise ValueError("No route found.")
+    summary = routes[0]["summary"]
+    points = routes[0]["legs"][0]["points"]
+    travel_time = summary.get("travelTimeInSeconds", 0)
+    traffic_delay = summary.get("trafficDelayInSeconds", 0)
+    return {
+        "travel_time_seconds": travel_time + traffic_delay,
+        "traffic_delay_seconds": traffic_delay,
+        "length_meters": summary.get("lengthInMeters", 0),
+        "route": [[pt["latitude"], pt["longitude"]] for pt in points]
+    }
+
+
+def refresh_stale_legs(table, limit=TRUNK_REFRESH_BATCH_SIZE, spacing=TRUNK_REQUEST_SPACING_SECONDS, stop_event=None):
+    """Refreshes up to `limit` stale legs in volatility order. Returns the number refreshed."""
+    refreshed = 0
+    for i, j in table.stale_legs()[:limit]:
+        if stop_event is not None and stop_event.is_set():
+            break
+        try:
+            leg = fetch_leg(table.offices[i], table.offices[j])
+            table.store_leg(i, j, leg["travel_time_seconds"], leg["traffic_delay_seconds"],
+                            leg["length_meters"], leg["route"])
+            refreshed += 1
+        except Exception as e:
+            print(f"Trunk leg refresh failed for {table.offices[i]['office_name']} -> "
+                  f"{table.offices[j]['office_name']}: {e}")
+        time.sleep(spacing)
+    return refreshed
+
+
+_table = None
+_table_lock = threading.Lock()
+_refresher = None
+_stop_event = threading.Event()
+
+
+def get_trunk_table():
+    """Returns the process-wide trunk leg table, loading the office list on first use."""
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = TrunkLegTable(load_head_post_offices())
+    return _table
+
+
+def get_trunk_leg(origin, destination):
+    """
+    Looks up a precomputed HO -> HO leg by city, office name or pincode.
+    Returns None if either end is not a head post office or the leg is not computed yet.
+    """
+    table = get_trunk_table()
+    i = table.office_index(origin)
+    j = table.office_index(destination)
+    if i is None or j is None or i == j:
+        return None
+    return table.get_leg(i, j)
+
+
+def get_trunk_route_response(origin, destination, travel_mode=TRUNK_TRAVEL_MODE, route_type=TRUNK_ROUTE_TYPE):
+    """
+    The precomputed leg between two head post offices as an Azure Maps route
+    response, for use in place of a route request. Returns None if the leg
+    is not a trunk leg, is not computed or is stale, or if a travel mode or
+    route type other than the table's is asked for.
+    """
+    if travel_mode != TRUNK_TRAVEL_MODE or route_type != TRUNK_ROUTE_TYPE:
+        return None
+    table = get_trunk_table()
+    i = table.office_index(origin)
+    j = table.office_index(destination)
+    if i is None or j is None or i == j:
+        return None
+    return table.route_response(i, j)
+
+
+def _refresh_loop(interval):
+    table = get_trunk_table()
+    while not _stop_event.is_set():
+        refresh_stale_legs(table, stop_event=_stop_event)
+        _stop_event.wait(interval)
+
+
+def start_trunk_refresher(interval=TRUNK_REFRESH_INTERVAL_SECONDS):
+    """Starts the background refresh thread (no-op if already running)."""
+    global _refresher
+    if _refresher is not None and _refresher.is_alive():
+        return _refresher
+    _stop_event.clear()
+    _refresher = threading.Thread(target=_refresh_loop, args=(interval,), name="trunk-leg-refresher", daemon=True)
+    _refresher.start()
+    return _refresher
+
+
+def stop_trunk_refresher():
+    _stop_event.set()
@@ -0,0 +1,508 @@
+import hashlib
+import json
+import math
+import os
+import struct
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+
+from cache import TTLCache
+from data_ingestion import geocode_cache, traffic_flow_cache, traffic_incidents_cache
+from incident_index import incident_index
+
+# --- Mapbox vector tiles for routes, incidents and traffic flow ---
+#
+# GET /tiles/{layer}/{z}/{x}/{y}.mvt serves pre-clipped, zoom-simplified
+# geometry so the map only draws what is visible at the current zoom.
+#
+#   routes     active Route.route_path lines, read from the mail routing DB
+#   incidents  traffic incidents currently in the data_ingestion cache
+#   traffic    traffic flow points currently in the data_ingestion cache
+#   all        the three layers in one tile
+#
+# Route tiles are cached until the set of active routes changes; the routes
+# table is re-read at most every TILE_ROUTES_REFRESH_SECONDS and compared by
+# fingerprint (the TS server and python_backend both write to it), and
+# invalidate_route_tiles() clears them immediately. Incident and traffic tiles
+# follow the provider caches and are kept for TILE_LIVE_TTL_SECONDS.
+
+TILE_EXTENT = 4096
+TILE_BUFFER = 64             # tile units drawn beyond the edge so lines join cleanly
+TILE_SIMPLIFY_PIXELS = float(os.getenv("TILE_SIMPLIFY_PIXELS", "0.5"))  # of a 256 px tile
+TILE_ROUTES_REFRESH_SECONDS = float(os.getenv("TILE_ROUTES_REFRESH_SECONDS", "10"))
+TILE_LIVE_TTL_SECONDS = int(os.getenv("TILE_LIVE_TTL_SECONDS", "30"))
+TILE_CACHE_SIZE = int(os.getenv("TILE_CACHE_SIZE", "4096"))
+MAX_ZOOM = 22
+MAX_LATITUDE = 85.0511287798
+
+LAYERS = ("routes", "incidents", "traffic")
+
+ROUTES_DATABASE_URL = os.getenv(
+    "ROUTES_DATABASE_URL",
+    os.getenv("DATABASE_URL", "sqlite:///" + os.path.abspath(os.path.join(
+        os.path.dirname(__file__), "..", "..", "..", "..", "python_backend", "mail_routing.db")))
+)
+
+_route_tiles = TTLCache(maxsize=TILE_CACHE_SIZE, ttl=24 * 3600, name="route_tiles")
+_live_tiles = TTLCache(maxsize=TILE_CACHE_SIZE, ttl=TILE_LIVE_TTL_SECONDS, name="live_tiles")
+
+
+# --- Protobuf encoding (vector_tile.proto v2) ---
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        bits = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def _field(number, wire_type, payload):
+    key = _varint((number << 3) | wire_type)
+    if wire_type == 0:
+        return key + _varint(payload)
+    return key + _varint(len(payload)) + payload
+
+
+def _packed(number, values):
+    return _field(number, 2, b"".join(_varint(v) for v in values))
+
+
+def _zigzag(n):
+    return (n << 1) ^ (n >> 31)
+
+
+def _encode_value(value):
+    if isinstance(value, bool):
+        return _field(7, 0, int(value))
+    if isinstance(value, int) and value >= 0:
+        return _field(5, 0, value)
+    if isinstance(value, int):
+        return _field(6, 0, (value << 1) ^ (value >> 63))
+    if isinstance(value, float):
+        return b"\x19" + struct.pack("<d", value)  # field 3 (double), wire type 1
+    return _field(1, 2, str(value).encode("utf-8"))
+
+
+def _command(command_id, count):
+    return (command_id & 0x7) | (count << 3)
+
+
+def _point_geometry(points):
+    geometry = [_command(1, len(points))]
+    cx = cy = 0
+    for x, y in points:
+        geometry += [_zigzag(x - cx), _zigzag(y - cy)]
+        cx, cy = x, y
+    return geometry
+
+
+def _line_geometry(lines):
+    geometry = []
+    cx = cy = 0
+    for line in lines:
+        x, y = line[0]
+        geometry += [_command(1, 1), _zigzag(x - cx), _zigzag(y - cy)]
+        cx, cy = x, y
+        geometry.append(_command(2, len(line) - 1))
+        for x, y in line[1:]:
+            geometry += [_zigzag(x - cx), _zigzag(y - cy)]
+            cx, cy = x, y
+    return geometry
+
+
+def encode_layer(name, features, extent=TILE_EXTENT):
+    """
+    Encodes one MVT layer. features: [(id, geom_type, geometry, properties)]
+    with geom_type 1 (points) or 2 (lines) and geometry as tile coordinates.
+    """
+    keys, values = {}, {}
+    body = [_field(15, 0, 2), _field(1, 2, name.encode("utf-8"))]
+    for feature_id, geom_type, geometry, properties in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value).__name__, value), len(values)))
+        commands = _point_geometry(geometry) if geom_type == 1 else _line_geometry(geometry)
+        feature = b""
+        if feature_id is not None:
+            feature += _field(1, 0, feature_id)
+        feature += _packed(2, tags) + _field(3, 0, geom_type) + _packed(4, commands)
+        body.append(_field(2, 2, feature))
+    body += [_field(3, 2, key.encode("utf-8")) for key in keys]
+    body += [_field(4, 2, _encode_value(value)) for _, value in values]
+    body.append(_field(5, 0, extent))
+    return _field(3, 2, b"".join(body))
+
+
+# --- Projection, clipping and simplification ---
+
+def mercator(lat, lon):
+    """Normalized Web Mercator coordinates in [0, 1]."""
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = (lon + 180.0) / 360.0
+    y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0
+    return x, y
+
+
+def tile_bounds(z, x, y, buffer=TILE_BUFFER):
+    """Normalized (min_x, min_y, max_x, max_y) of a tile including its buffer."""
+    n = 2 ** z
+    pad = buffer / TILE_EXTENT
+    return (x - pad) / n, (y - pad) / n, (x + 1 + pad) / n, (y + 1 + pad) / n
+
+
+def simplify(points, tolerance):
+    """Douglas-Peucker simplification of [(x, y), ...] (iterative)."""
+    if len(points) < 3:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    tolerance_sq = tolerance * tolerance
+    while stack:
+        first, last = stack.pop()
+        ax, ay = points[first]
+        bx, by = points[last]
+        dx, dy = bx - ax, by - ay
+        length_sq = dx * dx + dy * dy
+        max_dist, index = -1.0, None
+        for i in range(first + 1, last):
+            px, py = points[i]
+            if length_sq:
+                t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length_sq))
+                ex, ey = ax + t * dx - px, ay + t * dy - py
+            else:
+                ex, ey = ax - px, ay - py
+            dist = ex * ex + ey * ey
+            if dist > max_dist:
+                max_dist, index = dist, i
+        if index is not None and max_dist > tolerance_sq:
+            keep[index] = True
+            stack += [(first, index), (index, last)]
+    return [p for p, k in zip(points, keep) if k]
+
+
+def _clip_segment(x0, y0, x1, y1, lo, hi):
+    """Liang-Barsky clipping of a segment to the square [lo, hi]; None if outside."""
+    t0, t1 = 0.0, 1.0
+    dx, dy = x1 - x0, y1 - y0
+    for p, q in ((-dx, x0 - lo), (dx, hi - x0), (-dy, y0 - lo), (dy, hi - y0)):
+        if p == 0:
+            if q < 0:
+                return None
+        else:
+            t = q / p
+            if p < 0:
+                if t > t1:
+                    return None
+                t0 = max(t0, t)
+            else:
+                if t < t0:
+                    return None
+                t1 = min(t1, t)
+    return (x0 + t0 * dx, y0 + t0 * dy), (x0 + t1 * dx, y0 + t1 * dy)
+
+
+def clip_line(points, lo, hi):
+    """Clips a line to the square [lo, hi], returning the pieces that remain inside."""
+    lines, current = [], []
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        segment = _clip_segment(x0, y0, x1, y1, lo, hi)
+        if segment is None:
+            if len(current) > 1:
+                lines.append(current)
+            current = []
+            continue
+        start, end = segment
+        if not current or current[-1] != start:
+            if len(current) > 1:
+                lines.append(current)
+            current = [start]
+        current.append(end)
+        if end != (x1, y1):  # left the tile
+            lines.append(current)
+            current = []
+    if len(current) > 1:
+        lines.append(current)
+    return lines
+
+
+def _to_tile(points, z, x, y):
+    n = 2 ** z
+    return [((px * n - x) * TILE_EXTENT, (py * n - y) * TILE_EXTENT) for px, py in points]
+
+
+def _round_line(line):
+    out = []
+    for px, py in line:
+        point = (int(round(px)), int(round(py)))
+        if not out or out[-1] != point:
+            out.append(point)
+    return out
+
+
+def _intersects(bbox, bounds):
+    return not (bbox[2] < bounds[0] or bbox[0] > bounds[2] or bbox[3] < bounds[1] or bbox[1] > bounds[3])
+
+
+# --- Route geometry from the mail routing database ---
+
+def _lat_lon(point):
+    if isinstance(point, dict):
+        lat = point.get("lat", point.get("latitude"))
+        lon = point.get("lng", point.get("lon", point.get("longitude")))
+        if lat is not None and lon is not None:
+            return float(lat), float(lon)
+        return None
+    if isinstance(point, (list, tuple)) and len(point) >= 2:
+        return float(point[0]), float(point[1])
+    return None
+
+
+def route_coordinates(route_path):
+    """
+    [(lat, lon), ...] from a stored route_path. Accepts the shapes found in
+    the routes table: GeoJSON LineString/Feature, {"path": [...]}-style
+    wrappers, lists of {lat, lng} dicts, [lat, lon] pairs, or location names
+    (resolved through the geocode cache only, never the network).
+    """
+    if isinstance(route_path, str):
+        try:
+            route_path = json.loads(route_path)
+        except ValueError:
+            return []
+    if isinstance(route_path, dict):
+        if route_path.get("type") == "Feature":
+            return route_coordinates(route_path.get("geometry") or {})
+        if route_path.get("type") == "LineString":
+            return [(float(lat), float(lon)) for lon, lat, *_ in route_path.get("coordinates", [])]
+        for key in ("path", "route", "points", "coordinates", "locations"):
+            if key in route_path:
+                return route_coordinates(route_path[key])
+        return []
+    coords = []
+    for point in route_path or []:
+        if isinstance(point, str):
+            cached = geocode_cache.peek(point.strip().lower())
+            if cached is not None:
+                coords.append(cached)
+            continue
+        lat_lon = _lat_lon(point)
+        if lat_lon is not None:
+            coords.append(lat_lon)
+    return coords
+
+
+class RouteGeometryIndex:
+    """Active routes projected to normalized Mercator, with per-zoom simplified copies."""
+
+    def __init__(self, rows):
+        self.routes = []
+        for row in rows:
+            coords = route_coordinates(row["route_path"])
+            if len(coords) < 2:
+                continue
+            points = [mercator(lat, lon) for lat, lon in coords]
+            xs = [p[0] for p in points]
+            ys = [p[1] for p in points]
+            self.routes.append({
+                "id": row["id"],
+                "points": points,
+                "bbox": (min(xs), min(ys), max(xs), max(ys)),
+                "simplified": {},
+                "properties": {
+                    "parcel_id": row["parcel_id"],
+                    "transport_mode": row["transport_mode"],
+                    "duration": row["duration"],
+                    "distance": row["distance"]
+                }
+            })
+
+    def features(self, z, x, y):
+        bounds = tile_bounds(z, x, y)
+        tolerance = TILE_SIMPLIFY_PIXELS / (256 * 2 ** z)
+        features = []
+        for route in self.routes:
+            if not _intersects(route["bbox"], bounds):
+                continue
+            points = route["simplified"].get(z)
+            if points is None:
+                points = route["simplified"][z] = simplify(route["points"], tolerance)
+            lines = [_round_line(line) for line in clip_line(_to_tile(points, z, x, y),
+                                                             -TILE_BUFFER, TILE_EXTENT + TILE_BUFFER)]
+            lines = [line for line in lines if len(line) > 1]
+            if lines:
+                features.append((route["id"], 2, lines, route["properties"]))
+        return features
+
+
+_engine = None
+_index = RouteGeometryIndex([])
+_index_fingerprint = None
+_index_checked_at = 0.0
+_index_lock = threading.Lock()
+
+
+def _get_engine():
+    global _engine
+    if _engine is None:
+        _engine = create_engine(ROUTES_DATABASE_URL, pool_pre_ping=True)
+    return _engine
+
+
+def load_active_routes():
+    query = text("SELECT id, parcel_id, route_path, transport_mode, duration, distance "
+                 "FROM routes WHERE active = :active ORDER BY id")
+    with _get_engine().connect() as connection:
+        return [dict(row._mapping) for row in connection.execute(query, {"active": True})]
+
+
+def _fingerprint(rows):
+    digest = hashlib.blake2b(digest_size=16)
+    for row in rows:
+        path = row["route_path"]
+        digest.update(f"{row['id']}|{path if isinstance(path, str) else json.dumps(path, sort_keys=True)}\n"
+                      .encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get_route_index(force=False):
+    """
+    Returns the route geometry index, re-reading the routes table at most every
+    TILE_ROUTES_REFRESH_SECONDS. Route tiles are dropped when the active routes change.
+    """
+    global _index, _index_fingerprint, _index_checked_at
+    if not force and time.monotonic() - _index_checked_at < TILE_ROUTES_REFRESH_SECONDS:
+        return _index
+    with _index_lock:
+        if not force and time.monotonic() - _index_checked_at < TILE_ROUTES_REFRESH_SECONDS:
+            return _index
+        try:
+            rows = load_active_routes()
+        except Exception as e:
+            print(f"Could not load routes for vector tiles: {e}")
+            _index_checked_at = time.monotonic()
+            return _index
+        fingerprint = _fingerprint(rows)
+        if fingerprint != _index_fingerprint:
+            _index = RouteGeometryIndex(rows)
+            _index_fingerprint = fingerprint
+            _route_tiles.clear()
+        _index_checked_at = time.monotonic()
+    return _index
+
+
+def invalidate_route_tiles():
+    """Drops cached route tiles and reloads the active routes."""
+    get_route_index(force=True)
+    _route_tiles.clear()
+
+
+# --- Live layers from the provider caches ---
+
+def _point_features(items, z, x, y):
+    bounds = tile_bounds(z, x, y)
+    n = 2 ** z
+    features = []
+    for lat, lon, properties in items:
+        px, py = mercator(lat, lon)
+        if bounds[0] <= px <= bounds[2] and bounds[1] <= py <= bounds[3]:
+            point = (int(round((px * n - x) * TILE_EXTENT)), int(round((py * n - y) * TILE_EXTENT)))
+            features.append((None, 1, [point], properties))
+    return features
+
+
+def incident_features(z, x, y):
+    points, lines = [], []
+    seen = set()
+    # Polled incident lists plus incidents received from the event stream
+    for incidents in traffic_incidents_cache.values() + [incident_index.values()]:
+        if not isinstance(incidents, list):
+            continue
+        for incident in incidents:
+            location = incident.get("location") or []
+            key = (incident.get("title"), json.dumps(location))
+            if not location or key in seen:
+                continue
+            seen.add(key)
+            properties = {
+                "type": incident.get("type"),
+                "title": incident.get("title"),
+                "severity": incident.get("severity"),
+                "delay": incident.get("delay"),
+                "road_closed": incident.get("isRoadClosed")
+            }
+            if isinstance(location[0], (list, tuple)):  # LineString as [[lon, lat], ...]
+                lines.append(([mercator(lat, lon) for lon, lat, *_ in location], properties))
+            else:
+                points.append((location[1], location[0], properties))
+
+    features = _point_features(points, z, x, y)
+    tolerance = TILE_SIMPLIFY_PIXELS / (256 * 2 ** z)
+    for line, properties in lines:
+        clipped = [_round_line(piece) for piece in clip_line(_to_tile(simplify(line, tolerance), z, x, y),
+                                                              -TILE_BUFFER, TILE_EXTENT + TILE_BUFFER)]
+        clipped = [piece for piece in clipped if len(piece) > 1]
+        if clipped:
+            features.append((None, 2, clipped, properties))
+    return features
+
+
+def traffic_features(z, x, y):
+    items = []
+    for flow in traffic_flow_cache.values():
+        location = flow.get("location") if isinstance(flow, dict) else None
+        if not location:
+            continue
+        items.append((location["lat"], location["lon"], {
+            "congestion_level": flow.get("congestion_level"),
+            "current_speed_kmh": flow.get("current_speed_kmh"),
+            "free_flow_speed_kmh": flow.get("free_flow_speed_kmh"),
+            "road_closure": flow.get("road_closure")
+        }))
+    return _point_features(items, z, x, y)
+
+
+def _layer_tile(layer, z, x, y):
+    """(encoded layer, feature count), from the route or live tile cache."""
+    if layer == "routes":
+        cache, key = _route_tiles, (z, x, y)
+    else:
+        cache, key = _live_tiles, (layer, z, x, y)
+    cached = cache.get(key)
+    if cached is None:
+        if layer == "routes":
+            features = get_route_index().features(z, x, y)
+        elif layer == "incidents":
+            features = incident_features(z, x, y)
+        else:
+            features = traffic_features(z, x, y)
+        cached = (encode_layer(layer, features), len(features))
+        cache.set(key, cached)
+    return cached
+
+
+def render_tile(layer, z, x, y):
+    """
+    Returns the encoded tile for a layer ('routes', 'incidents', 'traffic' or
+    'all'); b"" if it has no features. Raises ValueError for an unknown layer
+    or an out-of-range tile.
+    """
+    if layer != "all" and layer not in LAYERS:
+        raise ValueError(f"Unknown layer '{layer}'. Use one of: all, {', '.join(LAYERS)}")
+    if not 0 <= z <= MAX_ZOOM or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+        raise ValueError(f"Tile {z}/{x}/{y} is out of range")
+    get_route_index()  # picks up route changes before serving cached route tiles
+    layers = [_layer_tile(name, z, x, y) for name in (LAYERS if layer == "all" else (layer,))]
+    if not any(count for _, count in layers):
+        return b""
+    return b"".join(encoded for encoded, count in layers if count)
@@ -0,0 +1,309 @@
+# Builds the post office dataset (head, sub and branch offices) with coordinates.
+#
+# Offices are streamed from the India Post pincode API, already geocoded ones are
+# skipped, and the rest are geocoded through Nominatim in rate-limited parallel
+# batches. After every batch the new rows are appended to the output CSV and a
+# checkpoint is written, so an interrupted run resumes where it stopped.
+# A source counts as done only once all of its offices are geocoded; if a
+# request failed it is fetched again on the next run. Offices Nominatim has
+# no result for are recorded in the checkpoint and not looked up again.
+#
+# Examples:
+#   python post_office_geocoder.py --branch-type "Head Post Office" -o india_head_post_offices_with_coords.csv
+#   python post_office_geocoder.py --pincode-range 110001 110099 -o delhi_post_offices.csv
+#
+# An existing output file written with fewer columns (such as the shipped
+# india_head_post_offices_with_coords.csv, which has no BranchType) is
+# rewritten with the extra columns left empty before appending; a file with
+# any other header is refused rather than mixed with rows it does not match.
+#
+# The output stays CSV: route_planner.py and trunk_legs.py read it with
+# csv.DictReader, and appending rows after each batch is what keeps a resumed
+# run cheap.
+#
+# The public Nominatim instance allows 1 request/second; point NOMINATIM_URL at a
+# self-hosted instance and raise --geocode-rate to geocode faster.
+
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import requests
+
+PINCODE_API_URL = os.getenv("PINCODE_API_URL", "https://api.postalpincode.in")
+NOMINATIM_URL = os.getenv("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+USER_AGENT = "IndiaPostRouteOptimizer/1.0"
+
+# Same list the head post office dataset was originally built from
+STATE_CAPITALS = [
+    'Mumbai', 'Delhi', 'Bengaluru', 'Hyderabad', 'Ahmedabad',
+    'Chennai', 'Kolkata', 'Lucknow', 'Jaipur', 'Bhopal',
+    'Chandigarh', 'Bhubaneswar', 'Patna', 'Ranchi', 'Raipur',
+    'Guwahati', 'Dehradun', 'Imphal', 'Shillong', 'Aizawl',
+    'Kohima', 'Agartala', 'Itanagar', 'Gangtok', 'Panaji',
+    'Thiruvananthapuram', 'Puducherry', 'Port Blair', 'Kavaratti',
+    'Leh', 'Daman', 'Silvassa', 'Jammu', 'Kashmir'
+]
+
+FIELDNAMES = [
+    'City', 'OfficeName', 'Pincode', 'Circle', 'District',
+    'Division', 'Region', 'State', 'Latitude', 'Longitude', 'BranchType'
+]
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all threads."""
+
+    def __init__(self, rate_per_second):
+        self.interval = 1.0 / rate_per_second
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def office_key(office):
+    return (office['OfficeName'].strip().lower(), str(office['Pincode']).strip())
+
+
+def load_checkpoint(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"completed_sources": [], "failed_offices": []}
+
+
+def save_checkpoint(path, checkpoint):
+    # Write to a temporary file and rename so a crash never leaves a torn checkpoint
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def prepare_output(output_path):
+    """
+    Checks the header of an existing output file before rows are appended to it.
+    Returns True if the file is new (the header still has to be written) and
+    False if it can be appended to. A header that is a prefix of FIELDNAMES is
+    extended in place; any other header raises ValueError.
+    """
+    try:
+        with open(output_path, newline='', encoding='utf-8') as f:
+            header = next(csv.reader(f), None)
+    except FileNotFoundError:
+        return True
+    if not header:
+        return True
+    if header == FIELDNAMES:
+        return False
+    if header != FIELDNAMES[:len(header)]:
+        raise ValueError(f"{output_path} has columns {header}, expected {FIELDNAMES}")
+
+    # Rewrite to a temporary file and rename so a crash never leaves a half-converted file
+    tmp_path = f"{output_path}.tmp"
+    with open(output_path, newline='', encoding='utf-8') as src, \
+            open(tmp_path, "w", newline='', encoding='utf-8') as dst:
+        writer = csv.DictWriter(dst, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(csv.DictReader(src))
+    os.replace(tmp_path, output_path)
+    print(f"Added columns {FIELDNAMES[len(header):]} to {output_path}")
+    return False
+
+
+def load_geocoded_keys(output_path):
+    """Keys of offices already present in the output file."""
+    keys = set()
+    try:
+        with open(output_path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                if row.get('Latitude') and row.get('Longitude'):
+                    keys.add(office_key(row))
+    except FileNotFoundError:
+        pass
+    return keys
+
+
+def fetch_offices(source, limiter, session):
+    """Fetches all offices for a source: ('city', name) or ('pincode', code)."""
+    kind, value = source
+    path = "postoffice" if kind == "city" else "pincode"
+    limiter.wait()
+    response = session.get(f"{PINCODE_API_URL}/{path}/{value}", timeout=30)
+    response.raise_for_status()
+    data = response.json()
+    if not data or data[0].get('Status') != 'Success':
+        return []
+    return [
+        {
+            'City': value if kind == "city" else office.get('Block') or office.get('District'),
+            'OfficeName': office['Name'],
+            'Pincode': office['Pincode'],
+            'Circle': office.get('Circle'),
+            'District': office.get('District'),
+            'Division': office.get('Division'),
+            'Region': office.get('Region'),
+            'State': office.get('State'),
+            'BranchType': office.get('BranchType')
+        }
+        for office in data[0].get('PostOffice') or []
+    ]
+
+
+def geocode_office(office, limiter, session):
+    """Geocodes an office with Nominatim, falling back to its pincode. Returns (lat, lon) or (None, None)."""
+    queries = [
+        f"{office['OfficeName']}, {office['District']}, {office['State']}",
+        f"{office['Pincode']}, {office['State']}, India"
+    ]
+    for query in queries:
+        limiter.wait()
+        response = session.get(NOMINATIM_URL, params={'q': query, 'format': 'json', 'limit': 1}, timeout=30)
+        response.raise_for_status()
+        data = response.json()
+        if data:
+            return data[0]['lat'], data[0]['lon']
+    return None, None
+
+
+def _safe(func, *args):
+    try:
+        return func(*args)
+    except Exception as e:
+        return e
+
+
+def iter_sources(args):
+    if args.pincode_range:
+        start, end = args.pincode_range
+        for code in range(start, end + 1):
+            yield ("pincode", str(code))
+    elif args.pincodes_file:
+        with open(args.pincodes_file, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield ("pincode", line.strip())
+    else:
+        for city in args.cities or STATE_CAPITALS:
+            yield ("city", city)
+
+
+def run(args):
+    try:
+        new_file = prepare_output(args.output)
+    except ValueError as e:
+        print(f"Refusing to append: {e}")
+        return
+
+    checkpoint_path = args.checkpoint or f"{args.output}.checkpoint.json"
+    checkpoint = load_checkpoint(checkpoint_path)
+    completed = set(checkpoint["completed_sources"])
+    # Offices with no geocoding result; skipped on later runs
+    not_found = set(checkpoint["failed_offices"])
+    geocoded = load_geocoded_keys(args.output)
+    print(f"Resuming with {len(completed)} sources done and {len(geocoded)} offices already geocoded")
+
+    pincode_limiter = RateLimiter(args.pincode_rate)
+    geocode_limiter = RateLimiter(args.geocode_rate)
+    session = requests.Session()
+    session.headers.update({'User-Agent': USER_AGENT})
+
+    with open(args.output, "a", newline='', encoding='utf-8') as out, \
+            ThreadPoolExecutor(max_workers=args.workers) as pool:
+        writer = csv.DictWriter(out, fieldnames=FIELDNAMES)
+        if new_file:
+            writer.writeheader()
+
+        # Sources are read lazily, one batch at a time, so a long pincode list is never held in memory
+        pending = (source for source in iter_sources(args) if "|".join(source) not in completed)
+        batch_number = 0
+        retry_later = 0
+        while True:
+            batch = list(islice(pending, args.batch_size))
+            if not batch:
+                break
+            batch_number += 1
+
+            offices_by_source = {}
+            for source, result in zip(batch, pool.map(lambda s: _safe(fetch_offices, s, pincode_limiter, session), batch)):
+                if isinstance(result, Exception):
+                    print(f"Failed to fetch offices for {source[1]}: {result}")
+                    continue
+                offices_by_source[source] = result
+
+            # Dedupe within the batch and against everything geocoded or not found so far
+            to_geocode = {}
+            keys_by_source = {}
+            for source, offices in offices_by_source.items():
+                keys_by_source[source] = []
+                for office in offices:
+                    if args.branch_type and office['BranchType'] != args.branch_type:
+                        continue
+                    key = office_key(office)
+                    keys_by_source[source].append(key)
+                    if key not in geocoded and "|".join(key) not in not_found and key not in to_geocode:
+                        to_geocode[key] = office
+
+            results = pool.map(lambda o: _safe(geocode_office, o, geocode_limiter, session), to_geocode.values())
+            written = 0
+            errored = set()
+            for (key, office), result in zip(to_geocode.items(), results):
+                if isinstance(result, Exception):
+                    # Temporary failure: the office's source stays pending and is retried on the next run
+                    errored.add(key)
+                    continue
+                if result[0] is None:
+                    not_found.add("|".join(key))
+                    continue
+                office['Latitude'], office['Longitude'] = result
+                writer.writerow(office)
+                geocoded.add(key)
+                written += 1
+            out.flush()
+            os.fsync(out.fileno())
+
+            for source, keys in keys_by_source.items():
+                if errored.isdisjoint(keys):
+                    completed.add("|".join(source))
+            retry_later += len(batch) - sum(1 for source in batch if "|".join(source) in completed)
+            save_checkpoint(checkpoint_path, {
+                "completed_sources": sorted(completed),
+                "failed_offices": sorted(not_found)
+            })
+            print(f"Batch {batch_number}: {len(batch)} sources, "
+                  f"{written} offices geocoded, {len(geocoded)} total")
+
+    print(f"\n✅ CSV saved as: {args.output} ({len(geocoded)} offices, {len(not_found)} could not be geocoded, "
+          f"{retry_later} sources to retry)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Concurrent, resumable post office geocoding pipeline")
+    parser.add_argument("-o", "--output", default="india_post_offices_with_coords.csv")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <output>.checkpoint.json)")
+    parser.add_argument("--cities", nargs="*", help="look up offices by city (default: state capitals)")
+    parser.add_argument("--pincodes-file", help="file with one pincode per line")
+    parser.add_argument("--pincode-range", nargs=2, type=int, metavar=("START", "END"))
+    parser.add_argument("--branch-type", help="only keep offices of this type, e.g. 'Head Post Office'")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=50, help="sources per checkpointed batch")
+    parser.add_argument("--pincode-rate", type=float, default=5.0, help="pincode API requests per second")
+    parser.add_argument("--geocode-rate", type=float, default=1.0, help="geocoding requests per second")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    run(parse_args())
@@ -3,8 +3,10 @@ from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import models
 import schemas
 from database import get_db
@@ -28,14 +30,15 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 # User authentication
-def get_user(db: Session, username: str) -> Optional[models.User]:
+async def get_user(db: AsyncSession, username: str) -> Optional[models.User]:
     """Get a user by username."""
-    return db.query(models.User).filter(models.User.username == username).first()
+    return await db.scalar(select(models.User).where(models.User.username == username))
 
-def authenticate_user(db: Session, username: str, password: str) -> Optional[models.User]:
+async def authenticate_user(db: AsyncSession, username: str, password: str) -> Optional[models.User]:
     """Authenticate a user by username and password."""
-    user = get_user(db, username)
-    if not user or not verify_password(password, user.password):
+    user = await get_user(db, username)
+    # bcrypt is deliberately slow; keep it off the event loop
+    if not user or not await run_in_threadpool(verify_password, password, user.password):
         return None
     return user
 
@@ -55,7 +58,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme), 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> models.User:
     """Get the current user from the token."""
     credentials_exception = HTTPException(
@@ -75,7 +78,7 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
         
-    user = get_user(db, username=token_data.username)
+    user = await get_user(db, username=token_data.username)
     
     if user is None:
         raise credentials_exception
@@ -1,19 +1,27 @@
+import os
 import uvicorn
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from starlette.responses import FileResponse
+from starlette.responses import FileResponse, PlainTextResponse
 
 # Internal imports
-from database import engine, Base
 import models
+from database import async_engine
 import schemas
 from routers import auth, parcels, routes, notifications, issues, users, stats
+from auth_utils import get_admin_user
+from responses import FastJSONResponse, ResponseCompressionMiddleware, get_response_stats
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, render_metrics
+from pagination import NEXT_CURSOR_HEADER
+from migrate import run_migrations
 
-# Create all tables in the database
-Base.metadata.create_all(bind=engine)
+# Bring the schema up to date (see migrate.py); deployments that migrate
+# as a release step set RUN_MIGRATIONS_ON_STARTUP=false
+if os.getenv("RUN_MIGRATIONS_ON_STARTUP", "true").lower() in ("1", "true", "yes"):
+    run_migrations()
 
-app = FastAPI(title="Mail Routing API")
+app = FastAPI(title="Mail Routing API", default_response_class=FastJSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -22,8 +30,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],  # keyset pagination cursor for list endpoints
 )
 
+# Compress large JSON responses (gzip/brotli) and record serialization stats
+app.add_middleware(ResponseCompressionMiddleware)
+# Outermost, so request latency includes compression
+app.add_middleware(MetricsMiddleware)
+
 # Include API routers
 app.include_router(auth.router, tags=["Authentication"])
 app.include_router(users.router, prefix="/api", tags=["Users"])
@@ -33,6 +47,20 @@ app.include_router(notifications.router, prefix="/api", tags=["Notifications"])
 app.include_router(issues.router, prefix="/api", tags=["Issues"])
 app.include_router(stats.router, prefix="/api", tags=["Stats"])
 
+@app.on_event("shutdown")
+async def close_database_pool():
+    await async_engine.dispose()
+
+@app.get("/metrics", tags=["Metrics"])
+async def metrics():
+    """Prometheus metrics: request latency histograms and response sizes."""
+    return PlainTextResponse(render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/api/metrics/responses", tags=["Metrics"])
+async def response_metrics(current_user: models.User = Depends(get_admin_user)):
+    """Per-endpoint serialization time and bytes on the wire."""
+    return get_response_stats()
+
 # Serve the static frontend files
 app.mount("/assets", StaticFiles(directory="../client/dist/assets"), name="assets")
 
@@ -0,0 +1,15 @@
+import os
+import sys
+
+# --- Prometheus metrics ---
+#
+# The registry, middleware and HTTP metrics are shared with the other Python
+# service and live in service_common/metrics.py at the repository root.
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from service_common.metrics import (  # noqa: E402,F401
+    CONTENT_TYPE, CallbackMetric, Counter, Gauge, Histogram, MetricsMiddleware, render_metrics, route_label
+)
@@ -0,0 +1,97 @@
+import argparse
+import importlib.util
+import os
+import re
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, text
+
+from database import engine
+
+# --- Versioned schema migrations ---
+#
+# Migrations are the numbered modules in migrations/ (0001_initial.py,
+# 0002_..., ...), each with an upgrade(connection) function. Applied
+# versions are recorded in schema_migrations; run_migrations applies the
+# pending ones in order, each in its own transaction together with its
+# schema_migrations row, so a failed migration leaves nothing half applied.
+# On PostgreSQL an advisory lock makes concurrent starts (several workers)
+# run them once.
+#
+#   python migrate.py           # apply pending migrations
+#   python migrate.py --list    # show applied and pending migrations
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.py$")
+ADVISORY_LOCK_KEY = 7413001
+
+schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def discover_migrations(directory=MIGRATIONS_DIR):
+    """Returns [(version, name, module)] for the migration files, in version order."""
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        spec = importlib.util.spec_from_file_location(f"migration_{match.group(1)}",
+                                                      os.path.join(directory, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        migrations.append((int(match.group(1)), match.group(2), module))
+    versions = [version for version, _, _ in migrations]
+    if len(versions) != len(set(versions)):
+        raise RuntimeError(f"Duplicate migration versions in {directory}")
+    return migrations
+
+
+def applied_versions(connection):
+    schema_migrations.create(connection, checkfirst=True)
+    return {row.version for row in connection.execute(schema_migrations.select())}
+
+
+def run_migrations(bind=engine, directory=MIGRATIONS_DIR):
+    """Applies pending migrations; returns the versions applied."""
+    applied = []
+    with bind.connect() as lock_connection:
+        postgres = bind.dialect.name == "postgresql"
+        if postgres:
+            lock_connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+            lock_connection.commit()
+        try:
+            with bind.begin() as connection:
+                done = applied_versions(connection)
+            for version, name, module in discover_migrations(directory):
+                if version in done:
+                    continue
+                with bind.begin() as connection:
+                    module.upgrade(connection)
+                    connection.execute(schema_migrations.insert().values(
+                        version=version, name=name, applied_at=datetime.utcnow()
+                    ))
+                applied.append(version)
+        finally:
+            if postgres:
+                lock_connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+                lock_connection.commit()
+    return applied
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply database schema migrations")
+    parser.add_argument("--list", action="store_true", help="List migrations without applying them")
+    args = parser.parse_args()
+    if args.list:
+        with engine.begin() as connection:
+            done = applied_versions(connection)
+        for version, name, module in discover_migrations():
+            print(f"{version:04d} {name:<40} {'applied' if version in done else 'pending'}")
+    else:
+        applied = run_migrations()
+        print(f"Applied migrations: {', '.join(f'{v:04d}' for v in applied)}" if applied else "Schema is up to date")
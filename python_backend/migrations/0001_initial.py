@@ -0,0 +1,131 @@
+"""Baseline schema: the tables as they were when migrations were introduced.
+
+The tables are declared here rather than read from models, so this
+migration creates the same schema however the models change later.
+Databases created before migrations existed (by create_all at import)
+already have these tables; checkfirst skips them, so this only records
+the baseline there.
+"""
+
+from sqlalchemy import JSON, Boolean, Column, DateTime, ForeignKey, Integer, MetaData, String, Table
+
+metadata = MetaData()
+
+Table(
+    "users", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("username", String, unique=True, nullable=False),
+    Column("password", String, nullable=False),
+    Column("email", String, nullable=False),
+    Column("phone", String, nullable=True),
+    Column("role", String, nullable=False),
+    Column("full_name", String, nullable=False),
+)
+
+Table(
+    "parcels", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("tracking_number", String, unique=True, nullable=False),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("origin", String, nullable=False),
+    Column("destination", String, nullable=False),
+    Column("status", String, nullable=False),
+    Column("transport_mode", String, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("estimated_delivery", DateTime, nullable=True),
+    Column("actual_delivery", DateTime, nullable=True),
+    Column("weight", String, nullable=False),
+    Column("dimensions", String, nullable=True),
+    Column("current_location", String, nullable=True),
+    Column("notes", String, nullable=True),
+    Column("delay_reason", String, nullable=True),
+    Column("delay_duration", String, nullable=True),
+)
+
+Table(
+    "routes", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("parcel_id", Integer, ForeignKey("parcels.id"), nullable=False),
+    Column("route_path", JSON, nullable=False),
+    Column("transport_mode", String, nullable=False),
+    Column("duration", String, nullable=False),
+    Column("distance", String, nullable=False),
+    Column("weather", JSON, nullable=True),
+    Column("traffic", JSON, nullable=True),
+    Column("active", Boolean, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+)
+
+Table(
+    "notifications", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+    Column("parcel_id", Integer, ForeignKey("parcels.id"), nullable=False),
+    Column("type", String, nullable=False),
+    Column("message", String, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("read", Boolean, nullable=False),
+    Column("sent", Boolean, nullable=False),
+    Column("channel", String, nullable=False),
+)
+
+Table(
+    "issues", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("title", String, nullable=False),
+    Column("description", String, nullable=False),
+    Column("severity", String, nullable=False),
+    Column("status", String, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("resolved_at", DateTime, nullable=True),
+    Column("affected_parcels", JSON, nullable=True),
+    Column("location", String, nullable=True),
+    Column("issue_type", String, nullable=False),
+)
+
+Table(
+    "notification_preferences", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("user_id", Integer, ForeignKey("users.id"), unique=True, nullable=False),
+    Column("delay_notifications", Boolean, nullable=False),
+    Column("weather_alerts", Boolean, nullable=False),
+    Column("status_changes", Boolean, nullable=False),
+    Column("delivery_confirmations", Boolean, nullable=False),
+    Column("email_enabled", Boolean, nullable=False),
+    Column("sms_enabled", Boolean, nullable=False),
+    Column("push_enabled", Boolean, nullable=False),
+    Column("frequency", String, nullable=False),
+)
+
+Table(
+    "stats", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("active_parcels", Integer, nullable=False),
+    Column("active_routes", Integer, nullable=False),
+    Column("delayed_parcels", Integer, nullable=False),
+    Column("on_time_rate", String, nullable=False),
+    Column("road_transit_percentage", String, nullable=False),
+    Column("rail_transit_percentage", String, nullable=False),
+    Column("air_transit_percentage", String, nullable=False),
+    Column("weather_impact_percentage", String, nullable=False),
+    Column("traffic_congestion_percentage", String, nullable=False),
+    Column("mechanical_issues_percentage", String, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+)
+
+Table(
+    "outbox_events", metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("topic", String, nullable=False),
+    Column("aggregate_type", String, nullable=False),
+    Column("aggregate_id", Integer, nullable=False),
+    Column("event_type", String, nullable=False),
+    Column("payload", JSON, nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("published_at", DateTime, nullable=True, index=True),
+    Column("attempts", Integer, nullable=False),
+)
+
+
+def upgrade(connection):
+    metadata.create_all(connection, checkfirst=True)
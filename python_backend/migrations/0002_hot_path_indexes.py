@@ -0,0 +1,40 @@
+"""Composite and partial indexes for the list and filter queries.
+
+Databases created by create_all before migrations existed already have
+them; checkfirst skips those. On a large PostgreSQL database, building
+them here blocks writes to the table while each one builds: create them
+beforehand with CREATE INDEX CONCURRENTLY (same names) and this migration
+then only records them.
+"""
+
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, MetaData, String, Table
+
+metadata = MetaData()
+
+# Only the indexed columns; the tables themselves come from 0001
+parcels = Table("parcels", metadata, Column("id", Integer), Column("user_id", Integer), Column("status", String))
+routes = Table("routes", metadata, Column("id", Integer), Column("parcel_id", Integer), Column("active", Boolean))
+notifications = Table("notifications", metadata, Column("id", Integer), Column("user_id", Integer),
+                      Column("read", Boolean), Column("created_at", DateTime))
+issues = Table("issues", metadata, Column("id", Integer), Column("status", String), Column("issue_type", String),
+               Column("created_at", DateTime))
+
+INDEXES = [
+    Index("ix_parcels_user_id", parcels.c.user_id, parcels.c.id),
+    Index("ix_parcels_status", parcels.c.status, parcels.c.id),
+    Index("ix_routes_parcel_id", routes.c.parcel_id),
+    Index("ix_routes_active", routes.c.id,
+          postgresql_where=routes.c.active == True, sqlite_where=routes.c.active == True),  # noqa: E712
+    Index("ix_notifications_user_id_created_at",
+          notifications.c.user_id, notifications.c.created_at, notifications.c.id),
+    Index("ix_notifications_user_id_read_created_at",
+          notifications.c.user_id, notifications.c.read, notifications.c.created_at, notifications.c.id),
+    Index("ix_issues_created_at", issues.c.created_at, issues.c.id),
+    Index("ix_issues_status_created_at", issues.c.status, issues.c.created_at, issues.c.id),
+    Index("ix_issues_issue_type_created_at", issues.c.issue_type, issues.c.created_at, issues.c.id),
+]
+
+
+def upgrade(connection):
+    for index in INDEXES:
+        index.create(connection, checkfirst=True)
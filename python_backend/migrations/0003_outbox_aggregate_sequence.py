@@ -0,0 +1,33 @@
+"""Per-aggregate sequence numbers for outbox events (see outbox.py).
+
+Adds outbox_events.aggregate_sequence and the outbox_sequences counters.
+Events already in the outbox are numbered in id order per aggregate, and
+the counters continue from there.
+"""
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, text
+
+metadata = MetaData()
+
+outbox_sequences = Table(
+    "outbox_sequences", metadata,
+    Column("aggregate_type", String, primary_key=True),
+    Column("aggregate_id", Integer, primary_key=True),
+    Column("last_sequence", Integer, nullable=False),
+)
+
+
+def upgrade(connection):
+    connection.execute(text("ALTER TABLE outbox_events ADD COLUMN aggregate_sequence INTEGER"))
+    connection.execute(text(
+        "UPDATE outbox_events SET aggregate_sequence = ("
+        "SELECT count(*) FROM outbox_events AS earlier "
+        "WHERE earlier.aggregate_type = outbox_events.aggregate_type "
+        "AND earlier.aggregate_id = outbox_events.aggregate_id AND earlier.id <= outbox_events.id)"
+    ))
+    outbox_sequences.create(connection)
+    connection.execute(text(
+        "INSERT INTO outbox_sequences (aggregate_type, aggregate_id, last_sequence) "
+        "SELECT aggregate_type, aggregate_id, max(aggregate_sequence) FROM outbox_events "
+        "GROUP BY aggregate_type, aggregate_id"
+    ))
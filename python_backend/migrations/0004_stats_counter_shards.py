@@ -0,0 +1,47 @@
+"""Sharded Stats counters (see stats_counters.py) and the Stats row itself.
+
+Creates the single Stats row if it is missing, since the counters and
+percentages are updated in place and a missing row would go unnoticed.
+The current active_parcels, active_routes and delayed_parcels values move
+to shard 0 of stats_counter_shards.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select
+
+metadata = MetaData()
+
+COUNTERS = ("active_parcels", "active_routes", "delayed_parcels")
+PERCENTAGES = ("on_time_rate", "road_transit_percentage", "rail_transit_percentage", "air_transit_percentage",
+               "weather_impact_percentage", "traffic_congestion_percentage", "mechanical_issues_percentage")
+
+stats = Table(
+    "stats", metadata,
+    Column("id", Integer, primary_key=True),
+    *(Column(name, Integer) for name in COUNTERS),
+    *(Column(name, String) for name in PERCENTAGES),
+    Column("updated_at", DateTime),
+)
+
+stats_counter_shards = Table(
+    "stats_counter_shards", metadata,
+    Column("counter", String, primary_key=True),
+    Column("shard", Integer, primary_key=True),
+    Column("value", Integer, nullable=False),
+)
+
+
+def upgrade(connection):
+    stats_counter_shards.create(connection)
+    row = connection.execute(select(stats).order_by(stats.c.id).limit(1)).first()
+    if row is None:
+        connection.execute(stats.insert().values(
+            id=1, updated_at=datetime.utcnow(), **dict.fromkeys(COUNTERS, 0), **dict.fromkeys(PERCENTAGES, "0")
+        ))
+        values = dict.fromkeys(COUNTERS, 0)
+    else:
+        values = {counter: row._mapping[counter] for counter in COUNTERS}
+    connection.execute(stats_counter_shards.insert(), [
+        {"counter": counter, "shard": 0, "value": value} for counter, value in values.items()
+    ])
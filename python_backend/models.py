@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, JSON, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database import Base
@@ -129,4 +129,55 @@ class Stats(Base):
     weather_impact_percentage = Column(String, nullable=False, default="0")
     traffic_congestion_percentage = Column(String, nullable=False, default="0")
     mechanical_issues_percentage = Column(String, nullable=False, default="0")
-    updated_at = Column(DateTime, default=func.now(), nullable=False)
\ No newline at end of file
+    updated_at = Column(DateTime, default=func.now(), nullable=False)
+
+
+class StatsCounterShard(Base):
+    """Part of a Stats counter; the counter is the sum of its shards (see stats_counters.py)."""
+    __tablename__ = "stats_counter_shards"
+
+    counter = Column(String, primary_key=True)  # active_parcels, active_routes, delayed_parcels
+    shard = Column(Integer, primary_key=True)
+    value = Column(Integer, nullable=False, default=0)
+
+class OutboxEvent(Base):
+    """Change event written in the same transaction as the change; published by outbox_relay.py."""
+    __tablename__ = "outbox_events"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    topic = Column(String, nullable=False)
+    aggregate_type = Column(String, nullable=False)  # parcel, route, issue
+    aggregate_id = Column(Integer, nullable=False)
+    aggregate_sequence = Column(Integer, nullable=True)  # 1, 2, ... per aggregate, in commit order
+    event_type = Column(String, nullable=False)  # created, updated, delayed, ...
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=func.now(), nullable=False)
+    published_at = Column(DateTime, nullable=True, index=True)  # NULL until the broker acknowledged it
+    attempts = Column(Integer, nullable=False, default=0)
+
+
+class OutboxSequence(Base):
+    """Last aggregate_sequence handed out per aggregate (see outbox.py)."""
+    __tablename__ = "outbox_sequences"
+
+    aggregate_type = Column(String, primary_key=True)
+    aggregate_id = Column(Integer, primary_key=True)
+    last_sequence = Column(Integer, nullable=False)
+
+
+# Indexes for the hot query paths. List endpoints page by id or by
+# (created_at, id) (see pagination.py), so the paging key is the trailing
+# part of each index and a page is a range read in index order. Partial
+# indexes cover only the rows the query asks for. Indexes added here need a
+# migration too (see migrations/).
+Index("ix_parcels_user_id", Parcel.user_id, Parcel.id)
+Index("ix_parcels_status", Parcel.status, Parcel.id)
+Index("ix_routes_parcel_id", Route.parcel_id)
+Index("ix_routes_active", Route.id,
+      postgresql_where=Route.active == True, sqlite_where=Route.active == True)
+Index("ix_notifications_user_id_created_at", Notification.user_id, Notification.created_at, Notification.id)
+Index("ix_notifications_user_id_read_created_at",
+      Notification.user_id, Notification.read, Notification.created_at, Notification.id)
+Index("ix_issues_created_at", Issue.created_at, Issue.id)
+Index("ix_issues_status_created_at", Issue.status, Issue.created_at, Issue.id)
+Index("ix_issues_issue_type_created_at", Issue.issue_type, Issue.created_at, Issue.id)
@@ -0,0 +1,90 @@
+import os
+from datetime import date, datetime
+
+from sqlalchemy import inspect
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+import models
+
+# --- Transactional outbox ---
+#
+# Parcel, route and issue changes are published to Kafka without a
+# dual write: the handler adds an OutboxEvent row to the session that holds
+# the change, so both are committed (or rolled back) together. Each event
+# costs the request an outbox_sequences upsert and an INSERT (and, for a
+# new row, a SELECT of its SQL-side defaults). outbox_relay.py reads unpublished rows in
+# id order, publishes them in batches and marks them published once the
+# broker has acknowledged them, so every committed change is delivered at
+# least once. Consumers deduplicate on event_id.
+#
+# Outbox ids are not in commit order, and several relays may publish
+# concurrently, so neither the id nor the publish order says which of two
+# events of one aggregate is newer. Each event therefore also gets an
+# aggregate_sequence (1, 2, ... per aggregate) from an upsert on its
+# outbox_sequences row. The upsert locks that row until the transaction
+# ends, so a second writer of the same aggregate waits and gets the next
+# number only after the first commits (or rolls back, which also undoes its
+# number). Events carry a full snapshot, so a consumer keeps the highest
+# aggregate_sequence seen per aggregate and ignores anything lower.
+
+OUTBOX_TOPICS = {
+    "parcel": os.getenv("OUTBOX_PARCEL_TOPIC", "parcel-events"),
+    "route": os.getenv("OUTBOX_ROUTE_TOPIC", "route-events"),
+    "issue": os.getenv("OUTBOX_ISSUE_TOPIC", "issue-events"),
+}
+
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def snapshot(obj):
+    """Loaded column values of a model instance as a JSON-serializable dict.
+
+    Reads the instance state directly; attributes that are not loaded are left
+    out, so add_outbox_event() refreshes them first.
+    """
+    loaded = inspect(obj).dict
+    return {column.name: _json_value(loaded[column.key])
+            for column in obj.__table__.columns if column.key in loaded}
+
+
+async def next_aggregate_sequence(db, aggregate_type, aggregate_id):
+    """Next aggregate_sequence for an aggregate; holds its outbox_sequences row lock until commit."""
+    table = models.OutboxSequence.__table__
+    insert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    statement = insert(table).values(
+        aggregate_type=aggregate_type, aggregate_id=aggregate_id, last_sequence=1
+    ).on_conflict_do_update(
+        index_elements=[table.c.aggregate_type, table.c.aggregate_id],
+        set_={"last_sequence": table.c.last_sequence + 1},
+    ).returning(table.c.last_sequence)
+    return (await db.execute(statement)).scalar_one()
+
+
+async def add_outbox_event(db, aggregate_type, obj, event_type, changes=None):
+    """Adds a change event for obj to the session; it is committed with the caller's transaction.
+
+    obj must have its primary key, so call db.flush() first for new rows.
+    Columns the flush left expired (defaults computed by the database, such
+    as created_at) are loaded before the snapshot is taken.
+    """
+    expired = inspect(obj).expired_attributes
+    if expired:
+        await db.refresh(obj, list(expired))
+    payload = {"data": snapshot(obj)}
+    if changes is not None:
+        payload["changes"] = sorted(changes)
+    event = models.OutboxEvent(
+        topic=OUTBOX_TOPICS[aggregate_type],
+        aggregate_type=aggregate_type,
+        aggregate_id=obj.id,
+        aggregate_sequence=await next_aggregate_sequence(db, aggregate_type, obj.id),
+        event_type=event_type,
+        payload=payload,
+    )
+    db.add(event)
+    return event
@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from database import SessionLocal
+import models
+
+try:
+    import confluent_kafka
+except ImportError:  # the API itself never publishes; only this relay needs Kafka
+    confluent_kafka = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# --- Outbox relay ---
+#
+# Publishes the change events that the API writes to outbox_events (see
+# outbox.py). Each pass reads up to OUTBOX_BATCH_SIZE unpublished rows in id
+# order with one query, hands them all to the producer, waits for the
+# delivery reports with a single flush, and then marks the acknowledged rows
+# published with one UPDATE. Rows that were not acknowledged stay
+# unpublished and are sent again by a later pass, so delivery is
+# at-least-once: a crash between the flush and the UPDATE re-sends a batch.
+#
+# Events are keyed by aggregate, so all events of one parcel land on one
+# partition, but they are not guaranteed to be published in change order:
+# outbox ids are allocated before commit, so a later change can commit (and
+# be published) with a lower id, and several relays publish their batches
+# independently. Consumers order by aggregate_sequence instead (see
+# outbox.py): it counts 1, 2, ... per aggregate in commit order, and keeping
+# the highest seen per aggregate drops duplicates and late, older events.
+#
+# Several relays may run: on PostgreSQL the batch is read with
+# FOR UPDATE SKIP LOCKED, so they claim disjoint rows.
+#
+#   python outbox_relay.py            # run until interrupted
+#   python outbox_relay.py --once     # drain the outbox and exit
+
+KAFKA_BOOTSTRAP_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+OUTBOX_POLL_INTERVAL_SECONDS = float(os.getenv("OUTBOX_POLL_INTERVAL_SECONDS", "0.5"))
+OUTBOX_DELIVERY_TIMEOUT_SECONDS = float(os.getenv("OUTBOX_DELIVERY_TIMEOUT_SECONDS", "30"))
+OUTBOX_RETENTION_HOURS = float(os.getenv("OUTBOX_RETENTION_HOURS", "24"))  # published rows are kept this long
+OUTBOX_CLEANUP_INTERVAL_SECONDS = 300
+
+PRODUCER_CONFIG = {
+    'bootstrap.servers': KAFKA_BOOTSTRAP_SERVERS,
+    'linger.ms': int(os.getenv("KAFKA_LINGER_MS", "20")),
+    'compression.type': os.getenv("KAFKA_COMPRESSION", "lz4"),
+    'acks': 'all',
+    'enable.idempotence': True,  # no duplicates or reordering from producer retries
+    'message.timeout.ms': int(OUTBOX_DELIVERY_TIMEOUT_SECONDS * 1000),
+}
+
+
+def _dumps(value):
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def encode_outbox_event(row):
+    return _dumps({
+        "event_id": row.id,
+        "aggregate_type": row.aggregate_type,
+        "aggregate_id": row.aggregate_id,
+        "aggregate_sequence": row.aggregate_sequence,
+        "event_type": row.event_type,
+        "occurred_at": row.created_at.isoformat() if row.created_at else None,
+        **row.payload,
+    })
+
+
+def create_producer():
+    if confluent_kafka is None:
+        raise RuntimeError("confluent-kafka is not installed; the outbox relay cannot publish")
+    return confluent_kafka.Producer(PRODUCER_CONFIG)
+
+
+def relay_batch(db, producer, batch_size=OUTBOX_BATCH_SIZE):
+    """Publishes one batch of unpublished events; returns (delivered, failed)."""
+    rows = db.query(models.OutboxEvent).filter(
+        models.OutboxEvent.published_at.is_(None)
+    ).order_by(models.OutboxEvent.id).limit(batch_size).with_for_update(skip_locked=True).all()
+    if not rows:
+        db.commit()
+        return 0, 0
+
+    delivered = []
+    errors = {}
+
+    def on_delivery(event_id):
+        def report(err, msg):
+            if err:
+                errors[event_id] = err
+            else:
+                delivered.append(event_id)
+        return report
+
+    for row in rows:
+        while True:
+            try:
+                producer.produce(row.topic, key=f"{row.aggregate_type}-{row.aggregate_id}",
+                                 value=encode_outbox_event(row), on_delivery=on_delivery(row.id))
+                break
+            except BufferError:
+                producer.poll(0.1)  # local queue full; serve delivery reports to make room
+    producer.flush(OUTBOX_DELIVERY_TIMEOUT_SECONDS)
+
+    if delivered:
+        db.query(models.OutboxEvent).filter(models.OutboxEvent.id.in_(delivered)).update(
+            {models.OutboxEvent.published_at: datetime.utcnow()}, synchronize_session=False
+        )
+    acknowledged = set(delivered)
+    failed = [row.id for row in rows if row.id not in acknowledged]
+    if failed:
+        db.query(models.OutboxEvent).filter(models.OutboxEvent.id.in_(failed)).update(
+            {models.OutboxEvent.attempts: models.OutboxEvent.attempts + 1}, synchronize_session=False
+        )
+        first_error = next(iter(errors.values()), "no delivery report before timeout")
+        print(f"Outbox relay: {len(failed)} of {len(rows)} events not delivered ({first_error}); will retry")
+    db.commit()
+    return len(delivered), len(failed)
+
+
+def purge_published(db, retention_hours=OUTBOX_RETENTION_HOURS):
+    """Deletes events published more than retention_hours ago."""
+    cutoff = datetime.utcnow() - timedelta(hours=retention_hours)
+    deleted = db.query(models.OutboxEvent).filter(
+        models.OutboxEvent.published_at.isnot(None),
+        models.OutboxEvent.published_at < cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+def run(once=False, producer=None):
+    producer = producer or create_producer()
+    last_cleanup = 0.0
+    try:
+        while True:
+            db = SessionLocal()
+            try:
+                delivered, failed = relay_batch(db, producer)
+                if time.monotonic() - last_cleanup > OUTBOX_CLEANUP_INTERVAL_SECONDS:
+                    purge_published(db)
+                    last_cleanup = time.monotonic()
+            except Exception as e:
+                db.rollback()
+                print(f"Outbox relay error: {e}")
+                delivered, failed = 0, 1
+            finally:
+                db.close()
+            if once and (failed or delivered < OUTBOX_BATCH_SIZE):
+                return
+            # A full batch means more are waiting; otherwise wait for new events
+            if failed or delivered < OUTBOX_BATCH_SIZE:
+                time.sleep(OUTBOX_POLL_INTERVAL_SECONDS)
+    finally:
+        producer.flush(OUTBOX_DELIVERY_TIMEOUT_SECONDS)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Publish outbox events to Kafka")
+    parser.add_argument("--once", action="store_true", help="Drain the outbox and exit")
+    args = parser.parse_args()
+    try:
+        run(once=args.once)
+    except KeyboardInterrupt:
+        pass
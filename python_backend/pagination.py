@@ -0,0 +1,122 @@
+import base64
+import json
+import os
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException, Query, status
+from sqlalchemy import literal, tuple_
+
+# --- Keyset pagination and list filters ---
+#
+# List endpoints return one bounded page at a time. Pages are ordered by a
+# key that is unique and indexed, either (id) or (created_at, id), and the
+# next page starts after the last row of the previous one:
+#
+#   WHERE (created_at, id) < (:last_created_at, :last_id) ORDER BY created_at DESC, id DESC LIMIT :n
+#
+# so the cost of a page does not grow with the table or with how deep the
+# client has paged, unlike OFFSET. The position is returned as an opaque
+# cursor in the X-Next-Cursor header (absent on the last page); the body is
+# still a plain list. No total count is computed, since that is a full scan.
+
+PAGE_SIZE_DEFAULT = int(os.getenv("PAGE_SIZE_DEFAULT", "100"))
+PAGE_SIZE_MAX = int(os.getenv("PAGE_SIZE_MAX", "1000"))
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageParams:
+    """Query parameters shared by paginated list endpoints."""
+
+    def __init__(
+        self,
+        limit: int = Query(PAGE_SIZE_DEFAULT, ge=1, le=PAGE_SIZE_MAX, description="Page size"),
+        cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+        created_after: Optional[datetime] = Query(None, description="Only rows created at or after this time"),
+        created_before: Optional[datetime] = Query(None, description="Only rows created before this time"),
+    ):
+        self.limit = limit
+        self.cursor = cursor
+        self.created_after = created_after
+        self.created_before = created_before
+
+
+def encode_cursor(values):
+    data = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(data, separators=(",", ":")).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, key_columns):
+    """Decodes a cursor into values for key_columns; raises 400 if it is malformed."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if not isinstance(data, list) or len(data) != len(key_columns):
+            raise ValueError("wrong number of values")
+        return [datetime.fromisoformat(value) if column.key == "created_at" else int(value)
+                for column, value in zip(key_columns, data)]
+    except (ValueError, TypeError, UnicodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def _sqlite_timestamp(value):
+    return value.isoformat(sep=" ", timespec="microseconds" if value.microsecond else "seconds")
+
+
+def filter_by(statement, model, **filters):
+    """Applies equality filters for the given column values, skipping those that are None."""
+    for name, value in filters.items():
+        if value is not None:
+            statement = statement.where(getattr(model, name) == value)
+    return statement
+
+
+def page_query(statement, model, page, dialect_name, newest_first=False):
+    """Adds the date filters, cursor condition, order and limit (+1) of a page to a select.
+
+    newest_first=False pages by id ascending; newest_first=True by
+    (created_at, id) descending.
+    """
+    if (page.created_after or page.created_before) and not hasattr(model, "created_at"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="This list cannot be filtered by creation time"
+        )
+    if page.created_after is not None:
+        statement = statement.where(model.created_at >= page.created_after)
+    if page.created_before is not None:
+        statement = statement.where(model.created_at < page.created_before)
+
+    key_columns = [model.created_at, model.id] if newest_first else [model.id]
+    if page.cursor:
+        values = decode_cursor(page.cursor, key_columns)
+        if newest_first:
+            bound = [literal(value, column.type) for column, value in zip(key_columns, values)]
+            if dialect_name == "sqlite":
+                # SQLite stores func.now() defaults as text without fractional
+                # seconds; bind the timestamp in that form so equal values compare equal
+                bound[0] = literal(_sqlite_timestamp(values[0]))
+            statement = statement.where(tuple_(*key_columns) < tuple_(*bound))
+        else:
+            statement = statement.where(model.id > values[0])
+    if newest_first:
+        statement = statement.order_by(model.created_at.desc(), model.id.desc())
+    else:
+        statement = statement.order_by(model.id)
+
+    # One extra row tells whether there is a next page without a COUNT
+    return statement.limit(page.limit + 1)
+
+
+async def paginate(db, statement, model, page, response, newest_first=False):
+    """Returns one page of a select and sets the X-Next-Cursor header."""
+    statement = page_query(statement, model, page, db.bind.dialect.name, newest_first)
+    rows = (await db.scalars(statement)).all()
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        last = rows[-1]
+        key_columns = [model.created_at, model.id] if newest_first else [model.id]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor([getattr(last, column.key) for column in key_columns])
+    return rows
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 import models
 import schemas
@@ -11,6 +13,7 @@ from auth_utils import (
     get_password_hash,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
+from stats_counters import STATS_COUNTERS, set_counters
 
 router = APIRouter()
 
@@ -20,10 +23,10 @@ TEST_PASSWORD_HASH = "$2b$10$VI1r0Y6HUdc4Ofv9tNRQJePiAS1ccf.yhvo/7HMNQbPberb1FTQ
 @router.post("/token", response_model=schemas.Token)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Login endpoint to get an access token."""
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     
     if not user:
         raise HTTPException(
@@ -43,10 +46,10 @@ async def login_for_access_token(
 @router.post("/api/login", response_model=schemas.User)
 async def login(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Login endpoint to get user data."""
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user(db, form_data.username, form_data.password)
     
     if not user:
         raise HTTPException(
@@ -59,13 +62,13 @@ async def login(
 @router.post("/api/register", response_model=schemas.User, status_code=status.HTTP_201_CREATED)
 async def register(
     user_data: schemas.UserCreate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Register a new user."""
     # Check if username exists
-    existing_user = db.query(models.User).filter(
+    existing_user = await db.scalar(select(models.User).where(
         models.User.username == user_data.username
-    ).first()
+    ))
     
     if existing_user:
         raise HTTPException(
@@ -74,7 +77,7 @@ async def register(
         )
     
     # Create the new user
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await run_in_threadpool(get_password_hash, user_data.password)
     
     new_user = models.User(
         username=user_data.username,
@@ -86,8 +89,8 @@ async def register(
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     # Create default notification preferences
     preferences = models.NotificationPreference(
@@ -103,7 +106,7 @@ async def register(
     )
     
     db.add(preferences)
-    db.commit()
+    await db.commit()
     
     return new_user
 
@@ -113,10 +116,10 @@ async def logout():
     return {"detail": "Successfully logged out"}
 
 @router.get("/api/seed-data")
-async def seed_test_data(db: Session = Depends(get_db)):
+async def seed_test_data(db: AsyncSession = Depends(get_db)):
     """Endpoint to seed test data for development."""
     # Check if data already exists
-    if db.query(models.User).count() > 0:
+    if await db.scalar(select(models.User.id).limit(1)) is not None:
         return {"detail": "Data already seeded"}
     
     # Create test users
@@ -151,7 +154,7 @@ async def seed_test_data(db: Session = Depends(get_db)):
     )
     
     db.add_all([admin_user, staff_user, sender_user])
-    db.commit()
+    await db.commit()
     
     # Create notification preferences for users
     for user_id in range(1, 4):
@@ -183,7 +186,9 @@ async def seed_test_data(db: Session = Depends(get_db)):
         mechanical_issues_percentage="8%"
     )
     
-    db.add(stats)
-    db.commit()
+    # The Stats row already exists (migration 0004); overwrite it with the demo figures
+    await db.merge(stats)
+    await set_counters(db, {counter: getattr(stats, counter) for counter in STATS_COUNTERS})
+    await db.commit()
     
     return {"detail": "Test data seeded successfully"}
\ No newline at end of file
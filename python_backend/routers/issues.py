@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from datetime import datetime
 import models
 import schemas
@@ -9,38 +10,51 @@ from auth_utils import (
     get_current_active_user,
     get_staff_or_admin_user
 )
+from outbox import add_outbox_event
+from pagination import PageParams, filter_by, paginate
+from stats_counters import adjust_stat, transition
 
 router = APIRouter()
 
 @router.get("/issues", response_model=List[schemas.Issue])
 async def get_issues(
-    db: Session = Depends(get_db),
+    response: Response,
+    page: PageParams = Depends(),
+    issue_status: Optional[str] = Query(None, alias="status"),
+    issue_type: Optional[str] = None,
+    severity: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Get all issues."""
+    """Get a page of issues, newest first."""
     # All users can view issues, but in a real application you might want to filter by role
-    issues = db.query(models.Issue).order_by(models.Issue.created_at.desc()).all()
-    return issues
+    query = filter_by(select(models.Issue), models.Issue,
+                      status=issue_status, issue_type=issue_type, severity=severity)
+    return await paginate(db, query, models.Issue, page, response, newest_first=True)
 
 @router.get("/issues/active", response_model=List[schemas.Issue])
 async def get_active_issues(
-    db: Session = Depends(get_db),
+    response: Response,
+    page: PageParams = Depends(),
+    issue_type: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Get active issues."""
-    issues = db.query(models.Issue).filter(
+    """Get a page of active issues, newest first."""
+    query = select(models.Issue).where(
         models.Issue.status == "active"
-    ).order_by(models.Issue.created_at.desc()).all()
-    return issues
+    )
+    query = filter_by(query, models.Issue, issue_type=issue_type)
+    return await paginate(db, query, models.Issue, page, response, newest_first=True)
 
 @router.get("/issues/{issue_id}", response_model=schemas.Issue)
 async def get_issue(
     issue_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Get a specific issue by ID."""
-    issue = db.query(models.Issue).filter(models.Issue.id == issue_id).first()
+    issue = await db.scalar(select(models.Issue).where(models.Issue.id == issue_id))
     
     if not issue:
         raise HTTPException(
@@ -53,7 +67,7 @@ async def get_issue(
 @router.post("/issues", response_model=schemas.Issue, status_code=status.HTTP_201_CREATED)
 async def create_issue(
     issue_data: schemas.IssueCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_staff_or_admin_user)
 ):
     """Create a new issue (staff/admin only)."""
@@ -61,23 +75,22 @@ async def create_issue(
     new_issue = models.Issue(**issue_data.dict())
     
     db.add(new_issue)
-    db.commit()
-    db.refresh(new_issue)
+    await db.flush()  # assigns the id for the change event
+    await add_outbox_event(db, "issue", new_issue, "created")
+    await db.commit()
+    await db.refresh(new_issue)
     
-    # If the issue affects parcels, update their status
+    # If the issue affects parcels, delay the ones that are not delayed yet
     if issue_data.affected_parcels:
         for parcel_id in issue_data.affected_parcels:
-            parcel = db.query(models.Parcel).filter(models.Parcel.id == parcel_id).first()
-            if parcel and parcel.status != "delayed":
-                parcel.status = "delayed"
-                parcel.delay_reason = f"Issue: {issue_data.title}"
-                db.commit()
-                
-                # Update stats
-                stats = db.query(models.Stats).first()
-                if stats:
-                    stats.delayed_parcels += 1
-                    db.commit()
+            if not await transition(db, models.Parcel.status, parcel_id, "delayed", "delayed"):
+                continue  # missing or already delayed
+            parcel = await db.scalar(select(models.Parcel).where(models.Parcel.id == parcel_id)
+                                     .execution_options(populate_existing=True))
+            parcel.delay_reason = f"Issue: {issue_data.title}"
+            await add_outbox_event(db, "parcel", parcel, "updated", ["status", "delay_reason"])
+            await adjust_stat(db, "delayed_parcels", 1)
+            await db.commit()
     
     return new_issue
 
@@ -85,11 +98,11 @@ async def create_issue(
 async def update_issue(
     issue_id: int,
     issue_data: schemas.IssueUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_staff_or_admin_user)
 ):
     """Update an issue (staff/admin only)."""
-    issue = db.query(models.Issue).filter(models.Issue.id == issue_id).first()
+    issue = await db.scalar(select(models.Issue).where(models.Issue.id == issue_id))
     
     if not issue:
         raise HTTPException(
@@ -97,39 +110,36 @@ async def update_issue(
             detail="Issue not found"
         )
     
-    # Check if status is being updated to 'resolved'
-    was_active = issue.status == "active"
-    is_now_resolved = issue_data.status == "resolved" if issue_data.status else False
+    # Only the request whose guarded UPDATE resolves the issue clears its parcels
+    is_now_resolved = False
+    if issue_data.status == "resolved":
+        is_now_resolved = await transition(db, models.Issue.status, issue.id, "resolved", "resolved") == 1
     
     # If issue is being resolved, set the resolved_at timestamp
-    if is_now_resolved and was_active:
+    if is_now_resolved:
         issue_data.resolved_at = datetime.utcnow()
     
     # Update issue fields
-    for field, value in issue_data.dict(exclude_unset=True).items():
+    changes = issue_data.dict(exclude_unset=True)
+    for field, value in changes.items():
         setattr(issue, field, value)
     
-    db.commit()
-    db.refresh(issue)
+    await add_outbox_event(db, "issue", issue, "updated", changes)
+    await db.commit()
+    await db.refresh(issue)
     
     # If the issue was resolved, update affected parcels
     if is_now_resolved and issue.affected_parcels:
         for parcel_id in issue.affected_parcels:
-            parcel = db.query(models.Parcel).filter(
-                models.Parcel.id == parcel_id,
-                models.Parcel.status == "delayed",
-                models.Parcel.delay_reason == f"Issue: {issue.title}"
-            ).first()
-            
-            if parcel:
-                parcel.status = "in_transit"
-                parcel.delay_reason = None
-                db.commit()
-                
-                # Update stats
-                stats = db.query(models.Stats).first()
-                if stats and stats.delayed_parcels > 0:
-                    stats.delayed_parcels -= 1
-                    db.commit()
+            cleared = await transition(db, models.Parcel.status, parcel_id, "in_transit", "delayed",
+                                       models.Parcel.delay_reason == f"Issue: {issue.title}")
+            if not cleared:
+                continue  # delayed for another reason, or already cleared
+            parcel = await db.scalar(select(models.Parcel).where(models.Parcel.id == parcel_id)
+                                     .execution_options(populate_existing=True))
+            parcel.delay_reason = None
+            await add_outbox_event(db, "parcel", parcel, "updated", ["status", "delay_reason"])
+            await adjust_stat(db, "delayed_parcels", -1)
+            await db.commit()
     
     return issue
\ No newline at end of file
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 import models
 import schemas
 from database import get_db
@@ -8,44 +9,52 @@ from auth_utils import (
     get_current_active_user,
     get_staff_or_admin_user
 )
+from pagination import PageParams, filter_by, paginate
 
 router = APIRouter()
 
 @router.get("/notifications", response_model=List[schemas.Notification])
 async def get_user_notifications(
-    db: Session = Depends(get_db),
+    response: Response,
+    page: PageParams = Depends(),
+    notification_type: Optional[str] = Query(None, alias="type"),
+    read: Optional[bool] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Get notifications for the current user."""
-    notifications = db.query(models.Notification).filter(
+    """Get a page of notifications for the current user, newest first."""
+    query = select(models.Notification).where(
         models.Notification.user_id == current_user.id
-    ).order_by(models.Notification.created_at.desc()).all()
+    )
+    query = filter_by(query, models.Notification, type=notification_type, read=read)
     
-    return notifications
+    return await paginate(db, query, models.Notification, page, response, newest_first=True)
 
 @router.get("/notifications/unread", response_model=List[schemas.Notification])
 async def get_unread_notifications(
-    db: Session = Depends(get_db),
+    response: Response,
+    page: PageParams = Depends(),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Get unread notifications for the current user."""
-    notifications = db.query(models.Notification).filter(
+    """Get a page of unread notifications for the current user, newest first."""
+    query = select(models.Notification).where(
         models.Notification.user_id == current_user.id,
         models.Notification.read == False
-    ).order_by(models.Notification.created_at.desc()).all()
+    )
     
-    return notifications
+    return await paginate(db, query, models.Notification, page, response, newest_first=True)
 
 @router.get("/notifications/{notification_id}", response_model=schemas.Notification)
 async def get_notification(
     notification_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Get a specific notification."""
-    notification = db.query(models.Notification).filter(
+    notification = await db.scalar(select(models.Notification).where(
         models.Notification.id == notification_id
-    ).first()
+    ))
     
     if not notification:
         raise HTTPException(
@@ -65,13 +74,13 @@ async def get_notification(
 @router.put("/notifications/{notification_id}/read", response_model=schemas.Notification)
 async def mark_notification_as_read(
     notification_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Mark a notification as read."""
-    notification = db.query(models.Notification).filter(
+    notification = await db.scalar(select(models.Notification).where(
         models.Notification.id == notification_id
-    ).first()
+    ))
     
     if not notification:
         raise HTTPException(
@@ -87,37 +96,37 @@ async def mark_notification_as_read(
         )
     
     notification.read = True
-    db.commit()
-    db.refresh(notification)
+    await db.commit()
+    await db.refresh(notification)
     
     return notification
 
 @router.put("/notifications/read-all", status_code=status.HTTP_204_NO_CONTENT)
 async def mark_all_notifications_as_read(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Mark all notifications as read for the current user."""
-    db.query(models.Notification).filter(
+    await db.execute(update(models.Notification).where(
         models.Notification.user_id == current_user.id,
         models.Notification.read == False
-    ).update({"read": True})
+    ).values(read=True))
     
-    db.commit()
+    await db.commit()
     
     return {"detail": "All notifications marked as read"}
 
 @router.post("/notifications", response_model=schemas.Notification, status_code=status.HTTP_201_CREATED)
 async def create_notification(
     notification_data: schemas.NotificationCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_staff_or_admin_user)
 ):
     """Create a new notification (staff/admin only)."""
     # Check if user exists
-    user = db.query(models.User).filter(
+    user = await db.scalar(select(models.User).where(
         models.User.id == notification_data.user_id
-    ).first()
+    ))
     
     if not user:
         raise HTTPException(
@@ -126,9 +135,9 @@ async def create_notification(
         )
     
     # Check if parcel exists
-    parcel = db.query(models.Parcel).filter(
+    parcel = await db.scalar(select(models.Parcel).where(
         models.Parcel.id == notification_data.parcel_id
-    ).first()
+    ))
     
     if not parcel:
         raise HTTPException(
@@ -137,9 +146,9 @@ async def create_notification(
         )
     
     # Check user notification preferences
-    preferences = db.query(models.NotificationPreference).filter(
+    preferences = await db.scalar(select(models.NotificationPreference).where(
         models.NotificationPreference.user_id == notification_data.user_id
-    ).first()
+    ))
     
     # Skip notification creation if user has disabled this type
     if preferences:
@@ -156,20 +165,20 @@ async def create_notification(
     new_notification = models.Notification(**notification_data.dict())
     
     db.add(new_notification)
-    db.commit()
-    db.refresh(new_notification)
+    await db.commit()
+    await db.refresh(new_notification)
     
     return new_notification
 
 @router.get("/notification-preferences", response_model=schemas.NotificationPreference)
 async def get_notification_preferences(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Get notification preferences for the current user."""
-    preferences = db.query(models.NotificationPreference).filter(
+    preferences = await db.scalar(select(models.NotificationPreference).where(
         models.NotificationPreference.user_id == current_user.id
-    ).first()
+    ))
     
     if not preferences:
         # Create default preferences if not exists
@@ -186,21 +195,21 @@ async def get_notification_preferences(
         )
         
         db.add(preferences)
-        db.commit()
-        db.refresh(preferences)
+        await db.commit()
+        await db.refresh(preferences)
     
     return preferences
 
 @router.put("/notification-preferences", response_model=schemas.NotificationPreference)
 async def update_notification_preferences(
     preferences_data: schemas.NotificationPreferenceUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Update notification preferences for the current user."""
-    preferences = db.query(models.NotificationPreference).filter(
+    preferences = await db.scalar(select(models.NotificationPreference).where(
         models.NotificationPreference.user_id == current_user.id
-    ).first()
+    ))
     
     if not preferences:
         # Create preferences if not exists
@@ -210,8 +219,8 @@ async def update_notification_preferences(
         )
         
         db.add(new_preferences)
-        db.commit()
-        db.refresh(new_preferences)
+        await db.commit()
+        await db.refresh(new_preferences)
         
         return new_preferences
     
@@ -219,7 +228,7 @@ async def update_notification_preferences(
     for field, value in preferences_data.dict(exclude_unset=True).items():
         setattr(preferences, field, value)
     
-    db.commit()
-    db.refresh(preferences)
+    await db.commit()
+    await db.refresh(preferences)
     
     return preferences
\ No newline at end of file
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 import models
 import schemas
 from database import get_db
@@ -8,6 +9,9 @@ from auth_utils import (
     get_current_active_user,
     get_staff_or_admin_user
 )
+from outbox import add_outbox_event
+from pagination import PageParams, filter_by, paginate
+from stats_counters import adjust_stat, transition
 import random
 import string
 
@@ -22,29 +26,31 @@ def generate_tracking_number():
 
 @router.get("/parcels", response_model=List[schemas.Parcel])
 async def get_parcels(
-    db: Session = Depends(get_db),
+    response: Response,
+    page: PageParams = Depends(),
+    parcel_status: Optional[str] = Query(None, alias="status"),
+    transport_mode: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Get all parcels (filtered by role)."""
+    """Get a page of parcels (filtered by role), oldest first."""
+    query = select(models.Parcel)
     if current_user.role == "sender":
         # Senders can only see their own parcels
-        parcels = db.query(models.Parcel).filter(
-            models.Parcel.user_id == current_user.id
-        ).all()
-    else:
-        # Admin and staff can see all parcels
-        parcels = db.query(models.Parcel).all()
+        query = query.where(models.Parcel.user_id == current_user.id)
+    # Admin and staff can see all parcels
+    query = filter_by(query, models.Parcel, status=parcel_status, transport_mode=transport_mode)
         
-    return parcels
+    return await paginate(db, query, models.Parcel, page, response)
 
 @router.get("/parcels/{parcel_id}", response_model=schemas.Parcel)
 async def get_parcel(
     parcel_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Get a specific parcel by ID."""
-    parcel = db.query(models.Parcel).filter(models.Parcel.id == parcel_id).first()
+    parcel = await db.scalar(select(models.Parcel).where(models.Parcel.id == parcel_id))
     
     if not parcel:
         raise HTTPException(
@@ -64,12 +70,12 @@ async def get_parcel(
 @router.get("/parcels/track/{tracking_number}", response_model=schemas.Parcel)
 async def track_parcel(
     tracking_number: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Track a parcel by tracking number (public endpoint)."""
-    parcel = db.query(models.Parcel).filter(
+    parcel = await db.scalar(select(models.Parcel).where(
         models.Parcel.tracking_number == tracking_number
-    ).first()
+    ))
     
     if not parcel:
         raise HTTPException(
@@ -82,7 +88,7 @@ async def track_parcel(
 @router.post("/parcels", response_model=schemas.Parcel, status_code=status.HTTP_201_CREATED)
 async def create_parcel(
     parcel_data: schemas.ParcelCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Create a new parcel."""
@@ -91,9 +97,9 @@ async def create_parcel(
         parcel_data.tracking_number = generate_tracking_number()
     
     # Check if a parcel with this tracking number already exists
-    existing_parcel = db.query(models.Parcel).filter(
+    existing_parcel = await db.scalar(select(models.Parcel).where(
         models.Parcel.tracking_number == parcel_data.tracking_number
-    ).first()
+    ))
     
     if existing_parcel:
         raise HTTPException(
@@ -109,14 +115,11 @@ async def create_parcel(
     new_parcel = models.Parcel(**parcel_data.dict())
     
     db.add(new_parcel)
-    db.commit()
-    db.refresh(new_parcel)
-    
-    # Update stats
-    stats = db.query(models.Stats).first()
-    if stats:
-        stats.active_parcels += 1
-        db.commit()
+    await db.flush()  # assigns the id for the change event
+    await add_outbox_event(db, "parcel", new_parcel, "created")
+    await adjust_stat(db, "active_parcels", 1)
+    await db.commit()
+    await db.refresh(new_parcel)
     
     return new_parcel
 
@@ -124,11 +127,11 @@ async def create_parcel(
 async def update_parcel(
     parcel_id: int,
     parcel_data: schemas.ParcelUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Update a parcel."""
-    parcel = db.query(models.Parcel).filter(models.Parcel.id == parcel_id).first()
+    parcel = await db.scalar(select(models.Parcel).where(models.Parcel.id == parcel_id))
     
     if not parcel:
         raise HTTPException(
@@ -143,27 +146,20 @@ async def update_parcel(
             detail="Not enough permissions to update this parcel"
         )
     
-    # Check if status is being updated to 'delayed'
-    was_delayed = parcel.status == "delayed"
-    is_now_delayed = parcel_data.status == "delayed" if parcel_data.status else was_delayed
+    changes = parcel_data.dict(exclude_unset=True)
+    # Moving into or out of 'delayed' is decided by a guarded UPDATE, not the status read above
+    delayed = 0
+    if changes.get("status"):
+        delayed = await transition(db, models.Parcel.status, parcel.id, changes["status"], "delayed")
     
     # Update parcel fields
-    for field, value in parcel_data.dict(exclude_unset=True).items():
+    for field, value in changes.items():
         setattr(parcel, field, value)
     
-    db.commit()
-    db.refresh(parcel)
-    
-    # Update stats if delay status changed
-    if not was_delayed and is_now_delayed:
-        stats = db.query(models.Stats).first()
-        if stats:
-            stats.delayed_parcels += 1
-            db.commit()
-    elif was_delayed and not is_now_delayed:
-        stats = db.query(models.Stats).first()
-        if stats and stats.delayed_parcels > 0:
-            stats.delayed_parcels -= 1
-            db.commit()
+    await add_outbox_event(db, "parcel", parcel, "updated", changes)
+    if delayed:
+        await adjust_stat(db, "delayed_parcels", delayed)
+    await db.commit()
+    await db.refresh(parcel)
     
     return parcel
\ No newline at end of file
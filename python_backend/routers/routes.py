@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 import models
 import schemas
 from database import get_db
@@ -8,58 +9,65 @@ from auth_utils import (
     get_current_active_user,
     get_staff_or_admin_user
 )
+from outbox import add_outbox_event
+from pagination import PageParams, filter_by, paginate
+from stats_counters import adjust_stat, transition
 
 router = APIRouter()
 
 @router.get("/routes", response_model=List[schemas.Route])
 async def get_routes(
-    db: Session = Depends(get_db),
+    response: Response,
+    page: PageParams = Depends(),
+    transport_mode: Optional[str] = None,
+    active: Optional[bool] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Get all routes."""
+    """Get a page of routes, oldest first."""
+    query = select(models.Route)
     if current_user.role == "sender":
         # Senders can only see routes for their parcels
-        routes = db.query(models.Route).join(
+        query = query.join(
             models.Parcel, models.Route.parcel_id == models.Parcel.id
-        ).filter(
+        ).where(
             models.Parcel.user_id == current_user.id
-        ).all()
-    else:
-        # Admin and staff can see all routes
-        routes = db.query(models.Route).all()
+        )
+    # Admin and staff can see all routes
+    query = filter_by(query, models.Route, transport_mode=transport_mode, active=active)
         
-    return routes
+    return await paginate(db, query, models.Route, page, response)
 
 @router.get("/routes/active", response_model=List[schemas.Route])
 async def get_active_routes(
-    db: Session = Depends(get_db),
+    response: Response,
+    page: PageParams = Depends(),
+    transport_mode: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Get active routes."""
+    """Get a page of active routes, oldest first."""
+    query = select(models.Route).where(models.Route.active == True)
     if current_user.role == "sender":
         # Senders can only see routes for their parcels
-        routes = db.query(models.Route).join(
+        query = query.join(
             models.Parcel, models.Route.parcel_id == models.Parcel.id
-        ).filter(
-            models.Parcel.user_id == current_user.id,
-            models.Route.active == True
-        ).all()
-    else:
-        # Admin and staff can see all active routes
-        routes = db.query(models.Route).filter(
-            models.Route.active == True
-        ).all()
+        ).where(
+            models.Parcel.user_id == current_user.id
+        )
+    # Admin and staff can see all active routes
+    query = filter_by(query, models.Route, transport_mode=transport_mode)
         
-    return routes
+    return await paginate(db, query, models.Route, page, response)
 
 @router.get("/routes/{route_id}", response_model=schemas.Route)
 async def get_route(
     route_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Get a specific route by ID."""
-    route = db.query(models.Route).filter(models.Route.id == route_id).first()
+    route = await db.scalar(select(models.Route).where(models.Route.id == route_id))
     
     if not route:
         raise HTTPException(
@@ -69,9 +77,9 @@ async def get_route(
     
     # Check permissions for senders
     if current_user.role == "sender":
-        parcel = db.query(models.Parcel).filter(
+        parcel = await db.scalar(select(models.Parcel).where(
             models.Parcel.id == route.parcel_id
-        ).first()
+        ))
         
         if not parcel or parcel.user_id != current_user.id:
             raise HTTPException(
@@ -84,12 +92,12 @@ async def get_route(
 @router.get("/routes/parcel/{parcel_id}", response_model=List[schemas.Route])
 async def get_routes_for_parcel(
     parcel_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Get routes for a specific parcel."""
     # Check parcel exists
-    parcel = db.query(models.Parcel).filter(models.Parcel.id == parcel_id).first()
+    parcel = await db.scalar(select(models.Parcel).where(models.Parcel.id == parcel_id))
     
     if not parcel:
         raise HTTPException(
@@ -104,23 +112,23 @@ async def get_routes_for_parcel(
             detail="Not enough permissions to view routes for this parcel"
         )
     
-    routes = db.query(models.Route).filter(
+    routes = (await db.scalars(select(models.Route).where(
         models.Route.parcel_id == parcel_id
-    ).all()
+    ))).all()
     
     return routes
 
 @router.post("/routes", response_model=schemas.Route, status_code=status.HTTP_201_CREATED)
 async def create_route(
     route_data: schemas.RouteCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_staff_or_admin_user)
 ):
     """Create a new route (staff/admin only)."""
     # Check if parcel exists
-    parcel = db.query(models.Parcel).filter(
+    parcel = await db.scalar(select(models.Parcel).where(
         models.Parcel.id == route_data.parcel_id
-    ).first()
+    ))
     
     if not parcel:
         raise HTTPException(
@@ -132,14 +140,12 @@ async def create_route(
     new_route = models.Route(**route_data.dict())
     
     db.add(new_route)
-    db.commit()
-    db.refresh(new_route)
-    
-    # Update stats
-    stats = db.query(models.Stats).first()
-    if stats and new_route.active:
-        stats.active_routes += 1
-        db.commit()
+    await db.flush()  # assigns the id for the change event
+    await add_outbox_event(db, "route", new_route, "created")
+    if new_route.active:
+        await adjust_stat(db, "active_routes", 1)
+    await db.commit()
+    await db.refresh(new_route)
     
     return new_route
 
@@ -147,11 +153,11 @@ async def create_route(
 async def update_route(
     route_id: int,
     route_data: schemas.RouteUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_staff_or_admin_user)
 ):
     """Update a route (staff/admin only)."""
-    route = db.query(models.Route).filter(models.Route.id == route_id).first()
+    route = await db.scalar(select(models.Route).where(models.Route.id == route_id))
     
     if not route:
         raise HTTPException(
@@ -159,26 +165,20 @@ async def update_route(
             detail="Route not found"
         )
     
-    # Check if active status is being changed
-    was_active = route.active
-    is_now_active = route_data.active if route_data.active is not None else was_active
+    changes = route_data.dict(exclude_unset=True)
+    # Activating or deactivating is decided by a guarded UPDATE, not the value read above
+    activated = 0
+    if changes.get("active") is not None:
+        activated = await transition(db, models.Route.active, route.id, changes["active"], True)
     
     # Update route fields
-    for field, value in route_data.dict(exclude_unset=True).items():
+    for field, value in changes.items():
         setattr(route, field, value)
     
-    db.commit()
-    db.refresh(route)
-    
-    # Update stats if active status changed
-    stats = db.query(models.Stats).first()
-    if stats:
-        if not was_active and is_now_active:
-            stats.active_routes += 1
-            db.commit()
-        elif was_active and not is_now_active:
-            if stats.active_routes > 0:
-                stats.active_routes -= 1
-                db.commit()
+    await add_outbox_event(db, "route", route, "updated", changes)
+    if activated:
+        await adjust_stat(db, "active_routes", activated)
+    await db.commit()
+    await db.refresh(route)
     
     return route
\ No newline at end of file
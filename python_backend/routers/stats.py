@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 import models
 import schemas
@@ -8,16 +9,25 @@ from auth_utils import (
     get_current_active_user,
     get_staff_or_admin_user
 )
+from stats_counters import STATS_COUNTERS, get_counters, set_counters
 
 router = APIRouter()
 
+ACTIVE_PARCEL_STATUSES = ("preparing", "in_transit", "delayed", "customs_check")
+
+def percentage(part, total):
+    """part as a percentage of total, formatted like "12.5%"; "0%" when total is 0."""
+    if not total:
+        return "0%"
+    return f"{(part / total * 100):.1f}%"
+
 @router.get("/stats", response_model=schemas.Stats)
 async def get_stats(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Get system statistics."""
-    stats = db.query(models.Stats).first()
+    stats = await db.scalar(select(models.Stats))
     
     if not stats:
         # Create default stats if not exists
@@ -35,140 +45,111 @@ async def get_stats(
         )
         
         db.add(stats)
-        db.commit()
-        db.refresh(stats)
+        await db.commit()
+        await db.refresh(stats)
     
+    await get_counters(db, stats)
     return stats
 
 @router.put("/stats", response_model=schemas.Stats)
 async def update_stats(
     stats_data: schemas.StatsUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_staff_or_admin_user)
 ):
     """Update system statistics (staff/admin only)."""
-    stats = db.query(models.Stats).first()
+    stats = await db.scalar(select(models.Stats))
+    changes = stats_data.dict(exclude_unset=True)
+    counters = {field: value for field, value in changes.items() if field in STATS_COUNTERS and value is not None}
+    if counters:
+        await set_counters(db, counters)
     
     if not stats:
         # Create stats if not exists
         new_stats = models.Stats(
-            **stats_data.dict(exclude_unset=True),
+            **changes,
             updated_at=datetime.utcnow()
         )
         
         db.add(new_stats)
-        db.commit()
-        db.refresh(new_stats)
+        await db.commit()
+        await db.refresh(new_stats)
         
+        await get_counters(db, new_stats)
         return new_stats
     
     # Update stats fields
-    for field, value in stats_data.dict(exclude_unset=True).items():
+    for field, value in changes.items():
         setattr(stats, field, value)
     
     stats.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(stats)
+    await db.commit()
+    await db.refresh(stats)
     
+    await get_counters(db, stats)
     return stats
 
 @router.post("/stats/recalculate", response_model=schemas.Stats)
 async def recalculate_stats(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_staff_or_admin_user)
 ):
     """Recalculate system statistics based on current data (staff/admin only)."""
-    stats = db.query(models.Stats).first()
+    stats = await db.scalar(select(models.Stats))
     
     if not stats:
         stats = models.Stats()
         db.add(stats)
     
-    # Count active parcels
-    active_parcels = db.query(models.Parcel).filter(
-        models.Parcel.status.in_(["preparing", "in_transit", "delayed", "customs_check"])
-    ).count()
-    
-    # Count active routes
-    active_routes = db.query(models.Route).filter(
-        models.Route.active == True
-    ).count()
-    
-    # Count delayed parcels
-    delayed_parcels = db.query(models.Parcel).filter(
-        models.Parcel.status == "delayed"
-    ).count()
+    # One pass over parcels: count per status, and how many of each carry a delay reason
+    parcel_counts = (await db.execute(
+        select(models.Parcel.status, func.count(), func.count(models.Parcel.delay_reason))
+        .group_by(models.Parcel.status)
+    )).all()
+    by_status = {row[0]: row[1] for row in parcel_counts}
+    active_parcels = sum(by_status.get(s, 0) for s in ACTIVE_PARCEL_STATUSES)
+    delayed_parcels = by_status.get("delayed", 0)
+    delivered_parcels = by_status.get("delivered", 0)
+    delayed_delivered = sum(row[2] for row in parcel_counts if row[0] == "delivered")
     
     # Calculate on-time rate
-    delivered_parcels = db.query(models.Parcel).filter(
-        models.Parcel.status == "delivered"
-    ).count()
-    
-    delayed_delivered = db.query(models.Parcel).filter(
-        models.Parcel.status == "delivered",
-        models.Parcel.delay_reason != None
-    ).count()
-    
     on_time_rate = "100%"
     if delivered_parcels > 0:
         on_time_percentage = 100 - (delayed_delivered / delivered_parcels * 100)
         on_time_rate = f"{on_time_percentage:.1f}%"
     
-    # Calculate transport mode percentages
-    all_active_routes = db.query(models.Route).filter(
-        models.Route.active == True
-    ).all()
-    
-    road_routes = 0
-    rail_routes = 0
-    air_routes = 0
-    
-    weather_impacted = 0
-    traffic_impacted = 0
-    
-    for route in all_active_routes:
-        if route.transport_mode == "road":
-            road_routes += 1
-        elif route.transport_mode == "rail":
-            rail_routes += 1
-        elif route.transport_mode == "air":
-            air_routes += 1
-        
-        if route.weather and route.weather.get("impact", "none") != "none":
-            weather_impacted += 1
-        
-        if route.traffic and route.traffic.get("congestion", "none") != "none":
-            traffic_impacted += 1
+    # One pass over active routes: count per transport mode, with weather and
+    # traffic impact read from the JSON columns in SQL (a missing key means "none")
+    weather_impact = models.Route.weather["impact"].as_string()
+    congestion = models.Route.traffic["congestion"].as_string()
+    route_counts = (await db.execute(
+        select(
+            models.Route.transport_mode,
+            func.count(),
+            func.count(case((weather_impact != "none", 1))),
+            func.count(case((congestion != "none", 1))),
+        )
+        .where(models.Route.active == True)
+        .group_by(models.Route.transport_mode)
+    )).all()
+    by_mode = {row[0]: row[1] for row in route_counts}
+    active_routes = sum(row[1] for row in route_counts)
+    weather_impacted = sum(row[2] for row in route_counts)
+    traffic_impacted = sum(row[3] for row in route_counts)
     
     # Calculate percentages
-    total_routes = len(all_active_routes)
-    
-    road_percentage = "0%"
-    rail_percentage = "0%"
-    air_percentage = "0%"
-    weather_percentage = "0%"
-    traffic_percentage = "0%"
-    
-    if total_routes > 0:
-        road_percentage = f"{(road_routes / total_routes * 100):.1f}%"
-        rail_percentage = f"{(rail_routes / total_routes * 100):.1f}%"
-        air_percentage = f"{(air_routes / total_routes * 100):.1f}%"
-        weather_percentage = f"{(weather_impacted / total_routes * 100):.1f}%"
-        traffic_percentage = f"{(traffic_impacted / total_routes * 100):.1f}%"
-    
-    # Get mechanical issues percentage from actual issues
-    mechanical_issues = db.query(models.Issue).filter(
-        models.Issue.issue_type == "mechanical",
-        models.Issue.status == "active"
-    ).count()
-    
-    all_issues = db.query(models.Issue).filter(
-        models.Issue.status == "active"
-    ).count()
-    
-    mechanical_percentage = "0%"
-    if all_issues > 0:
-        mechanical_percentage = f"{(mechanical_issues / all_issues * 100):.1f}%"
+    road_percentage = percentage(by_mode.get("road", 0), active_routes)
+    rail_percentage = percentage(by_mode.get("rail", 0), active_routes)
+    air_percentage = percentage(by_mode.get("air", 0), active_routes)
+    weather_percentage = percentage(weather_impacted, active_routes)
+    traffic_percentage = percentage(traffic_impacted, active_routes)
+    
+    # Mechanical share of active issues
+    all_issues, mechanical_issues = (await db.execute(
+        select(func.count(), func.count(case((models.Issue.issue_type == "mechanical", 1))))
+        .where(models.Issue.status == "active")
+    )).one()
+    mechanical_percentage = percentage(mechanical_issues, all_issues)
     
     # Update stats
     stats.active_parcels = active_parcels
@@ -182,8 +163,14 @@ async def recalculate_stats(
     stats.traffic_congestion_percentage = traffic_percentage
     stats.mechanical_issues_percentage = mechanical_percentage
     stats.updated_at = datetime.utcnow()
+    await set_counters(db, {
+        "active_parcels": active_parcels,
+        "active_routes": active_routes,
+        "delayed_parcels": delayed_parcels,
+    })
     
-    db.commit()
-    db.refresh(stats)
+    await db.commit()
+    await db.refresh(stats)
     
+    await get_counters(db, stats)
     return stats
\ No newline at end of file
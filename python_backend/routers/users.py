@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 import models
 import schemas
 from database import get_db
@@ -9,6 +10,7 @@ from auth_utils import (
     get_admin_user,
     get_staff_or_admin_user
 )
+from pagination import PageParams, filter_by, paginate
 
 router = APIRouter()
 
@@ -21,21 +23,24 @@ async def get_current_user_info(
 
 @router.get("/users", response_model=List[schemas.User])
 async def get_all_users(
-    db: Session = Depends(get_db),
+    response: Response,
+    page: PageParams = Depends(),
+    role: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_staff_or_admin_user)
 ):
-    """Get all users (staff/admin only)."""
-    users = db.query(models.User).all()
-    return users
+    """Get a page of users (staff/admin only)."""
+    query = filter_by(select(models.User), models.User, role=role)
+    return await paginate(db, query, models.User, page, response)
 
 @router.get("/users/{user_id}", response_model=schemas.User)
 async def get_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_staff_or_admin_user)
 ):
     """Get a specific user by ID (staff/admin only)."""
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = await db.scalar(select(models.User).where(models.User.id == user_id))
     
     if not user:
         raise HTTPException(
@@ -49,7 +54,7 @@ async def get_user(
 async def update_user(
     user_id: int,
     user_data: schemas.UserUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
     """Update a user's information."""
@@ -60,7 +65,7 @@ async def update_user(
             detail="Not enough permissions to update other users"
         )
     
-    user = db.query(models.User).filter(models.User.id == user_id).first()
+    user = await db.scalar(select(models.User).where(models.User.id == user_id))
     
     if not user:
         raise HTTPException(
@@ -79,7 +84,7 @@ async def update_user(
     for field, value in user_data.dict(exclude_unset=True).items():
         setattr(user, field, value)
     
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     
     return user
\ No newline at end of file
@@ -0,0 +1,88 @@
+import os
+import random
+
+from sqlalchemy import delete, func, insert, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm.attributes import set_committed_value
+
+import models
+
+# --- Atomic stats counters ---
+#
+# active_parcels, active_routes and delayed_parcels are kept up to date in
+# the same transaction as the change that moves them, so a rolled back
+# change leaves no counter update behind.
+#
+# Two things keep them exact under concurrent requests (or workers):
+#
+# - transition() makes the state change itself the guard: the UPDATE only
+#   matches if the row is not already in the target state (or, leaving it,
+#   still is), so of several requests delaying the same parcel only the one
+#   whose UPDATE matched moves the counter. The database re-checks the
+#   condition after waiting for a concurrent writer of the row.
+# - adjust_stat() adds to one of STATS_COUNTER_SHARDS rows per counter,
+#   picked at random, with an upsert. Concurrent requests mostly hit
+#   different rows instead of queueing on one Stats row lock until each
+#   commits; a counter's value is the sum of its shards.
+#
+# The Stats row keeps the other figures; get_counters() overlays the summed
+# counters on it when it is read.
+
+STATS_COUNTERS = ("active_parcels", "active_routes", "delayed_parcels")
+STATS_COUNTER_SHARDS = int(os.getenv("STATS_COUNTER_SHARDS", "16"))
+
+
+async def transition(db, column, row_id, value, counted, *conditions):
+    """
+    Sets column to value on the row with id row_id if that changes whether
+    the row is in the `counted` state. Returns 1 if the row entered it, -1
+    if it left it, 0 if this request did not move it (the caller still
+    applies value as a normal update). Extra conditions narrow the match.
+    """
+    model = column.class_
+    if value == counted:
+        guard = or_(column != counted, column.is_(None))
+    else:
+        guard = column == counted
+    statement = update(model).where(model.id == row_id, guard, *conditions).values({column: value})
+    # Callers set the same value on their loaded object, so there is nothing to sync
+    result = await db.execute(statement.execution_options(synchronize_session=False))
+    if result.rowcount != 1:
+        return 0
+    return 1 if value == counted else -1
+
+
+async def adjust_stat(db, counter, amount=1):
+    """Adds amount (which may be negative) to a counter, on a randomly picked shard row."""
+    if counter not in STATS_COUNTERS:
+        raise ValueError(f"Unknown stats counter {counter}")
+    table = models.StatsCounterShard.__table__
+    upsert = postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+    statement = upsert(table).values(
+        counter=counter, shard=random.randrange(STATS_COUNTER_SHARDS), value=amount
+    ).on_conflict_do_update(
+        index_elements=[table.c.counter, table.c.shard],
+        set_={"value": table.c.value + amount},
+    )
+    await db.execute(statement)
+
+
+async def get_counters(db, stats=None):
+    """Current counter values; with a loaded Stats row, also sets them on it (without marking it changed)."""
+    shard = models.StatsCounterShard
+    rows = await db.execute(select(shard.counter, func.sum(shard.value)).group_by(shard.counter))
+    counters = dict.fromkeys(STATS_COUNTERS, 0)
+    counters.update({counter: int(total) for counter, total in rows if counter in counters})
+    if stats is not None:
+        for counter, value in counters.items():
+            set_committed_value(stats, counter, value)
+    return counters
+
+
+async def set_counters(db, values):
+    """Replaces the shards of the given counters with one row holding each new value."""
+    shard = models.StatsCounterShard
+    await db.execute(delete(shard).where(shard.counter.in_(list(values))))
+    await db.execute(insert(shard), [{"counter": counter, "shard": 0, "value": value}
+                                     for counter, value in values.items()])
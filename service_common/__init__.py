@@ -0,0 +1,3 @@
+# Modules shared by the map service (client/src/components/map) and the mail
+# routing API (python_backend). Both apps import them through their own
+# metrics.py and responses.py, which put the repository root on sys.path.
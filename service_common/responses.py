@@ -0,0 +1,220 @@
+import gzip
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+from fastapi.responses import JSONResponse
+
+from service_common.metrics import CallbackMetric, route_label
+
+try:
+    import orjson
+except ImportError:  # fall back to the standard library encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# --- Fast JSON serialization and negotiated compression ---
+#
+# Route payloads and list endpoints are large. FastJSONResponse
+# serializes them with orjson when it is installed, and
+# ResponseCompressionMiddleware gzip/brotli-compresses bodies above
+# COMPRESSION_MIN_BYTES. Both record per-endpoint timings and sizes.
+
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+# Only JSON bodies are buffered and compressed. Streaming responses are
+# flushed chunk by chunk, and static files and FileResponses are sent as is
+# with their own Content-Length.
+COMPRESSIBLE_MEDIA_TYPES = ("application/json",)
+
+_current_timing = ContextVar("response_timing", default=None)
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def json_dumps(content):
+    """Serializes content to a compact JSON string (orjson if available)."""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"))
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson; serialization time is recorded per endpoint."""
+
+    def render(self, content):
+        started = time.perf_counter()
+        if orjson is not None:
+            body = orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        else:
+            body = json.dumps(content, ensure_ascii=False, allow_nan=False,
+                              separators=(",", ":")).encode("utf-8")
+        timing = _current_timing.get()
+        if timing is not None:
+            timing["serialize_ms"] += (time.perf_counter() - started) * 1000
+        return body
+
+
+def accepted_encoding(accept_encoding):
+    """Picks 'br' or 'gzip' from an Accept-Encoding header, or None."""
+    accepted = set()
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def endpoint_name(scope):
+    """Route template (e.g. 'GET /route/optimized') once the router has matched."""
+    return f"{scope.get('method', '')} {route_label(scope)}"
+
+
+def record_response(endpoint, status, serialize_ms, compress_ms, raw_bytes, wire_bytes, encoding):
+    with _stats_lock:
+        entry = _stats.get(endpoint)
+        if entry is None:
+            entry = _stats[endpoint] = {
+                "responses": 0, "compressed": 0, "serialize_ms": 0.0, "compress_ms": 0.0,
+                "raw_bytes": 0, "wire_bytes": 0, "status": {}
+            }
+        entry["responses"] += 1
+        entry["compressed"] += 1 if encoding else 0
+        entry["serialize_ms"] += serialize_ms
+        entry["compress_ms"] += compress_ms
+        entry["raw_bytes"] += raw_bytes
+        entry["wire_bytes"] += wire_bytes
+        entry["status"][status] = entry["status"].get(status, 0) + 1
+
+
+def get_response_stats():
+    """Per-endpoint totals and averages of serialization time and response sizes."""
+    with _stats_lock:
+        snapshot = {endpoint: dict(entry, status=dict(entry["status"])) for endpoint, entry in _stats.items()}
+    for entry in snapshot.values():
+        n = entry["responses"]
+        entry["avg_serialize_ms"] = round(entry["serialize_ms"] / n, 3)
+        entry["avg_wire_bytes"] = round(entry["wire_bytes"] / n)
+        entry["compression_ratio"] = round(entry["wire_bytes"] / entry["raw_bytes"], 3) if entry["raw_bytes"] else None
+        entry["serialize_ms"] = round(entry["serialize_ms"], 3)
+        entry["compress_ms"] = round(entry["compress_ms"], 3)
+    return snapshot
+
+
+def _response_samples(field, scale=1):
+    with _stats_lock:
+        return [(tuple(endpoint.split(" ", 1)), entry[field] * scale) for endpoint, entry in _stats.items()]
+
+
+CallbackMetric("http_response_serialize_seconds_total", "Time spent serializing JSON responses.", "counter",
+               ("method", "route"), lambda: _response_samples("serialize_ms", 0.001))
+CallbackMetric("http_response_compress_seconds_total", "Time spent compressing responses.", "counter",
+               ("method", "route"), lambda: _response_samples("compress_ms", 0.001))
+CallbackMetric("http_response_raw_bytes_total", "Response body bytes before compression.", "counter",
+               ("method", "route"), lambda: _response_samples("raw_bytes"))
+CallbackMetric("http_response_wire_bytes_total", "Response body bytes sent on the wire.", "counter",
+               ("method", "route"), lambda: _response_samples("wire_bytes"))
+
+
+class ResponseCompressionMiddleware:
+    """
+    Pure ASGI middleware that compresses complete responses larger than
+    `minimum_size` with the best encoding the client accepts, adds a
+    Server-Timing header and records per-endpoint stats. Only JSON
+    responses are touched; streaming, static file, already-encoded and HEAD
+    responses are passed through unchanged.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        wanted = accepted_encoding(headers.get("accept-encoding", ""))
+        timing = {"serialize_ms": 0.0}
+        token = _current_timing.set(timing)
+        state = {"start": None, "passthrough": False, "body": [], "status": 0, "raw": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                state["status"] = message["status"]
+                response_headers = {k.decode("latin-1").lower(): v.decode("latin-1")
+                                    for k, v in message.get("headers", [])}
+                media_type = response_headers.get("content-type", "")
+                if not media_type.startswith(COMPRESSIBLE_MEDIA_TYPES) or "content-encoding" in response_headers:
+                    state["passthrough"] = True
+                    await send(message)
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            chunk = message.get("body", b"")
+            state["raw"] += len(chunk)
+            if state["passthrough"]:
+                await send(message)
+                return
+            state["body"].append(chunk)
+            if message.get("more_body", False):
+                return
+
+            body = b"".join(state["body"])
+            encoding = wanted if len(body) >= self.minimum_size else None
+            compress_ms = 0.0
+            if encoding:
+                started = time.perf_counter()
+                body = compress(body, encoding)
+                compress_ms = (time.perf_counter() - started) * 1000
+            timing["compress_ms"] = compress_ms
+            timing["encoding"] = encoding
+
+            start = state["start"]
+            raw_headers = [(k, v) for k, v in start.get("headers", []) if k.lower() != b"content-length"]
+            raw_headers.append((b"content-length", str(len(body)).encode("latin-1")))
+            if encoding:
+                raw_headers.append((b"content-encoding", encoding.encode("latin-1")))
+                raw_headers.append((b"vary", b"Accept-Encoding"))
+            server_timing = f"serialize;dur={timing['serialize_ms']:.2f}, compress;dur={compress_ms:.2f}"
+            raw_headers.append((b"server-timing", server_timing.encode("latin-1")))
+            await send(dict(start, headers=raw_headers))
+            await send({"type": "http.response.body", "body": body})
+            state["wire"] = len(body)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_timing.reset(token)
+            record_response(endpoint_name(scope), state["status"], timing["serialize_ms"],
+                            timing.get("compress_ms", 0.0), state["raw"], state.get("wire", state["raw"]),
+                            timing.get("encoding"))